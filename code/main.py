@@ -134,14 +134,16 @@ def main(args):
         print('******* SoL validation *******')
         for msm_id in msm_ids:
             result = ripe_traceroute_utils.ripe_process_traceroutes(start_time, end_time, msm_id, ip_version, True,
-                                                                    suffix=suffix, update_probe_info=False)
+                                                                    suffix=suffix, update_probe_info=False,
+                                                                    workers=args.workers)
             print(f'Result length for {msm_id} is {len(result)}')
 
     print('******* Nautilus Mapping *******')
     mode = 1
 
     print("Generate an initial mapping for each category")
-    common_utils.generate_cable_mapping(mode=mode, ip_version=ip_version, sol_threshold=0.05, suffix=suffix)
+    common_utils.generate_cable_mapping(mode=mode, ip_version=ip_version, sol_threshold=0.05, suffix=suffix,
+                                        workers=args.workers)
     print("Merge mapping results of multiple experiments for each category")
     merge_data.common_merge_operation(root_dir / f'stats/mapping_outputs_{suffix}', 1, [], ['v4'], True, None)
     print("Merging the results for all categories")
@@ -158,6 +160,10 @@ if __name__ == '__main__':
     parser.add_argument('--no_ipgeo', action='store_true', help='Skip geolocation processes')
     parser.add_argument('--no_ip2as', action='store_true', help='Skip IP to AS mapping processes')
     parser.add_argument('--no_sol', action='store_true', help='Skip SoL validation')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of (forked) processes used for the SoL validation, where each process downloads '
+                             'and validates its own range of RIPE Atlas hours, and to generate the cable mapping '
+                             '(default 1, everything runs in a single process)')
 
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,26 @@
+import argparse
+
+from utils import common_utils
+
+
+def parse_weight_tuple(value):
+    weight_tuple = tuple(float(item) for item in value.split(','))
+    if len(weight_tuple) != 3:
+        raise argparse.ArgumentTypeError('Weights should be given as geolocation,distance,as_owner (eg., 0.5,0.4,0.1)')
+    return weight_tuple
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Evaluate a grid of weights and thresholds for the final mapping without regenerating the cable mapping.')
+    parser.add_argument('--weights', type=parse_weight_tuple, nargs='+', default=[(0.5, 0.4, 0.1)],
+                        help='Weight tuples as geolocation,distance,as_owner (eg., 0.5,0.4,0.1 0.6,0.3,0.1)')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.05], help='Selection thresholds')
+    parser.add_argument('--mode', type=int, default=1, choices=[0, 1, 2],
+                        help='0 - Only geolocation, 1 - SoL validated geolocation, 2 - Both')
+    parser.add_argument('--ip_version', type=int, default=4, help='IP version of the mapping')
+    parser.add_argument('--suffix', default='default', help='Suffix of the mapping outputs directory')
+
+    args = parser.parse_args()
+    common_utils.sweep_final_mapping(args.weights, args.thresholds, mode=args.mode, ip_version=args.ip_version,
+                                     suffix=args.suffix)
@@ -15,96 +15,18 @@ import numpy as np
 root_dir = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(root_dir))
 from code.utils.as_utils import get_ip_to_asn_for_all_ips, generate_as_mapping_based_on_caida_asrank_data
+from code.submarine.telegeography_submarine import load_submarine_catalog, SubmarineUnpickler
 
 Location = namedtuple('Location', ['city', 'subdivisions', 'country', 'accuracy_radius', 'latitude', 'longitude',
                                    'autonomous_system_number', 'network', 'ISP', 'Org'])
 MaxmindLocation = namedtuple('MaxmindLocation',
                              ['city', 'subdivisions', 'country', 'accuracy_radius', 'latitude', 'longitude',
                               'autonomous_system_number', 'network'])
-LandingPoints = namedtuple('LandingPoints', ['latitude', 'longitude', 'country', 'location', 'cable'])
-Cable = namedtuple('Cable', ['name', 'landing_points', 'length', 'owners', 'notes', 'rfs', 'other_info'])
 
 root_dir = Path(__file__).resolve().parents[1]
 file_dir = root_dir / 'stats'
 
 
-# Custom Unpickler with updated class definitions
-class CustomUnpickler(pickle.Unpickler):
-    def find_class(self, module, name):
-        if name == 'Cable':
-            return Cable
-        if name == 'LandingPoints':
-            return LandingPoints
-        return super().find_class(module, name)
-
-
-# Define the functions to load each pickle file
-
-def load_cable_info_dict(file_path):
-    """
-    Load the cable_info_dict from the pickle file.
-
-    Data Structure:
-    {
-        cable_id: Cable(name, landing_points, length, owners, notes, rfs, other_info)
-    }
-    """
-    with open(file_path, 'rb') as file:
-        return CustomUnpickler(file).load()
-
-
-def load_cable_to_connected_location_ids(file_path):
-    """
-    Load the cable_to_connected_location_ids from the pickle file.
-
-    Data Structure:
-    {
-        cable_name: [[location_id, location_id, ...], ...]
-    }
-    """
-    with open(file_path, 'rb') as file:
-        return CustomUnpickler(file).load()
-
-
-def load_country_dict(file_path):
-    """
-    Load the country_dict from the pickle file.
-
-    Data Structure:
-    {
-        country_name: [cable_id, cable_id, ...]
-    }
-    """
-    with open(file_path, 'rb') as file:
-        return CustomUnpickler(file).load()
-
-
-def load_landing_points_dict(file_path):
-    """
-    Load the landing_points_dict from the pickle file.
-
-    Data Structure:
-    {
-        landing_point_id: LandingPoints(latitude, longitude, country, location, cable)
-    }
-    """
-    with open(file_path, 'rb') as file:
-        return CustomUnpickler(file).load()
-
-
-def load_owners_dict(file_path):
-    """
-    Load the owners_dict from the pickle file.
-
-    Data Structure:
-    {
-        owner_name: [cable_id, cable_id, ...]
-    }
-    """
-    with open(file_path, 'rb') as file:
-        return CustomUnpickler(file).load()
-
-
 def load_link_cable_mapping(file_path):
     """
     Load the link to cable mapping from the pickle file.
@@ -115,7 +37,7 @@ def load_link_cable_mapping(file_path):
     }
     """
     with open(file_path, 'rb') as file:
-        return CustomUnpickler(file).load()
+        return SubmarineUnpickler(file).load()
 
 
 def save_ips_from_link_cable_mapping(link_cable_mapping, file_path):
@@ -143,12 +65,13 @@ class CableInfo:
         self.load_submarine_info()
 
     def load_submarine_info(self):
-        self.cable_info_dict = load_cable_info_dict(file_dir / 'submarine_data' / 'cable_info_dict')
-        self.cable_to_connected_location_ids = load_cable_to_connected_location_ids(
-            file_dir / 'submarine_data' / 'cable_to_connected_location_ids')
-        self.country_dict = load_country_dict(file_dir / 'submarine_data' / 'country_dict')
-        self.landing_points_dict = load_landing_points_dict(file_dir / 'submarine_data' / 'landing_points_dict')
-        self.owners_dict = load_owners_dict(file_dir / 'submarine_data' / 'owners_dict')
+        # Every CableInfo shares the same loaded-once catalog instead of unpickling the files again
+        catalog = load_submarine_catalog(file_dir / 'submarine_data')
+        self.cable_info_dict = catalog.cable_info_dict
+        self.cable_to_connected_location_ids = catalog.cable_to_connected_location_ids
+        self.country_dict = catalog.country_dict
+        self.landing_points_dict = catalog.landing_points_dict
+        self.owners_dict = catalog.owners_dict
 
     def count_cable_coverage_and_mean_score(self, link_to_cable_mapping, top_n=1, cables_all=None):
         top_cables = {}
@@ -173,11 +96,8 @@ class CableInfo:
         return coverage, mean_score_all
 
     def get_cable_name_to_cable_id(self):
-        cable_name_to_cable_id = {}
-        for cable_id, cable_info in self.cable_info_dict.items():
-            cable_name_to_cable_id[cable_info.name] = cable_id
-        self.cable_name_to_cable_id = cable_name_to_cable_id
-        return cable_name_to_cable_id
+        self.cable_name_to_cable_id = load_submarine_catalog(file_dir / 'submarine_data').cable_name_to_cable_id
+        return self.cable_name_to_cable_id
 
     def find_std_cable_name(self, cable_name, threshold=60):
         std_cable_names = self.cable_name_to_cable_id.keys()
@@ -8,6 +8,7 @@ import pickle
 from collections import namedtuple
 
 from sklearn.neighbors import BallTree
+import numpy as np
 import math
 
 root_dir = Path(__file__).resolve().parents[2]
@@ -183,9 +184,118 @@ def process_all_files(cables):
     with open(save_directory / 'landing_points_dict', 'wb') as fp:
         pickle.dump(landing_points_dict, fp)
 
+    # Any catalog loaded earlier is now stale
+    _submarine_catalogs.pop(save_directory.resolve(), None)
+
     return (cable_info_dict, country_dict, owners_dict, landing_points_dict)
 
 
+class SubmarineUnpickler(pickle.Unpickler):
+    """
+    The submarine data files were pickled from scripts executed as __main__, so the Cable and LandingPoints
+    namedtuples are resolved back to the definitions in this module irrespective of the caller
+    """
+
+    def find_class(self, module, name):
+        if name == 'Cable':
+            return Cable
+        if name == 'LandingPoints':
+            return LandingPoints
+        return super().find_class(module, name)
+
+
+def load_submarine_file(file_path):
+    with open(file_path, 'rb') as fp:
+        return SubmarineUnpickler(fp).load()
+
+
+class SubmarineCatalog:
+    """
+    In-memory view of the submarine data generated by process_all_files. All the dictionaries are loaded once
+    and shared by every module (through load_submarine_catalog), so that id and name lookups do not re-open
+    and unpickle the files on every call.
+    Attributes
+        cable_info_dict -> cable id to Cable NamedTuple
+        landing_points_dict -> landing point id to LandingPoints NamedTuple
+        owners_dict -> owner to list of cable ids
+        country_dict -> country to list of cable ids
+        cable_to_connected_location_ids -> cable name to the list of connected landing point id groups (None if the
+            file was not generated, consumers needing it have to check)
+        cable_name_to_cable_id -> cable name to cable id
+    """
+
+    def __init__(self, directory=save_directory):
+        self.directory = Path(directory)
+
+        self.cable_info_dict = load_submarine_file(self.directory / 'cable_info_dict')
+        self.landing_points_dict = load_submarine_file(self.directory / 'landing_points_dict')
+        self.owners_dict = load_submarine_file(self.directory / 'owners_dict')
+        self.country_dict = load_submarine_file(self.directory / 'country_dict')
+
+        cable_to_lp_ids_file = self.directory / 'cable_to_connected_location_ids'
+        if cable_to_lp_ids_file.exists():
+            self.cable_to_connected_location_ids = load_submarine_file(cable_to_lp_ids_file)
+        else:
+            self.cable_to_connected_location_ids = None
+
+        self.cable_name_to_cable_id = {cable.name: cable_id for cable_id, cable in self.cable_info_dict.items()}
+
+        self._ball_tree = None
+        self._future_cables = {}
+
+    def get_cable(self, cable_id):
+        return self.cable_info_dict.get(cable_id, None)
+
+    def get_cable_by_name(self, cable_name):
+        return self.cable_info_dict.get(self.cable_name_to_cable_id.get(cable_name, None), None)
+
+    def get_landing_point(self, landing_point_id):
+        return self.landing_points_dict.get(landing_point_id, None)
+
+    def get_future_cables(self, rfs_year=2022):
+        """
+        Cable ids which are not yet in service (ready for service on or after rfs_year)
+        """
+        if rfs_year not in self._future_cables:
+            self._future_cables[rfs_year] = [cable for cable, values in self.cable_info_dict.items() if
+                                             values.rfs >= rfs_year]
+        return self._future_cables[rfs_year]
+
+    def get_ball_tree(self):
+        """
+        Builds (only once) the haversine BallTree over the unique landing point coordinates
+        Output
+            (landing_points_dict, latlon_dict, latlons, tree) as returned by get_all_latlon_locations_ball_tree
+        """
+        if self._ball_tree is None:
+            latlon_dict = {}
+            for key, value in self.landing_points_dict.items():
+                latlon_dict[(value.latitude, value.longitude)] = key
+
+            latlons = list(latlon_dict.keys())
+
+            latlons_in_radians = list(map(convert_degrees_to_randians, latlons))
+
+            tree = BallTree(latlons_in_radians, metric="haversine", leaf_size=2)
+
+            self._ball_tree = (self.landing_points_dict, latlon_dict, latlons, tree)
+
+        return self._ball_tree
+
+
+_submarine_catalogs = {}
+
+
+def load_submarine_catalog(directory=save_directory):
+    """
+    Returns the shared SubmarineCatalog for the given directory, loading it on the first call
+    """
+    directory = Path(directory).resolve()
+    if directory not in _submarine_catalogs:
+        _submarine_catalogs[directory] = SubmarineCatalog(directory)
+    return _submarine_catalogs[directory]
+
+
 def get_cables_by_country(country):
     """
     These are queries to get list of all cable id's within a country.
@@ -196,8 +306,7 @@ def get_cables_by_country(country):
     TODO : Integrate language module to match partial names for countries
     """
 
-    with open(save_directory / 'country_dict', 'rb') as fp:
-        country_dict = pickle.load(fp)
+    country_dict = load_submarine_catalog().country_dict
 
     country_list = list(country_dict.keys())
 
@@ -222,8 +331,7 @@ def get_cables_by_owner(owner):
     TODO : Integrate language module to match partial names for owners
     """
 
-    with open(save_directory / 'owners_dict', 'rb') as fp:
-        owners_dict = pickle.load(fp)
+    owners_dict = load_submarine_catalog().owners_dict
 
     owners_list = list(owners_dict.keys())
 
@@ -239,8 +347,7 @@ def get_cables_by_owner(owner):
 
 
 def get_all_owners():
-    with open(save_directory / 'owners_dict', 'rb') as fp:
-        owners_dict = pickle.load(fp)
+    owners_dict = load_submarine_catalog().owners_dict
 
     owners_list = list(owners_dict.keys())
 
@@ -264,11 +371,7 @@ def get_cable_by_cable_id(cable_id):
         information about the cable as stored in the Cable NamedTuple format
     """
 
-    with open(save_directory / 'cable_info_dict', 'rb') as fp:
-        cable_info_dict = pickle.load(fp)
-
-    if cable_id in cable_info_dict.keys():
-        return cable_info_dict[cable_id]
+    return load_submarine_catalog().get_cable(cable_id)
 
 
 def get_landing_points_by_id(landing_points_id):
@@ -280,28 +383,73 @@ def get_landing_points_by_id(landing_points_id):
         information about the landing point as stored in the LandingPoint NamedTuple format
     """
 
-    with open(save_directory / 'landing_points_dict', 'rb') as fp:
-        landing_points_dict = pickle.load(fp)
-
-    if landing_points_id in landing_points_dict.keys():
-        return landing_points_dict[landing_points_id]
-
+    return load_submarine_catalog().get_landing_point(landing_points_id)
 
-def get_all_latlon_locations_ball_tree():
-    with open(save_directory / 'landing_points_dict', 'rb') as fp:
-        landing_points_dict = pickle.load(fp)
-
-    latlon_dict = {}
-    for key, value in landing_points_dict.items():
-        latlon_dict[(value.latitude, value.longitude)] = key
 
-    latlons = list(latlon_dict.keys())
+class LandingPointPairIndex:
+    """
+    Sparse index from a pair of BallTree positions (ie., a pair of landing points as returned by the tree queries)
+    to the in-service cables shared by both landing points. It is built once from the landing points and the cables,
+    so candidate pairs resolve to cables with a single lookup instead of intersecting the cable lists every time.
+    Attributes
+        landing_points -> LandingPoints NamedTuple for every BallTree position
+        landing_point_ids -> Landing point id for every BallTree position
+        pair_to_cables -> (position_1, position_2) to the tuple of shared in-service cable ids (only non-empty pairs)
+        shared -> Boolean matrix over BallTree positions, True when the pair shares at least one in-service cable
+    """
 
-    latlons_in_radians = list(map(convert_degrees_to_randians, latlons))
+    def __init__(self, landing_points_dict, latlon_dict, latlons, future_cables):
+        future_cables = set(future_cables)
+
+        self.landing_point_ids = [latlon_dict[latlon] for latlon in latlons]
+        self.landing_points = [landing_points_dict[landing_point_id] for landing_point_id in self.landing_point_ids]
+
+        cable_to_positions = {}
+        for position, landing_point in enumerate(self.landing_points):
+            for cable in landing_point.cable:
+                if cable not in future_cables:
+                    cable_to_positions.setdefault(cable, []).append(position)
+
+        self.pair_to_cables = {}
+        for positions in cable_to_positions.values():
+            for position_1 in positions:
+                for position_2 in positions:
+                    if position_1 != position_2 and (position_1, position_2) not in self.pair_to_cables:
+                        # Same intersection (and ordering) as the one done per pair in the cable matching loop
+                        cables = find_intersecting_cables(self.landing_points[position_1].cable,
+                                                          self.landing_points[position_2].cable)
+                        self.pair_to_cables[(position_1, position_2)] = tuple(
+                            [cable for cable in cables if cable not in future_cables])
+
+        self.shared = np.zeros((len(latlons), len(latlons)), dtype=bool)
+        if len(self.pair_to_cables) > 0:
+            self.shared[tuple(np.array(list(self.pair_to_cables.keys())).T)] = True
+
+    def get_cables(self, position_1, position_2):
+        return self.pair_to_cables.get((position_1, position_2), ())
+
+    def get_cables_for_candidate_pairs(self, positions_1, positions_2):
+        """
+        Intersects the two candidate sets against the index in bulk
+        Input
+            positions_1, positions_2 -> BallTree positions around each end of the link
+        Output
+            rows, cols -> indices into positions_1 and positions_2 for pairs sharing a cable, in the same order as
+                          itertools.product(positions_1, positions_2)
+            cables -> list of the shared in-service cable ids for each of those pairs
+        """
+        positions_1 = np.asarray(positions_1, dtype=np.intp)
+        positions_2 = np.asarray(positions_2, dtype=np.intp)
+
+        rows, cols = np.nonzero(self.shared[np.ix_(positions_1, positions_2)])
+        cables = [self.pair_to_cables[(position_1, position_2)] for position_1, position_2 in
+                  zip(positions_1[rows].tolist(), positions_2[cols].tolist())]
+
+        return rows, cols, cables
 
-    tree = BallTree(latlons_in_radians, metric="haversine", leaf_size=2)
 
-    return (landing_points_dict, latlon_dict, latlons, tree)
+def get_all_latlon_locations_ball_tree():
+    return load_submarine_catalog().get_ball_tree()
 
 
 def convert_degrees_to_randians(item):
@@ -8,19 +8,15 @@ from collections import namedtuple
 
 import subprocess, json, time, pickle
 
-from ipaddress import ip_network, ip_address
-
 import warnings
 warnings.filterwarnings("ignore")
 
 TraceRoute = namedtuple('TraceRoute', ['hops', 'other_info'])
 Hops = namedtuple('Hops', ['hop', 'ip_address', 'rtt'])
 
-private_ranges = [ip_network("192.168.0.0/16"), ip_network("10.0.0.0/8"), ip_network("172.16.0.0/12")]
-private_ranges_v6 = [ip_network("fc00::/7"), ip_network("fc00::/8"), ip_network("fd00::/8")]
-
+from ip_utils import check_if_ip_is_private
 from caida_probe_location_info import load_probe_to_coordinate_map
-from geolocation_latency_based_validation_common_utils import load_all_geolocation_info, extract_latlon_and_perform_sol_test, fill_locations_dict_scores
+from geolocation_latency_based_validation_common_utils import load_geolocation_store, perform_sol_test_batch, fill_locations_dict_scores_batch
 
 # Once location scripts are done, load directly from those
 Location = namedtuple('Location', ['city', 'subdivisions', 'country', 'accuracy_radius', 'latitude', 'longitude', 'autonomous_system_number', 'network', 'ISP', 'Org'])
@@ -100,25 +96,6 @@ def download_warts_file (year, month, cycle_id, download_count=1000, ip_version=
 			break
 
 
-def check_if_ip_is_private (ip, v4=True):
-
-	"""
-	A simple check if a given IP is in the private IP range or not
-	Returns True if in private IP range, else returns False
-	"""
-
-	if v4:
-		if ip_address(ip) in private_ranges[0] or ip_address(ip) in private_ranges[1] or ip_address(ip) in private_ranges[2]:
-			return True
-		else:
-			return False
-	else:
-		if ip_address(ip) in private_ranges_v6[0] or ip_address(ip) in private_ranges_v6[1] or ip_address(ip) in private_ranges_v6[2]:
-			return True 
-		else:
-			return False
-
-
 def get_caida_hops (traceroute, ip_version):
 	
 	"""
@@ -244,9 +221,7 @@ def process_warts_file (warts_file):
 	return complete_traceroute_file_output
 
 
-def geolocation_sol_validation_caida (file_traceroute, initial_lat_lon,
-										iplocation_output, maxmind_output,
-										ripe_output, caida_output,
+def geolocation_sol_validation_caida (file_traceroute, initial_lat_lon, geolocation_store,
 										ip_location_with_penalty_and_total_count, ip_version=4):
 
 	if ip_version == 4:
@@ -254,45 +229,36 @@ def geolocation_sol_validation_caida (file_traceroute, initial_lat_lon,
 	else:
 		v4 = False
 
+	try:
+		probe_latitude, probe_longitude = float(initial_lat_lon[0]), float(initial_lat_lon[1])
+	except (IndexError, TypeError, ValueError):
+		return
+
+	# As the same IP could be repeated a lot, let's check it and look it up only once
+	ip_to_id = {}
+	ip_ids, rtts = [], []
+
 	for count, traceroute in enumerate(file_traceroute):
 		for contents in traceroute.hops:
 			ip = contents.ip_address
 			rtt = contents.rtt
 
-			if ip and not check_if_ip_is_private(ip, v4) and rtt:
-
-				locations = iplocation_output.get(ip, None)
-				maxmind_location = maxmind_output.get(ip, None)
-				ripe_location = ripe_output.get(ip, None)
-				caida_location = caida_output.get(ip, None)
-
-				prev_examined_location = ip_location_with_penalty_and_total_count.get(ip, None)
-
-				if locations:
-					for ind, location in enumerate(locations):
-
-						status, (latitude, longitude) = extract_latlon_and_perform_sol_test(location, initial_lat_lon, rtt, ind)
-						fill_locations_dict_scores(prev_examined_location, status,
-													latitude, longitude,
-													ip, ind, ip_location_with_penalty_and_total_count)
+			if ip and rtt:
+				ip_id = ip_to_id.get(ip, None)
+				if ip_id is None:
+					ip_id = -1 if check_if_ip_is_private(ip, v4) else geolocation_store.ip_to_id.get(ip, -1)
+					ip_to_id[ip] = ip_id
 
-				if maxmind_location:
-					status, (latitude, longitude) = extract_latlon_and_perform_sol_test(maxmind_location, initial_lat_lon, rtt, 8)
-					fill_locations_dict_scores(prev_examined_location, status,
-												latitude, longitude,
-												ip, 8, ip_location_with_penalty_and_total_count)
+				if ip_id >= 0:
+					ip_ids.append(ip_id)
+					rtts.append(rtt)
 
-				if ripe_location:
-					status, (latitude, longitude) = extract_latlon_and_perform_sol_test(ripe_location, initial_lat_lon, rtt, 9)
-					fill_locations_dict_scores(prev_examined_location, status,
-												latitude, longitude,
-												ip, 9, ip_location_with_penalty_and_total_count)
+	# All the hops of the file are tested together, against the (already parsed) locations from all the sources
+	ip_ids, penalty_counts, total_counts = perform_sol_test_batch(geolocation_store, [probe_latitude] * len(ip_ids),
+																  [probe_longitude] * len(ip_ids), ip_ids, rtts)
 
-				if caida_location:
-					status, (latitude, longitude) = extract_latlon_and_perform_sol_test(caida_location, initial_lat_lon, rtt, 10)
-					fill_locations_dict_scores(prev_examined_location, status,
-												latitude, longitude,
-												ip, 10, ip_location_with_penalty_and_total_count)
+	fill_locations_dict_scores_batch(geolocation_store, ip_ids, penalty_counts, total_counts,
+									 ip_location_with_penalty_and_total_count)
 
 
 
@@ -328,7 +294,7 @@ def caida_process_traceroutes (year, month, cycle_id, ip_version=4, download_cou
 
 		print ('Loading all geolocation sources')
 
-		maxmind_output, ripe_output, caida_output, iplocation_output = load_all_geolocation_info(ip_version, tags=suffix)
+		geolocation_store = load_geolocation_store(ip_version, tags=suffix)
 
 		print ('Successfully loaded all geolocation results')
 
@@ -364,9 +330,7 @@ def caida_process_traceroutes (year, month, cycle_id, ip_version=4, download_cou
 					print ('Proceeding anyway with the 1st output')
 					initial_lat_lon = probe_to_coordinate_map[matched_location[0]]
 				
-				geolocation_sol_validation_caida(file_traceroute, initial_lat_lon,
-												iplocation_output, maxmind_output,
-												ripe_output, caida_output,
+				geolocation_sol_validation_caida(file_traceroute, initial_lat_lon, geolocation_store,
 												ip_location_with_penalty_and_total_count, ip_version)
 
 				print (f'Our current ip_location_with_penalty_and_total_count length is {len(ip_location_with_penalty_and_total_count)}')
@@ -1,8 +1,9 @@
-import pickle, json
+import pickle, json, hashlib, itertools
 from collections import namedtuple
 from pathlib import Path
 
-from haversine import haversine, Unit
+import numpy as np
+from haversine import haversine, haversine_vector, Unit
 
 root_dir = Path(__file__).resolve().parents[2]
 
@@ -49,7 +50,10 @@ def load_all_geolocation_info(ip_version=4, tags='default'):
     return (maxmind_output, ripe_output, caida_output, iplocation_output)
 
 
-def extract_latlon_and_perform_sol_test(location, initial_lat_lon, rtt, index=0):
+def get_latitude_longitude_for_source(location, index=0):
+    """
+    Parses the (latitude, longitude) of a location result as given by the source at index, None if it is not usable
+    """
     # index is used to determine the source of geolocation
     try:
         if index <= 7:
@@ -62,8 +66,8 @@ def extract_latlon_and_perform_sol_test(location, initial_lat_lon, rtt, index=0)
             longitude = float(location.longitude.decode())
         elif index == 8:
             # This is for the maxmind source
-            latitude = location.latitude
-            longitude = location.longitude
+            latitude = float(location.latitude)
+            longitude = float(location.longitude)
         elif index == 9:
             # This is for the RIPE source
             latitude = float(location[2])
@@ -73,6 +77,14 @@ def extract_latlon_and_perform_sol_test(location, initial_lat_lon, rtt, index=0)
             latitude = float(location[3])
             longitude = float(location[4])
 
+        return (latitude, longitude)
+
+    except:
+        return None
+
+
+def perform_sol_test(initial_lat_lon, latitude, longitude, rtt):
+    try:
         # Performing SoL test
         distance = haversine(initial_lat_lon, (latitude, longitude))
         min_latency = distance * 1000 / 200000
@@ -88,6 +100,159 @@ def extract_latlon_and_perform_sol_test(location, initial_lat_lon, rtt, index=0)
         return (False, (None, None))
 
 
+def extract_latlon_and_perform_sol_test(location, initial_lat_lon, rtt, index=0):
+    latitude_longitude = get_latitude_longitude_for_source(location, index)
+
+    if latitude_longitude is None:
+        return (False, (None, None))
+
+    return perform_sol_test(initial_lat_lon, latitude_longitude[0], latitude_longitude[1], rtt)
+
+
+class GeolocationStore:
+    """
+    Columnar view of all the geolocation sources. For each IP (by id) and each of the 11 sources (same indices as the
+    SoL testing: 0-7 IPlocation, 8 Maxmind, 9 RIPE, 10 CAIDA), the already parsed latitude and longitude.
+    The arrays are saved as .npy files and memory mapped when loaded, so that processes share them without copying.
+    Attributes
+        ips -> List of IPs, the id of an IP is its position
+        latitudes, longitudes -> (IPs, 11) float64 arrays
+        present -> (IPs, 11) mask of the sources that have a result for the IP
+        valid -> (IPs, 11) mask of the results whose coordinates could be parsed
+    """
+
+    number_of_sources = 11
+
+    def __init__(self, ips, latitudes, longitudes, present, valid):
+        self.ips = ips
+        self.ip_to_id = {ip: ip_id for ip_id, ip in enumerate(ips)}
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.present = present
+        self.valid = valid
+
+    @classmethod
+    def from_sources(cls, maxmind_output, ripe_output, caida_output, iplocation_output):
+        ips = list(dict.fromkeys(itertools.chain(iplocation_output, maxmind_output, ripe_output, caida_output)))
+
+        latitudes = np.zeros((len(ips), cls.number_of_sources), dtype=np.float64)
+        longitudes = np.zeros((len(ips), cls.number_of_sources), dtype=np.float64)
+        present = np.zeros((len(ips), cls.number_of_sources), dtype=bool)
+        valid = np.zeros((len(ips), cls.number_of_sources), dtype=bool)
+
+        for ip_id, ip in enumerate(ips):
+            results = []
+
+            # We have multiple locations for ipgeolocation module
+            locations = iplocation_output.get(ip, None)
+            if locations:
+                results.extend(enumerate(locations[:8]))
+
+            for index, output in [(8, maxmind_output), (9, ripe_output), (10, caida_output)]:
+                location = output.get(ip, None)
+                if location:
+                    results.append((index, location))
+
+            for index, location in results:
+                present[ip_id, index] = True
+                latitude_longitude = get_latitude_longitude_for_source(location, index)
+                if latitude_longitude is not None:
+                    valid[ip_id, index] = True
+                    latitudes[ip_id, index], longitudes[ip_id, index] = latitude_longitude
+
+        return cls(ips, latitudes, longitudes, present, valid)
+
+    @classmethod
+    def load(cls, directory):
+        directory = Path(directory)
+        with open(directory / 'ips', 'rb') as fp:
+            ips = pickle.load(fp)
+
+        return cls(ips, *[np.load(directory / f'{name}.npy', mmap_mode='r') for name in
+                          ['latitudes', 'longitudes', 'present', 'valid']])
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        with open(directory / 'ips', 'wb') as fp:
+            pickle.dump(self.ips, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+        for name in ['latitudes', 'longitudes', 'present', 'valid']:
+            np.save(directory / f'{name}.npy', getattr(self, name))
+
+    def get_ip_ids(self, ips):
+        """
+        Ids of the given IPs, -1 for the IPs without any geolocation result
+        """
+        return np.array([self.ip_to_id.get(ip, -1) for ip in ips], dtype=np.int64)
+
+    def get_locations(self, ip):
+        """
+        [(source index, latitude, longitude)] for the valid results of the IP, in the order of the sources
+        """
+        ip_id = self.ip_to_id.get(ip, None)
+        if ip_id is None:
+            return []
+
+        return [(index, latitude, longitude) for index, (valid, latitude, longitude) in
+                enumerate(zip(self.valid[ip_id].tolist(), self.latitudes[ip_id].tolist(),
+                              self.longitudes[ip_id].tolist())) if valid]
+
+
+def get_geolocation_source_files(ip_version=4, tags='default'):
+    directory = root_dir / 'stats/location_data'
+
+    source_files = [directory / 'maxmind_location_output_v{}_{}'.format(ip_version, tags),
+                    directory / 'ripe_location_output_v{}_{}'.format(ip_version, tags)]
+    if ip_version == 4:
+        source_files.append(directory / 'caida_location_output_{}'.format(tags))
+    source_files.append(directory / 'iplocation_location_output_v{}_{}'.format(ip_version, tags))
+
+    return source_files
+
+
+def load_geolocation_store(ip_version=4, tags='default'):
+    """
+    Loads the GeolocationStore, which is (re)built from the source files when they have changed since it was saved
+    """
+    store_directory = root_dir / 'stats/location_data/geolocation_store_v{}_{}'.format(ip_version, tags)
+
+    source_files = get_geolocation_source_files(ip_version, tags)
+
+    if all(Path(file).exists() for file in source_files):
+        fingerprint = hashlib.sha256()
+        for file in source_files:
+            file_stat = Path(file).stat()
+            fingerprint.update(f'{Path(file).name}:{file_stat.st_size}:{file_stat.st_mtime_ns};'.encode())
+        fingerprint = fingerprint.hexdigest()
+    else:
+        fingerprint = None
+
+    fingerprint_file = store_directory / 'fingerprint'
+    if fingerprint_file.exists():
+        with open(fingerprint_file, 'r') as fp:
+            saved_fingerprint = fp.read().strip()
+
+        # Without the sources, we use whatever was saved earlier
+        if fingerprint is None or fingerprint == saved_fingerprint:
+            print('Directly loading the saved geolocation store')
+            return GeolocationStore.load(store_directory)
+
+    maxmind_output, ripe_output, caida_output, iplocation_output = load_all_geolocation_info(ip_version, tags=tags)
+
+    geolocation_store = GeolocationStore.from_sources(maxmind_output, ripe_output, caida_output, iplocation_output)
+
+    geolocation_store.save(store_directory)
+    with open(fingerprint_file, 'w') as fp:
+        fp.write(fingerprint)
+
+    print(f'Saved the geolocation store for {len(geolocation_store.ips)} IPs')
+
+    # The saved (memory mapped) arrays are used from here on
+    return GeolocationStore.load(store_directory)
+
+
 def fill_locations_dict_scores(prev_examined_location, status,
                                latitude, longitude,
                                ip, ind,
@@ -136,6 +301,215 @@ def fill_locations_dict_scores(prev_examined_location, status,
                 print(f'This should never be printed. Examine what happened !!')
 
 
+def get_out_of_range_mask(latitudes, longitudes):
+    # The same check that makes haversine (and hence the SoL test) fail
+    return (latitudes < -90) | (latitudes > 90) | (longitudes < -180) | (longitudes > 180)
+
+
+def perform_sol_test_batch(geolocation_store, probe_latitudes, probe_longitudes, ip_ids, rtts):
+    """
+    Vectorized SoL testing of many hop evaluations at once, against the locations of all the sources of each hop IP
+    Inputs
+        probe_latitudes, probe_longitudes, ip_ids, rtts -> One entry per evaluation (a hop IP, by its id in the
+        geolocation store, seen from a probe with an rtt)
+    Output
+        unique_ip_ids -> Store ids of the IPs with at least one counted evaluation, in the order of their first one
+        penalty_counts -> (unique_ip_ids, 11) count of the evaluations that failed the SoL test for each source
+        total_counts -> (unique_ip_ids, 11) count of all the evaluations for each source
+    """
+    probe_latitudes = np.asarray(probe_latitudes, dtype=np.float64)
+    probe_longitudes = np.asarray(probe_longitudes, dtype=np.float64)
+    ip_ids = np.asarray(ip_ids, dtype=np.int64)
+    rtts = np.asarray(rtts, dtype=np.float64)
+
+    unique_ip_ids, inverse = np.unique(ip_ids, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    latitudes = np.asarray(geolocation_store.latitudes[unique_ip_ids])
+    longitudes = np.asarray(geolocation_store.longitudes[unique_ip_ids])
+
+    # As in fill_locations_dict_scores, locations with a zero latitude or longitude are never counted
+    countable = np.asarray(geolocation_store.valid[unique_ip_ids]) & (latitudes != 0) & (longitudes != 0) & \
+                ~get_out_of_range_mask(latitudes, longitudes)
+
+    countable_evaluations = countable[inverse] & ~get_out_of_range_mask(probe_latitudes, probe_longitudes)[:, None]
+    evaluation_indices, source_indices = np.nonzero(countable_evaluations)
+    local_ip_ids = inverse[evaluation_indices]
+
+    distances = haversine_vector(np.column_stack((probe_latitudes[evaluation_indices],
+                                                  probe_longitudes[evaluation_indices])),
+                                 np.column_stack((latitudes[local_ip_ids, source_indices],
+                                                  longitudes[local_ip_ids, source_indices])), Unit.KILOMETERS,
+                                 check=False)
+    min_latencies = distances * 1000 / 200000
+    failed = min_latencies > (rtts[evaluation_indices] / 2)
+
+    total_counts = np.zeros((len(unique_ip_ids), GeolocationStore.number_of_sources), dtype=np.int64)
+    np.add.at(total_counts, (local_ip_ids, source_indices), 1)
+    penalty_counts = np.zeros((len(unique_ip_ids), GeolocationStore.number_of_sources), dtype=np.int64)
+    np.add.at(penalty_counts, (local_ip_ids[failed], source_indices[failed]), 1)
+
+    first_evaluation = np.full(len(unique_ip_ids), len(ip_ids), dtype=np.int64)
+    np.minimum.at(first_evaluation, local_ip_ids, evaluation_indices)
+
+    counted = np.flatnonzero(first_evaluation < len(ip_ids))
+    counted = counted[np.argsort(first_evaluation[counted], kind='stable')]
+
+    return unique_ip_ids[counted], penalty_counts[counted], total_counts[counted]
+
+
+# Evaluations grouped per (probe location, hop IP). The rtts of a group are sorted and stored between offsets[i] and
+# offsets[i + 1], first_evaluation is the index of the first (original) evaluation of the group
+SolEvaluationSummary = namedtuple('SolEvaluationSummary', ['probe_latitudes', 'probe_longitudes', 'ip_ids',
+                                                           'first_evaluation', 'offsets', 'rtts'])
+
+
+def summarize_sol_evaluations(probe_latitudes, probe_longitudes, ip_ids, rtts):
+    """
+    Reduces the evaluations of perform_sol_test_batch to one group per (probe location, hop IP), as the same pair is
+    usually tested many times over an hour
+    The rtts of each group are all kept (sorted), so that the SoL counts computed from the summary are exactly the
+    ones of the individual evaluations, the count and minimum rtt of a group are np.diff(offsets) and rtts[offsets[:-1]]
+    """
+    probe_latitudes = np.asarray(probe_latitudes, dtype=np.float64)
+    probe_longitudes = np.asarray(probe_longitudes, dtype=np.float64)
+    ip_ids = np.asarray(ip_ids, dtype=np.int64)
+    rtts = np.asarray(rtts, dtype=np.float64)
+
+    # Sorting the rtts first, the (stable) sort of the groups keeps them sorted within each group
+    order = np.argsort(rtts, kind='stable')
+    order = order[np.lexsort((ip_ids[order], probe_longitudes[order], probe_latitudes[order]))]
+    probe_latitudes, probe_longitudes = probe_latitudes[order], probe_longitudes[order]
+    ip_ids, rtts = ip_ids[order], rtts[order]
+
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (probe_latitudes[1:] != probe_latitudes[:-1]) | (probe_longitudes[1:] != probe_longitudes[:-1]) | \
+                    (ip_ids[1:] != ip_ids[:-1])
+    starts = np.flatnonzero(new_group)
+
+    first_evaluation = np.minimum.reduceat(order, starts) if len(order) > 0 else np.zeros(0, dtype=np.int64)
+
+    return SolEvaluationSummary(probe_latitudes[starts], probe_longitudes[starts], ip_ids[starts],
+                                first_evaluation.astype(np.int64), np.append(starts, len(order)), rtts)
+
+
+def count_rtts_below(summary, groups, thresholds):
+    """
+    For each (group, threshold) pair, the number of rtts of the group whose half is strictly below the threshold
+    As the rtts of a group are sorted, this is a binary search within the group, done for all the pairs at once
+    """
+    low = summary.offsets[groups]
+    high = summary.offsets[groups + 1]
+
+    while True:
+        searching = np.flatnonzero(low < high)
+        if len(searching) == 0:
+            break
+        middle = (low[searching] + high[searching]) // 2
+        # A NaN threshold is never exceeded, and NaN rtts (sorted last) never are below a threshold
+        below = summary.rtts[middle] / 2 < thresholds[searching]
+        low[searching[below]] = middle[below] + 1
+        high[searching[~below]] = middle[~below]
+
+    return low - summary.offsets[groups]
+
+
+def perform_sol_test_summary(geolocation_store, summary, number_of_evaluations):
+    """
+    Same as perform_sol_test_batch, but from the output of summarize_sol_evaluations: the distance is computed once per
+    group and source, and the counts are weighted by the rtts of the group
+    number_of_evaluations -> Number of evaluations that were summarized
+    """
+    unique_ip_ids, inverse = np.unique(summary.ip_ids, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    latitudes = np.asarray(geolocation_store.latitudes[unique_ip_ids])
+    longitudes = np.asarray(geolocation_store.longitudes[unique_ip_ids])
+
+    countable = np.asarray(geolocation_store.valid[unique_ip_ids]) & (latitudes != 0) & (longitudes != 0) & \
+                ~get_out_of_range_mask(latitudes, longitudes)
+
+    countable_groups = countable[inverse] & ~get_out_of_range_mask(summary.probe_latitudes,
+                                                                    summary.probe_longitudes)[:, None]
+    group_indices, source_indices = np.nonzero(countable_groups)
+    local_ip_ids = inverse[group_indices]
+
+    distances = haversine_vector(np.column_stack((summary.probe_latitudes[group_indices],
+                                                  summary.probe_longitudes[group_indices])),
+                                 np.column_stack((latitudes[local_ip_ids, source_indices],
+                                                  longitudes[local_ip_ids, source_indices])), Unit.KILOMETERS,
+                                 check=False)
+    min_latencies = distances * 1000 / 200000
+    failed_counts = count_rtts_below(summary, group_indices, min_latencies)
+
+    total_counts = np.zeros((len(unique_ip_ids), GeolocationStore.number_of_sources), dtype=np.int64)
+    np.add.at(total_counts, (local_ip_ids, source_indices), np.diff(summary.offsets)[group_indices])
+    penalty_counts = np.zeros((len(unique_ip_ids), GeolocationStore.number_of_sources), dtype=np.int64)
+    np.add.at(penalty_counts, (local_ip_ids, source_indices), failed_counts)
+
+    first_evaluation = np.full(len(unique_ip_ids), number_of_evaluations, dtype=np.int64)
+    np.minimum.at(first_evaluation, local_ip_ids, summary.first_evaluation[group_indices])
+
+    counted = np.flatnonzero(first_evaluation < number_of_evaluations)
+    counted = counted[np.argsort(first_evaluation[counted], kind='stable')]
+
+    return unique_ip_ids[counted], penalty_counts[counted], total_counts[counted]
+
+
+def merge_sol_test_counts(all_counts):
+    """
+    Sums several (ip_ids, penalty_counts, total_counts) outputs of perform_sol_test_batch, given in time order
+    The merged IPs are kept in the order of their first appearance, so filling the dict once with the merged counts
+    gives the same result as filling it with each of the outputs in turn
+    """
+    all_counts = [counts for counts in all_counts if len(counts[0]) > 0]
+
+    if len(all_counts) == 0:
+        return np.zeros(0, dtype=np.int64), \
+               np.zeros((0, GeolocationStore.number_of_sources), dtype=np.int64), \
+               np.zeros((0, GeolocationStore.number_of_sources), dtype=np.int64)
+
+    ip_ids = np.concatenate([counts[0] for counts in all_counts])
+    unique_ip_ids, first_index, inverse = np.unique(ip_ids, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    penalty_counts = np.zeros((len(unique_ip_ids), GeolocationStore.number_of_sources), dtype=np.int64)
+    np.add.at(penalty_counts, inverse, np.concatenate([counts[1] for counts in all_counts]))
+    total_counts = np.zeros((len(unique_ip_ids), GeolocationStore.number_of_sources), dtype=np.int64)
+    np.add.at(total_counts, inverse, np.concatenate([counts[2] for counts in all_counts]))
+
+    order = np.argsort(first_index, kind='stable')
+
+    return unique_ip_ids[order], penalty_counts[order], total_counts[order]
+
+
+def fill_locations_dict_scores_batch(geolocation_store, ip_ids, penalty_counts, total_counts,
+                                     ip_location_with_penalty_and_total_count):
+    """
+    Adds the counts from perform_sol_test_batch to ip_location_with_penalty_and_total_count (same format as
+    fill_locations_dict_scores)
+    """
+    for ip_id, penalty_count, total_count in zip(ip_ids.tolist(), penalty_counts.tolist(), total_counts.tolist()):
+        ip = geolocation_store.ips[ip_id]
+        current_contents = ip_location_with_penalty_and_total_count.get(ip, None)
+
+        if current_contents is None:
+            # When examined for the first time, all the sources that could be tested are added
+            location_index = [index for index, count in enumerate(total_count) if count > 0]
+            current_contents = {'location_index': location_index,
+                                'coordinates': [(float(geolocation_store.latitudes[ip_id, index]),
+                                                 float(geolocation_store.longitudes[ip_id, index])) for index in
+                                                location_index],
+                                'penalty_count': [0] * GeolocationStore.number_of_sources,
+                                'total_count': [0] * GeolocationStore.number_of_sources}
+
+        for index in range(GeolocationStore.number_of_sources):
+            current_contents['penalty_count'][index] += penalty_count[index]
+            current_contents['total_count'][index] += total_count[index]
+
+        ip_location_with_penalty_and_total_count[ip] = current_contents
+
+
 def compute_geolocation_performance(file, thresold=0.01):
     with open(file, 'rb') as fp:
         file_contents = pickle.load(fp)
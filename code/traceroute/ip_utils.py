@@ -0,0 +1,28 @@
+from functools import lru_cache
+from ipaddress import ip_network, ip_address
+
+private_ranges = [ip_network("192.168.0.0/16"), ip_network("10.0.0.0/8"), ip_network("172.16.0.0/12")]
+private_ranges_v6 = [ip_network("fc00::/7"), ip_network("fc00::/8"), ip_network("fd00::/8")]
+
+# (first address, last address) of the private ranges, as integers, for each IP version
+private_integer_ranges = {
+    4: [(int(network.network_address), int(network.broadcast_address)) for network in private_ranges],
+    6: [(int(network.network_address), int(network.broadcast_address)) for network in private_ranges_v6]}
+
+
+# The same hops come up again and again across traceroutes, so the results are memoized (bounded, as the RIPE
+# processing sees tens of millions of IPs in every worker)
+@lru_cache(maxsize=1 << 20)
+def check_if_ip_is_private(ip, v4=True):
+    """
+    A simple check if a given IP is in the private IP range or not
+    Returns True if in private IP range, else returns False
+    """
+    address = ip_address(ip)
+
+    # An IP of the other version is never in the ranges of the given version
+    if (address.version == 4) != v4:
+        return False
+
+    value = int(address)
+    return any(start <= value <= end for start, end in private_integer_ranges[address.version])
@@ -1,4 +1,6 @@
 import json
+import math
+import multiprocessing
 import os, sys
 from pathlib import Path
 
@@ -10,8 +12,6 @@ import pickle
 
 from collections import namedtuple
 
-from ipaddress import ip_network, ip_address
-
 from tqdm import tqdm
 
 root_dir = Path(__file__).resolve().parents[2]
@@ -21,13 +21,11 @@ TraceRoute = namedtuple('TraceRoute', ['hops', 'other_info'])
 
 Hops = namedtuple('Hops', ['hop', 'ip_address', 'rtt'])
 
-private_ranges = [ip_network("192.168.0.0/16"), ip_network("10.0.0.0/8"), ip_network("172.16.0.0/12")]
-
-private_ranges_v6 = [ip_network("fc00::/7"), ip_network("fc00::/8"), ip_network("fd00::/8")]
-
+from code.traceroute.ip_utils import check_if_ip_is_private
 from code.traceroute.ripe_probe_location_info import load_probe_location_result
-from code.traceroute.geolocation_latency_based_validation_common_utils import load_all_geolocation_info, \
-    extract_latlon_and_perform_sol_test, fill_locations_dict_scores
+from code.traceroute.geolocation_latency_based_validation_common_utils import load_geolocation_store, \
+    perform_sol_test_batch, summarize_sol_evaluations, perform_sol_test_summary, merge_sol_test_counts, \
+    fill_locations_dict_scores_batch
 
 # Once location scripts are done, load directly from those
 Location = namedtuple('Location', ['city', 'subdivisions', 'country', 'accuracy_radius', 'latitude', 'longitude',
@@ -37,14 +35,74 @@ MaxmindLocation = namedtuple('MaxmindLocation',
                               'autonomous_system_number', 'network'])
 
 
-def download_data_from_ripe_atlas(start_time, end_time, msm_id):
+def check_if_ripe_atlas_file_is_complete(file_path, block_size=65536):
+    """
+    Checks that the last line of a downloaded file is valid JSON (an interrupted download leaves a partial line)
+    Only the end of the file is read, from the last block backwards until the start of the last line
+    """
+    with open(file_path, 'rb') as fp:
+        fp.seek(0, os.SEEK_END)
+        position = fp.tell()
+        tail = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            fp.seek(position)
+            tail = fp.read(read_size) + tail
+            # Once there is a line break before the last line, we have all of it
+            if len(tail.splitlines()) > 1:
+                break
+
+    lines = tail.splitlines()
+    if len(lines) == 0:
+        return False
+
+    try:
+        json.loads(lines[-1])
+        return True
+    except ValueError:
+        return False
+
+
+def parse_ripe_atlas_results(lines):
+    """
+    Parses the traceroute results (one JSON per line) one at a time, from an open file or the lines of a response
+    Raises ValueError on the first line that is not valid JSON
+    """
+    for line in lines:
+        yield json.loads(line)
+
+
+class RipeAtlasResultsFile:
+    """
+    Iterable over the traceroute results of a raw_output_*** file, parsed one line at a time so that only one result
+    is in memory at a time
+    Attributes
+        number_of_results -> Number of results parsed by the last (or current) iteration
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.number_of_results = 0
+
+    def __iter__(self):
+        self.number_of_results = 0
+        with open(self.file_path, 'rb') as fp:
+            for result in parse_ripe_atlas_results(fp):
+                self.number_of_results += 1
+                yield result
+
+
+def download_data_from_ripe_atlas(start_time, end_time, msm_id, stream=False):
     """
     This function essentially downloads the data from RIPE Atlas website and saves the
     result in the stats directory
     Inputs
         start_time -> The start time to collect the data (should be in datetime format)
         end_time -> The end time for the traceroutes to be collected (should be in datetime format)
-        return_content -> By default 0, if set to 1, we return the last processed traceroutes
+        stream -> If True, instead of the list of all the traceroutes, an iterable parsing them from the saved file
+        (see RipeAtlasResultsFile) is returned. Only the last line is checked here, a line that is not valid JSON
+        raises a ValueError when it is reached
     """
     save_directory = root_dir / 'stats' / 'ripe_data'
 
@@ -73,11 +131,13 @@ def download_data_from_ripe_atlas(start_time, end_time, msm_id):
     while retries < max_retries:
         if os.path.isfile(file_path):
             # Check last line of the file for valid JSON format
-            with open(file_path, 'r') as f:
+            if check_if_ripe_atlas_file_is_complete(file_path):
+                print(f"{start_time}'s traceroute file is complete")
+
+                if stream:
+                    return RipeAtlasResultsFile(file_path), file_path
+
                 try:
-                    last_line = f.readlines()[-1]
-                    json.loads(last_line)
-                    print(f"{start_time}'s traceroute file is complete")
                     response_list = []
                     with open(file_path, 'r') as fp:
                         for line in fp:
@@ -89,6 +149,9 @@ def download_data_from_ripe_atlas(start_time, end_time, msm_id):
                 except Exception as e:
                     print(f"{start_time}'s traceroute file is incomplete, retrying...")
                     retries += 1
+            else:
+                print(f"{start_time}'s traceroute file is incomplete, retrying...")
+                retries += 1
 
         url = f"https://atlas.ripe.net/api/v2/measurements/{msm_id}/results/?start={start_time_int}&stop={end_time_int}&format=txt"
         print(f'url: {url}')
@@ -116,12 +179,12 @@ def process_transform_traceroute(traceroute_data, save_file, return_content=0):
     This function essentially extracts required portions of the traceroute, removes hops with
     non-useful entries and saves the output to the stats directory
     Input
-        traceroute_data -> List of all traceroutes (Essentially pass the output from download_data_from_ripe_atlas or read raw_output_*** file)
+        traceroute_data -> List (or generator) of all traceroutes (Essentially pass the output from download_data_from_ripe_atlas or read raw_output_*** file), it is consumed one traceroute at a time
         save_file -> The file to which the processed output should be written
     """
 
     output_traceroute = []
-    skipped_traceoute = []
+    skipped_traceoute = 0
     count = 1
 
     if Path(save_file).exists():
@@ -148,11 +211,11 @@ def process_transform_traceroute(traceroute_data, save_file, return_content=0):
                 output_traceroute.append(TraceRoute(hops, {'time': datetime.fromtimestamp(traceroute['timestamp']),
                                                            'probe_id': traceroute['prb_id']}))
             except:
-                skipped_traceoute.append(traceroute)
+                skipped_traceoute += 1
 
             count += 1
 
-        print(f"Skipped traceroutes : {len(skipped_traceoute)}")
+        print(f"Skipped traceroutes : {skipped_traceoute}")
 
         print(f"Total count now is {count}")
 
@@ -163,103 +226,56 @@ def process_transform_traceroute(traceroute_data, save_file, return_content=0):
         return output_traceroute
 
 
-def check_if_ip_is_private(ip, v4=True):
+def get_sol_evaluations_ripe(updated_traceroute_output, probe_to_coordinate_map, geolocation_store, v4=True):
     """
-    A simple check if a given IP is in the private IP range or not
-    Returns True if in private IP range, else returns False
+    Gathers all the hops to be SoL tested as arrays of probe latitude, probe longitude, hop IP id (in the geolocation
+    store) and rtt
     """
+    probe_latitudes, probe_longitudes, ip_ids, rtts = [], [], [], []
 
-    if v4:
-        if ip_address(ip) in private_ranges[0] or ip_address(ip) in private_ranges[1] or ip_address(ip) in \
-                private_ranges[2]:
-            return True
-        else:
-            return False
-    else:
-        if ip_address(ip) in private_ranges_v6[0] or ip_address(ip) in private_ranges_v6[1] or ip_address(ip) in \
-                private_ranges_v6[2]:
-            return True
-        else:
-            return False
+    # As the same IP could be repeated a lot, let's check it and look it up only once
+    ip_to_id = {}
 
-
-def geolocation_sol_validation_ripe(updated_traceroute_output, probe_to_coordinate_map,
-                                    iplocation_output, maxmind_output,
-                                    ripe_output, caida_output,
-                                    ip_location_with_penalty_and_total_count, v4=True):
-    for count, traceroute in enumerate(updated_traceroute_output):
+    for traceroute in updated_traceroute_output:
         probe = traceroute.other_info['probe_id']
         try:
             initial_lat_lon = probe_to_coordinate_map.get(str(probe), [])[1]
-        except IndexError:
+            probe_latitude, probe_longitude = float(initial_lat_lon[0]), float(initial_lat_lon[1])
+        except (IndexError, TypeError, ValueError):
             continue
 
-        for key, contents in traceroute.hops.items():
-
-            # As the same IP could be repeated based on the # of probes sent, let's not look at the huge geolocation sources
-            # again and again. Kind of like a local cache
-            local_dict = {}
-
+        for contents in traceroute.hops.values():
             for hop_info in contents:
                 ip = hop_info.ip_address
                 rtt = hop_info.rtt
 
-                if ip and not check_if_ip_is_private(ip, v4):
-
-                    if ip not in local_dict.keys():
-
-                        locations = iplocation_output.get(ip, None)
-                        maxmind_location = maxmind_output.get(ip, None)
-                        ripe_location = ripe_output.get(ip, None)
-                        caida_location = caida_output.get(ip, None)
-
-                        # Updating the local cache
-                        local_dict[ip] = {'locations': locations, 'maxmind_location': maxmind_location,
-                                          'ripe_location': ripe_location, 'caida_location': caida_location}
-
-                    else:
-
-                        locations = local_dict[ip]['locations']
-                        maxmind_location = local_dict[ip]['maxmind_location']
-                        ripe_location = local_dict[ip]['ripe_location']
-                        caida_location = local_dict[ip]['caida_location']
-
-                    prev_examined_location = ip_location_with_penalty_and_total_count.get(ip, None)
-
-                    # 如果有定位结果，即location不是None，就进行SoL测试
-                    if locations:
-                        # We have multiple locations for ipgeolocation module, let's iterate over them
-                        for ind, location in enumerate(locations):
-                            # extract the latitude and longitude and perform SoL test
-                            # status is True if we passed the SoL test
-                            # latitude and longitude can be None if we failed to get the location
-                            status, (latitude, longitude) = extract_latlon_and_perform_sol_test(location,
-                                                                                                initial_lat_lon, rtt,
-                                                                                                ind)
-                            fill_locations_dict_scores(prev_examined_location, status,
-                                                       latitude, longitude,
-                                                       ip, ind, ip_location_with_penalty_and_total_count)
-
-                    if maxmind_location:
-                        status, (latitude, longitude) = extract_latlon_and_perform_sol_test(maxmind_location,
-                                                                                            initial_lat_lon, rtt, 8)
-                        fill_locations_dict_scores(prev_examined_location, status,
-                                                   latitude, longitude,
-                                                   ip, 8, ip_location_with_penalty_and_total_count)
-
-                    if ripe_location:
-                        status, (latitude, longitude) = extract_latlon_and_perform_sol_test(ripe_location,
-                                                                                            initial_lat_lon, rtt, 9)
-                        fill_locations_dict_scores(prev_examined_location, status,
-                                                   latitude, longitude,
-                                                   ip, 9, ip_location_with_penalty_and_total_count)
-
-                    if caida_location:
-                        status, (latitude, longitude) = extract_latlon_and_perform_sol_test(caida_location,
-                                                                                            initial_lat_lon, rtt, 10)
-                        fill_locations_dict_scores(prev_examined_location, status,
-                                                   latitude, longitude,
-                                                   ip, 10, ip_location_with_penalty_and_total_count)
+                if ip and rtt is not None:
+                    ip_id = ip_to_id.get(ip, None)
+                    if ip_id is None:
+                        ip_id = -1 if check_if_ip_is_private(ip, v4) else geolocation_store.ip_to_id.get(ip, -1)
+                        ip_to_id[ip] = ip_id
+
+                    if ip_id >= 0:
+                        probe_latitudes.append(probe_latitude)
+                        probe_longitudes.append(probe_longitude)
+                        ip_ids.append(ip_id)
+                        rtts.append(rtt)
+
+    return probe_latitudes, probe_longitudes, ip_ids, rtts
+
+
+def geolocation_sol_validation_ripe(updated_traceroute_output, probe_to_coordinate_map, geolocation_store,
+                                    ip_location_with_penalty_and_total_count, v4=True):
+    probe_latitudes, probe_longitudes, ip_ids, rtts = get_sol_evaluations_ripe(updated_traceroute_output,
+                                                                              probe_to_coordinate_map,
+                                                                              geolocation_store, v4)
+
+    # All the hops of the hour are tested together, against the (already parsed) locations from all the sources
+    ip_ids, penalty_counts, total_counts = perform_sol_test_batch(geolocation_store, probe_latitudes,
+                                                                  probe_longitudes, ip_ids, rtts)
+
+    fill_locations_dict_scores_batch(geolocation_store, ip_ids, penalty_counts, total_counts,
+                                     ip_location_with_penalty_and_total_count)
 
 
 def get_ripe_hops(traceroute, v4=True):
@@ -311,19 +327,153 @@ def get_ripe_hops(traceroute, v4=True):
     return return_hops, actual_count, conditional_count
 
 
-def ripe_process_traceroutes(start_time, end_time, msm_id, ip_version, geolocation_validation=False, suffix='default', update_probe_info=False):
+def load_processed_traceroutes(start_time, end_time, msm_id, max_retries=10):
+    """
+    Loads (or downloads and processes) the traceroutes of msm_id between start_time and end_time
+    The raw traceroutes are parsed from the file as they are processed, and only if there is no processed file yet.
+    As when loading the whole file, a raw file with a line that is not valid JSON is downloaded again
+    Returns the number of raw traceroutes, the processed traceroutes and the directory they are saved in
+    """
+    for attempt in range(max_retries):
+        print(f'Stage 1 : Loading/Downloading the {msm_id} raw traceroute')
+        # save_file is like raw_output_5051_current_date_label
+        traceroute_output, save_file = download_data_from_ripe_atlas(start_time, end_time, msm_id, stream=True)
+
+        print('Stage 2 : Processing the data from RIPE Atlas')
+        new_file = 'processed_' + '_'.join(save_file.name.split('_')[1:])
+        parent_dir = save_file.parent
+        processed_file = parent_dir / new_file
+        # The number of raw traceroutes is saved next to the processed file, so the raw file is not read again
+        raw_number_file = parent_dir / '{}_raw_count'.format(processed_file.stem)
+
+        try:
+            if Path(processed_file).exists():
+                with open(processed_file, 'rb') as fp:
+                    print('Directly loading file from saved locations')
+                    updated_traceroute_output = pickle.load(fp)
+
+                if raw_number_file.is_file():
+                    raw_traceroute_number = int(raw_number_file.read_text())
+                else:
+                    raw_traceroute_number = sum(1 for _ in traceroute_output)
+                    raw_number_file.write_text(str(raw_traceroute_number))
+            else:
+                updated_traceroute_output = process_transform_traceroute(traceroute_output, processed_file, 1)
+                raw_traceroute_number = traceroute_output.number_of_results
+                raw_number_file.write_text(str(raw_traceroute_number))
+            break
+        except ValueError as e:
+            if attempt == max_retries - 1:
+                raise
+            print(f'{save_file.name} has a line that is not valid JSON ({e}), downloading it again')
+            os.remove(save_file)
+
+    print(f'Length of raw traceroutes is {raw_traceroute_number}')
+    print(f'Length of processed traceroutes : {len(updated_traceroute_output)}')
+
+    return raw_traceroute_number, updated_traceroute_output, parent_dir
+
+
+def update_links_dict(links_dict, updated_traceroute_output, v4=True):
+    """
+    Adds the latencies of all the links (consecutive non-private hops) in the traceroutes to links_dict
+    """
+    # TODO 这里的latency计算算法可能可以借用
+    for index, traceroute in enumerate(updated_traceroute_output):
+
+        ripe_hops, actual_ripe_hops, conditional_ripe_hops = get_ripe_hops(traceroute, v4)
+
+        for a_ripe_hop in ripe_hops:
+            ip_addresses = a_ripe_hop[0]
+            all_latencies = links_dict.get(ip_addresses, [])
+
+            all_min_latencies = a_ripe_hop[1]
+            all_max_latencies = a_ripe_hop[2]
+
+            latency_min = round((all_min_latencies[1] - all_min_latencies[0]) / 2, 2)
+            all_latencies.append(latency_min)
+            links_dict[ip_addresses] = all_latencies
+
+
+def process_traceroutes_for_hours(hours, msm_id, v4=True, probe_to_coordinate_map=None, geolocation_store=None,
+                                  summarize_sol=False):
+    """
+    Processes the traceroutes for the given (consecutive) hours
+    If a geolocation store is passed, the hops are also SoL tested and the counts of all the hours are summed up into
+    compact penalty/total count arrays (see perform_sol_test_batch)
+    With summarize_sol, the SoL tests of each hour are done once per (probe location, hop IP) (see
+    summarize_sol_evaluations), the counts are the same
+
+    Returns the links dictionary, the SoL counts and the number of raw and processed traceroutes
+    """
+    links_dict = {}
+    sol_counts = None
+    raw_traceroute_number = 0
+    processed_traceroute_number = 0
+
+    for time in hours:
+        time_end = time + timedelta(hours=1)
+        raw_number, updated_traceroute_output, parent_dir = load_processed_traceroutes(time, time_end, msm_id)
+        raw_traceroute_number += raw_number
+        processed_traceroute_number += len(updated_traceroute_output)
+
+        if geolocation_store is not None:
+            print('Stage 2.1: Performing SoL testing and validating locations')
+            probe_latitudes, probe_longitudes, ip_ids, rtts = get_sol_evaluations_ripe(updated_traceroute_output,
+                                                                                      probe_to_coordinate_map,
+                                                                                      geolocation_store, v4)
+            if summarize_sol:
+                summary = summarize_sol_evaluations(probe_latitudes, probe_longitudes, ip_ids, rtts)
+                print(f'Summarized {len(ip_ids)} SoL evaluations into {len(summary.ip_ids)} (probe, IP) groups')
+                hour_sol_counts = perform_sol_test_summary(geolocation_store, summary, len(ip_ids))
+            else:
+                hour_sol_counts = perform_sol_test_batch(geolocation_store, probe_latitudes, probe_longitudes, ip_ids,
+                                                         rtts)
+
+            # Summing as we go keeps the counts bounded by the number of unique IPs seen so far
+            if sol_counts is None:
+                sol_counts = hour_sol_counts
+            else:
+                sol_counts = merge_sol_test_counts([sol_counts, hour_sol_counts])
+
+            print(f'Our current SoL tested IPs length is {len(sol_counts[0])}')
+
+        print('Stage 3 : Identifying the big jumps and storing in a dictionary')
+        update_links_dict(links_dict, updated_traceroute_output, v4)
+        print(f'Finished processing the traceroutes for {time} to {time_end}')
+        print('')
+
+    return links_dict, sol_counts, raw_traceroute_number, processed_traceroute_number
+
+
+# Read only state for the hourly traceroute worker processes, inherited (copy on write) when the pool is forked
+_ripe_hours_shared_state = {}
+
+
+def _process_traceroutes_for_hours_range(hours):
+    state = _ripe_hours_shared_state
+    return process_traceroutes_for_hours(hours, state['msm_id'], state['v4'], state['probe_to_coordinate_map'],
+                                         state['geolocation_store'], state['summarize_sol'])
+
+
+def ripe_process_traceroutes(start_time, end_time, msm_id, ip_version, geolocation_validation=False, suffix='default',
+                             update_probe_info=False, workers=1, summarize_sol=False):
     """
     This function puts it all together
     (1) Get the raw traceroutes first
     (2) Process the traceroutes
     (3) Generate a dictionary with links and latencies
 
-    Additionally save the results for every 12 hours
+    With geolocation_validation, the SoL counts of all the hours are summed up and the validated locations are saved
+    once at the end
+
+    :param workers: Number of processes to split the hours across (as consecutive ranges), the results of the ranges
+    are merged in order
+    :param summarize_sol: SoL test each hour once per (probe location, hop IP) instead of once per hop
 
     Returns the generated dictionary
     """
 
-    time = start_time
     links_dict = {}
     raw_traceroute_number = 0
     processed_traceroute_number = 0
@@ -334,91 +484,73 @@ def ripe_process_traceroutes(start_time, end_time, msm_id, ip_version, geolocati
         v4 = False
     print(f'Processing traceroutes for {msm_id} and IP version {ip_version}')
 
-    if geolocation_validation:
-        ip_location_with_penalty_and_total_count = {}
+    probe_to_coordinate_map, geolocation_store = None, None
 
+    if geolocation_validation:
         print(f'First loading probe to coordinate map')
 
         probe_to_coordinate_map = load_probe_location_result(update_probe_info)
 
         print('Loading all geolocation sources')
 
-        maxmind_output, ripe_output, caida_output, iplocation_output = load_all_geolocation_info(ip_version, tags=suffix)
+        geolocation_store = load_geolocation_store(ip_version, tags=suffix)
 
         print('Successfully loaded all geolocation results')
 
+    hours = []
+    time = start_time
     while time < end_time:
+        hours.append(time)
+        time = time + timedelta(hours=1)
 
-        print(f'Stage 1 : Loading/Downloading the {msm_id} raw traceroute')
-        time_end = time + timedelta(hours=1)
-        # save_file is like raw_output_5051_current_date_label
-        traceroute_output, save_file = download_data_from_ripe_atlas(time, time_end, msm_id)
-        raw_traceroute_number += len(traceroute_output)
-        print(f'Length of raw traceroutes is {len(traceroute_output)}')
-
-        print('Stage 2 : Processing the data from RIPE Atlas')
-        new_file = 'processed_' + '_'.join(save_file.name.split('_')[1:])
-        parent_dir = save_file.parent
-        processed_file = parent_dir / new_file
-        if Path(processed_file).exists():
-            with open(processed_file, 'rb') as fp:
-                print('Directly loading file from saved locations')
-                updated_traceroute_output = pickle.load(fp)
-        else:
-            updated_traceroute_output = process_transform_traceroute(traceroute_output, processed_file, 1)
-        processed_traceroute_number += len(updated_traceroute_output)
-        print(f'Length of processed traceroutes : {len(updated_traceroute_output)}')
-
-        if geolocation_validation:
-            print('Stage 2.1: Performing SoL testing and validating locations')
+    if workers > 1 and len(hours) > 1:
+        range_size = math.ceil(len(hours) / workers)
+        hours_ranges = [hours[start: start + range_size] for start in range(0, len(hours), range_size)]
 
-            geolocation_sol_validation_ripe(updated_traceroute_output, probe_to_coordinate_map,
-                                            iplocation_output, maxmind_output,
-                                            ripe_output, caida_output,
-                                            ip_location_with_penalty_and_total_count, v4)
+        _ripe_hours_shared_state.update({'msm_id': msm_id, 'v4': v4, 'probe_to_coordinate_map': probe_to_coordinate_map,
+                                         'geolocation_store': geolocation_store, 'summarize_sol': summarize_sol})
 
-            print(
-                f'Our current ip_location_with_penalty_and_total_count length is {len(ip_location_with_penalty_and_total_count)}')
-
-            with open(root_dir / 'stats/location_data/ripe_validated_ip_locations_v{}_{}_{}'.format(ip_version, msm_id, suffix),
-                      'wb') as fp:
-                pickle.dump(ip_location_with_penalty_and_total_count, fp, protocol=pickle.HIGHEST_PROTOCOL)
-
-            print(f'Finished saving the results')
-
-        print('Stage 3 : Identifying the big jumps and storing in a dictionary')
-        # TODO 这里的latency计算算法可能可以借用
-        for index, traceroute in enumerate(updated_traceroute_output):
-
-            ripe_hops, actual_ripe_hops, conditional_ripe_hops = get_ripe_hops(traceroute, v4)
-
-            for a_ripe_hop in ripe_hops:
-                ip_addresses = a_ripe_hop[0]
-                all_latencies = links_dict.get(ip_addresses, [])
+        print(f'Processing {len(hours)} hours in {len(hours_ranges)} ranges')
+        try:
+            with multiprocessing.get_context('fork').Pool(len(hours_ranges)) as pool:
+                results = pool.map(_process_traceroutes_for_hours_range, hours_ranges)
+        finally:
+            _ripe_hours_shared_state.clear()
+    else:
+        results = [process_traceroutes_for_hours(hours, msm_id, v4, probe_to_coordinate_map, geolocation_store,
+                                                 summarize_sol)]
+
+    all_sol_counts = []
+    for range_links_dict, range_sol_counts, range_raw_number, range_processed_number in results:
+        # The ranges are in time order, so the latencies are appended in the same order as processing hour by hour
+        for ip_addresses, latencies in range_links_dict.items():
+            all_latencies = links_dict.get(ip_addresses, [])
+            all_latencies.extend(latencies)
+            links_dict[ip_addresses] = all_latencies
+        if range_sol_counts is not None:
+            all_sol_counts.append(range_sol_counts)
+        raw_traceroute_number += range_raw_number
+        processed_traceroute_number += range_processed_number
 
-                all_min_latencies = a_ripe_hop[1]
-                all_max_latencies = a_ripe_hop[2]
+    if geolocation_validation:
+        ip_location_with_penalty_and_total_count = {}
+        ip_ids, penalty_counts, total_counts = merge_sol_test_counts(all_sol_counts)
+        fill_locations_dict_scores_batch(geolocation_store, ip_ids, penalty_counts, total_counts,
+                                         ip_location_with_penalty_and_total_count)
 
-                latency_min = round((all_min_latencies[1] - all_min_latencies[0]) / 2, 2)
-                all_latencies.append(latency_min)
-                links_dict[ip_addresses] = all_latencies
-        print(f'Finished processing the traceroutes for {time} to {time_end}')
-        print('')
+        print(f'Our ip_location_with_penalty_and_total_count length is {len(ip_location_with_penalty_and_total_count)}')
 
-        time = time_end
+        with open(root_dir / 'stats/location_data/ripe_validated_ip_locations_v{}_{}_{}'.format(ip_version, msm_id, suffix),
+                  'wb') as fp:
+            pickle.dump(ip_location_with_penalty_and_total_count, fp, protocol=pickle.HIGHEST_PROTOCOL)
 
-        # if count % 6 == 0:
-        #     print(f'Writing to a file for count {count // 6}')
-        #     file_name = f'uniq_ip_dict_{msm_id}_all_links_v{ip_version}_min_all_latencies_only_' + str(count // 6)
-        #     save_file = parent_dir / file_name
-        #     with open(save_file, 'wb') as fp:
-        #         pickle.dump(links_dict, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f'Finished saving the results')
 
     print(f'Total number of raw traceroutes is {raw_traceroute_number}')
     print(f'Total number of processed traceroutes is {processed_traceroute_number}')
     print(f'Total number of the links is {len(links_dict)}')
     file_name = f'uniq_ip_dict_{msm_id}_all_links_v{ip_version}_min_all_latencies_only_{suffix}'
-    save_file = parent_dir / file_name
+    save_file = root_dir / 'stats' / 'ripe_data' / file_name
     with open(save_file, 'wb') as fp:
         pickle.dump(links_dict, fp, protocol=pickle.HIGHEST_PROTOCOL)
     print(f'Saved the final result to {save_file}')
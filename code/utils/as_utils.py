@@ -6,11 +6,13 @@ import os, sys
 
 sys.path.insert(1, os.path.abspath('.'))
 
-import reverse_geocode, string, pycountry, pycountry_convert
+import string, pycountry, pycountry_convert
 from unidecode import unidecode
 
 from code.utils.traceroute_utils import load_all_links_and_ips_data
 from code.utils.merge_data import save_results_to_file
+from code.submarine.telegeography_submarine import load_submarine_catalog
+from code.utils.reverse_geocode_utils import get_reverse_geocoder
 
 from collections import namedtuple
 
@@ -78,8 +80,7 @@ def load_submarine_and_asn_data():
     save_file = root_dir / 'stats/submarine_data/owners_dict'
 
     if Path(save_file).exists():
-        with open(save_file, 'rb') as fp:
-            submarine_owners = pickle.load(fp)
+        submarine_owners = load_submarine_catalog().owners_dict
     else:
         print(f'Run submarine module before running this')
         sys.exit(1)
@@ -87,8 +88,7 @@ def load_submarine_and_asn_data():
     save_file = root_dir / 'stats/submarine_data/cable_info_dict'
 
     if Path(save_file).exists():
-        with open(save_file, 'rb') as fp:
-            cable_dict = pickle.load(fp)
+        cable_dict = load_submarine_catalog().cable_info_dict
     else:
         print(f'Run submarine module before running this')
         sys.exit(1)
@@ -96,8 +96,7 @@ def load_submarine_and_asn_data():
     save_file = root_dir / 'stats/submarine_data/landing_points_dict'
 
     if Path(save_file).exists():
-        with open(save_file, 'rb') as fp:
-            landing_points_dict = pickle.load(fp)
+        landing_points_dict = load_submarine_catalog().landing_points_dict
     else:
         print(f'Run submarine module before running this')
         sys.exit(1)
@@ -188,14 +187,18 @@ def get_ip_to_asn_for_all_ips(all_ips, ip_version=4, suffix='default'):
 def get_country_for_each_operator(submarine_owners, cable_dict, landing_points_dict):
     org_to_country_map = {}
 
+    # All the landing points are reverse geocoded once, rather than per cable per owner
+    landing_point_ids = list(landing_points_dict.keys())
+    landing_point_countries = dict(zip(landing_point_ids, get_reverse_geocoder().get_country_codes(
+        [(landing_points_dict[landing_point].latitude, landing_points_dict[landing_point].longitude) for landing_point
+         in landing_point_ids])))
+
     for count, (org, cables) in enumerate(submarine_owners.items()):
         result = []
         for cable in cables:
             var = set()
             for landing_point in cable_dict[cable].landing_points:
-                landing_point_coordinates = (
-                landing_points_dict[landing_point].latitude, landing_points_dict[landing_point].longitude)
-                country = reverse_geocode.search([landing_point_coordinates])[0]['country_code']
+                country = landing_point_countries[landing_point]
                 # country = landing_points_dict[landing_point].country
                 var.add(country)
             result.extend(list(var))
@@ -3,6 +3,7 @@ from pathlib import Path
 import subprocess
 
 import os, sys
+import multiprocessing
 
 root_dir = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(root_dir))
@@ -10,27 +11,32 @@ sys.path.insert(0, str(root_dir))
 from code.utils.merge_data import save_results_to_file
 from collections import namedtuple
 from code.utils.geolocation_utils import generate_latlon_cluster_and_score_map, generate_categories, Location, \
-    MaxmindLocation
+    MaxmindLocation, GeolocationClusterCache
 from code.utils.as_utils import generate_closest_submarine_org
 from code.utils.traceroute_utils import load_all_links_and_ips_data, generate_test_case_links_and_ips_data
 
 from code.submarine.telegeography_submarine import find_intersecting_cables, Cable, LandingPoints, \
-    get_all_latlon_locations_ball_tree, get_cable_by_cable_id
+    get_all_latlon_locations_ball_tree, get_cable_by_cable_id, load_submarine_catalog, LandingPointPairIndex
 import math
 import numpy as np
-from itertools import product
+from itertools import product, combinations
+from collections import OrderedDict
 from haversine import haversine, Unit
 
 Cable = namedtuple('Cable', ['name', 'landing_points', 'length', 'owners', 'notes', 'rfs', 'other_info'])
 
+# A single cable mapping candidate, ie., the IP cluster centroids (latitude, longitude) of the link, the ids of the
+# landing points they were matched to, the geolocation (clustering) scores, the distances (in radians) from the
+# centroids to the landing points and the AS owner flags
+CANDIDATE_DTYPE = np.dtype([('latlon', 'f8', (2, 2)), ('landing_point_ids', 'i8', (2,)), ('scores', 'f8', (2,)),
+                            ('distances', 'f8', (2,)), ('owners', 'i1', (2,))])
+
 
 def get_cable_details():
     save_file = root_dir / 'stats/submarine_data/cable_info_dict'
 
     if Path(save_file).exists():
-        with open(save_file, 'rb') as fp:
-            cable_dict = pickle.load(fp)
-        return cable_dict
+        return load_submarine_catalog().cable_info_dict
     else:
         print(f'Run the submarine module to generate necessary data')
         sys.exit(1)
@@ -44,19 +50,21 @@ def get_submarine_owners():
     save_file = root_dir / 'stats/submarine_data/owners_dict'
 
     if Path(save_file).exists():
-        with open(save_file, 'rb') as fp:
-            submarine_owners_dict = pickle.load(fp)
-        return submarine_owners_dict
+        return load_submarine_catalog().owners_dict
     else:
         print(f'Run the submarine module to generate necessary data')
         sys.exit(1)
 
 
 def load_required_files(all_ips, links, mode=2, ip_version=4, sol_threshold=0.01, geolocation_threshold=0.6,
-                        ignore=True, suffix='default'):
+                        ignore=True, suffix='default', workers=1):
     # Ideally we want to load things straight away in which case we don't need all_ips and links
+    # The cluster cache is loaded once and shared by the clustering and the categorization
+    cluster_cache = GeolocationClusterCache(ip_version)
+
     geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated = generate_latlon_cluster_and_score_map(
-        all_ips, ip_version=ip_version, mode=mode, threshold=sol_threshold, suffix=suffix)
+        all_ips, ip_version=ip_version, mode=mode, threshold=sol_threshold, suffix=suffix, workers=workers,
+        cluster_cache=cluster_cache)
 
     categories_map, categories_map_sol_validated = generate_categories(all_ips, links,
                                                                        geolocation_latlon_cluster_and_score_map,
@@ -64,7 +72,10 @@ def load_required_files(all_ips, links, mode=2, ip_version=4, sol_threshold=0.01
                                                                        ip_version=ip_version, mode=mode,
                                                                        sol_threshold=sol_threshold,
                                                                        geolocation_threshold=geolocation_threshold,
-                                                                       ignore=ignore, suffix=suffix)
+                                                                       ignore=ignore, suffix=suffix, workers=workers,
+                                                                       cluster_cache=cluster_cache)
+
+    cluster_cache.save()
 
     return geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated, categories_map, categories_map_sol_validated
 
@@ -86,12 +97,114 @@ def list_conversion_from_array(array):
     return [i.tolist() for i in array]
 
 
-def get_landing_point_info(tree_index, landing_points_dict, latlon_dict, latlons):
-    return landing_points_dict[latlon_dict[latlons[tree_index]]]
+def get_landing_point_neighbors_for_centroids(tree, centroids, max_radius=1000):
+    """
+    Runs a single vectorized BallTree query for all the given cluster centroids at the maximum radius used by
+    get_cable_for_given_latlon_pair. The results are sorted by distance, so any smaller radius is just a prefix.
+    Input
+        centroids -> list of [latitude, longitude] (in degrees)
+    Output
+        A dictionary with the centroid tuple as key and (tree indices, distances in radians) as value
+    """
+    unique_centroids = list(dict.fromkeys(tuple(centroid) for centroid in centroids))
+
+    if len(unique_centroids) == 0:
+        return {}
+
+    ind, dist = tree.query_radius(list(map(convert_degrees_to_randians, unique_centroids)), max_radius / 6371,
+                                  return_distance=True, sort_results=True)
+
+    return {centroid: (ind[count], dist[count]) for count, centroid in enumerate(unique_centroids)}
+
+
+def get_neighbors_within_radius(neighbors_pair, radius):
+    # Slicing the distance sorted neighbors is equivalent to querying the tree again with the smaller radius
+    ind, dist = [], []
+    for centroid_ind, centroid_dist in neighbors_pair:
+        cut = np.searchsorted(centroid_dist, radius / 6371, side='right')
+        ind.append(centroid_ind[:cut])
+        dist.append(centroid_dist[:cut])
+    return ind, dist
+
+
+class ClusterNeighborCache:
+    """
+    LRU cache shared by all the categories and both modes of a cable mapping run. Holds the sorted cluster means and
+    scores of each IP and the landing points (with distances) within max_radius of each cluster centroid, so that an
+    IP appearing in many links is only processed once.
+    """
+
+    def __init__(self, tree, max_radius=1000, max_ips=1000000, max_centroids=200000):
+        self.tree = tree
+        self.max_radius = max_radius
+        self.max_ips = max_ips
+        self.max_centroids = max_centroids
+        self.clusters = OrderedDict()
+        self.neighbors = OrderedDict()
+        self.cluster_hits, self.cluster_misses = 0, 0
+        self.neighbor_hits, self.neighbor_misses = 0, 0
+
+    def get_mean_and_len_clusters(self, ip_address, latlon_cluster_and_score_map):
+        latlon_cluster, len_cluster, _ = latlon_cluster_and_score_map[ip_address]
+        entry = self.clusters.get(ip_address)
+
+        # Both modes share the cache, the entry is only reused if the clusters for this IP are the same
+        if entry and entry[0] == latlon_cluster and entry[1] == len_cluster:
+            self.cluster_hits += 1
+            self.clusters.move_to_end(ip_address)
+            return entry[2]
+
+        self.cluster_misses += 1
+        mean_and_len = (get_sorted_mean_clusters(latlon_cluster), sorted(len_cluster, reverse=True))
+        self.clusters[ip_address] = (latlon_cluster, len_cluster, mean_and_len)
+        self.clusters.move_to_end(ip_address)
+        if len(self.clusters) > self.max_ips:
+            self.clusters.popitem(last=False)
+
+        return mean_and_len
+
+    def get_neighbors(self, centroids):
+        """
+        Returns the neighbors of all the given centroids, running one batched tree query for the ones not in the cache
+        """
+        ret_dict, missing = {}, []
+        for centroid in dict.fromkeys(tuple(centroid) for centroid in centroids):
+            if centroid in self.neighbors:
+                self.neighbor_hits += 1
+                self.neighbors.move_to_end(centroid)
+                ret_dict[centroid] = self.neighbors[centroid]
+            else:
+                self.neighbor_misses += 1
+                missing.append(centroid)
+
+        for centroid, neighbors in get_landing_point_neighbors_for_centroids(self.tree, missing,
+                                                                             self.max_radius).items():
+            ret_dict[centroid] = neighbors
+            self.neighbors[centroid] = neighbors
+
+        while len(self.neighbors) > self.max_centroids:
+            self.neighbors.popitem(last=False)
+
+        return ret_dict
+
+    def update_stats(self, stats):
+        # Used to account for the lookups done by the caches of the worker processes
+        self.cluster_hits += stats['cluster_hits']
+        self.cluster_misses += stats['cluster_misses']
+        self.neighbor_hits += stats['neighbor_hits']
+        self.neighbor_misses += stats['neighbor_misses']
+
+    def stats(self):
+        return {'cluster_hits': self.cluster_hits, 'cluster_misses': self.cluster_misses,
+                'neighbor_hits': self.neighbor_hits, 'neighbor_misses': self.neighbor_misses}
 
 
 def get_cable_for_given_latlon_pair(latlon_pair, tree, scores_pair, future_cables, landing_points_dict, latlon_dict,
-                                    latlons, category):
+                                    latlons, category, pair_index=None, neighbors_pair=None):
+    # Building the index here is only meant for one-off calls, the mapping loop passes a pre-built one
+    if pair_index is None:
+        pair_index = LandingPointPairIndex(landing_points_dict, latlon_dict, latlons, future_cables)
+
     radians_latlon_pair = list(map(convert_degrees_to_randians, latlon_pair))
     out = {}
     radius_increase = 50
@@ -101,25 +214,23 @@ def get_cable_for_given_latlon_pair(latlon_pair, tree, scores_pair, future_cable
         current_radius = 1000
     match_count = 0
     while match_count < 2:
-        ind, dist = tuple(map(list_conversion_from_array,
-                              tree.query_radius(radians_latlon_pair, current_radius / 6371, return_distance=True,
-                                                sort_results=True)))
-        for index_pairs, dist_pairs in zip(product(ind[0], ind[1]), product(dist[0], dist[1])):
-            # 遍历这些对，如果索引不相同，获取对应的登陆点信息。
-            if index_pairs[0] != index_pairs[1]:
-                landing_point_1, landing_point_2 = get_landing_point_info(index_pairs[0], landing_points_dict,
-                                                                          latlon_dict, latlons), get_landing_point_info(
-                    index_pairs[1], landing_points_dict, latlon_dict, latlons)
-                # 找到两个登陆点的交集海缆。不会判断连接关系，只要是同一条海缆上的两个登陆站就默认为相连
-                cables = find_intersecting_cables(landing_point_1.cable, landing_point_2.cable)
-                cables = [cable for cable in cables if cable not in future_cables]
-                if len(cables) > 0:
-                    for cable in cables:
-                        identified_cable = get_cable_by_cable_id(cable).name
-                        scores_val = out.get(identified_cable, [])
-                        scores_val.append((latlon_pair, (landing_point_1, landing_point_2), scores_pair, dist_pairs))
-                        out[identified_cable] = scores_val
-                    match_count += 1
+        if neighbors_pair is None:
+            ind, dist = tree.query_radius(radians_latlon_pair, current_radius / 6371, return_distance=True,
+                                          sort_results=True)
+        else:
+            ind, dist = get_neighbors_within_radius(neighbors_pair, current_radius)
+        # Only the candidate landing point pairs sharing an in-service cable are returned (in product order)
+        rows, cols, candidate_cables = pair_index.get_cables_for_candidate_pairs(ind[0], ind[1])
+        ind, dist = list_conversion_from_array(ind), list_conversion_from_array(dist)
+        for row, col, cables in zip(rows.tolist(), cols.tolist(), candidate_cables):
+            landing_point_ids = (pair_index.landing_point_ids[ind[0][row]], pair_index.landing_point_ids[ind[1][col]])
+            dist_pairs = (dist[0][row], dist[1][col])
+            for cable in cables:
+                identified_cable = get_cable_by_cable_id(cable).name
+                scores_val = out.get(identified_cable, [])
+                scores_val.append((latlon_pair, landing_point_ids, scores_pair, dist_pairs))
+                out[identified_cable] = scores_val
+            match_count += 1
         current_radius += radius_increase
         if current_radius >= 1000:
             break
@@ -136,38 +247,65 @@ def update_dict(dict_1, dict_2):
     return out_dict
 
 
-def update_score_tuple(list_of_tuples_from_geolocation, owner_score_tuple):
-    final_score_tuple = []
-    for geolocation_tuple in list_of_tuples_from_geolocation:
-        geolocation_tuple_list = list(geolocation_tuple)
-        geolocation_tuple_list.append(owner_score_tuple)
-        single_score_tuple = tuple(geolocation_tuple_list)
-        final_score_tuple.append(single_score_tuple)
-    return final_score_tuple
+def generate_candidate_records(list_of_tuples_from_geolocation):
+    # Owner flags are filled in per link by update_score_tuple
+    return np.array([geolocation_tuple + ((0, 0),) for geolocation_tuple in list_of_tuples_from_geolocation],
+                    dtype=CANDIDATE_DTYPE)
 
 
-def generate_cable_mapping_for_given_category(category_links, latlon_cluster_and_score_map, category, tree,
-                                              future_cables, closest_submarine_org, submarine_owners_dict, cable_dict,
-                                              landing_points_dict, latlon_dict, latlons, save_file=None, suffix='default'):
-    save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
-    save_directory.mkdir(parents=True, exist_ok=True)
+def update_score_tuple(geolocation_candidates, owner_score_tuple):
+    final_candidates = geolocation_candidates.copy()
+    final_candidates['owners'] = owner_score_tuple
+    return final_candidates
+
 
+def generate_cable_mapping_for_links(category_links, latlon_cluster_and_score_map, category, tree, future_cables,
+                                     closest_submarine_org, submarine_owners_dict, cable_dict, landing_points_dict,
+                                     latlon_dict, latlons, pair_index, neighbor_cache, batch_size=5000):
+    """
+    Maps the given links of a category to cables
+    Output
+        The cable mapping for the links and the number of work units (unique endpoint cluster pairs) processed
+    """
     cable_mapping = {}
+    category_links = list(category_links)
+
+    # Links with identical endpoint clusters share the geolocation part of the mapping (only owner scores differ)
+    radius_class = 'te' in category
+    work_units = {}
 
     for count, (ip_1, ip_2) in enumerate(category_links):
 
+        # One batched tree query (at the max radius) for the cluster centroids of the next batch of links
+        if count % batch_size == 0:
+            centroid_neighbors = neighbor_cache.get_neighbors(
+                [mean for link in category_links[count: count + batch_size] for ip in link for mean in
+                 neighbor_cache.get_mean_and_len_clusters(ip, latlon_cluster_and_score_map)[0]])
+
         link_all_scores_cable_map = {}
 
-        mean_cluster_1, len_cluster_1 = return_mean_and_len_clusters(ip_1, latlon_cluster_and_score_map)
-        mean_cluster_2, len_cluster_2 = return_mean_and_len_clusters(ip_2, latlon_cluster_and_score_map)
+        mean_cluster_1, len_cluster_1 = neighbor_cache.get_mean_and_len_clusters(ip_1, latlon_cluster_and_score_map)
+        mean_cluster_2, len_cluster_2 = neighbor_cache.get_mean_and_len_clusters(ip_2, latlon_cluster_and_score_map)
+
+        work_unit_key = (tuple(map(tuple, mean_cluster_1)), tuple(len_cluster_1), tuple(map(tuple, mean_cluster_2)),
+                         tuple(len_cluster_2), radius_class)
+
+        if work_unit_key in work_units:
+            scores_cable_map = work_units[work_unit_key]
+        else:
+            scores_cable_map = {}
 
-        scores_cable_map = {}
+            for mean_cluster_combination, scores_combination in zip(product(mean_cluster_1, mean_cluster_2),
+                                                                    product(len_cluster_1, len_cluster_2)):
+                neighbors_pair = tuple(centroid_neighbors[tuple(mean)] for mean in mean_cluster_combination)
+                cables = get_cable_for_given_latlon_pair(mean_cluster_combination, tree, scores_combination,
+                                                         future_cables, landing_points_dict, latlon_dict, latlons,
+                                                         category, pair_index, neighbors_pair)
+                scores_cable_map = update_dict(scores_cable_map, cables)
 
-        for mean_cluster_combination, scores_combination in zip(product(mean_cluster_1, mean_cluster_2),
-                                                                product(len_cluster_1, len_cluster_2)):
-            cables = get_cable_for_given_latlon_pair(mean_cluster_combination, tree, scores_combination, future_cables,
-                                                     landing_points_dict, latlon_dict, latlons, category)
-            scores_cable_map = update_dict(scores_cable_map, cables)
+            scores_cable_map = {cable: generate_candidate_records(geolocation_tuples) for cable, geolocation_tuples in
+                                scores_cable_map.items()}
+            work_units[work_unit_key] = scores_cable_map
 
         org_1 = closest_submarine_org.get(ip_1, None)
         # input(closest_submarine_org)
@@ -217,6 +355,76 @@ def generate_cable_mapping_for_given_category(category_links, latlon_cluster_and
         if count % 500 == 0:
             print(f'Finished {count} of {len(category_links)}')
 
+    return cable_mapping, len(work_units)
+
+
+# Read only state for the cable mapping worker processes, inherited (copy on write) when the pool is forked
+_cable_mapping_shared_state = {}
+
+
+def _generate_cable_mapping_for_shard(shard):
+    state = _cable_mapping_shared_state
+    neighbor_cache = ClusterNeighborCache(state['tree'])
+    cable_mapping, num_work_units = generate_cable_mapping_for_links(
+        state['category_links'][shard[0]: shard[1]], state['latlon_cluster_and_score_map'], state['category'],
+        state['tree'], state['future_cables'], state['closest_submarine_org'], state['submarine_owners_dict'],
+        state['cable_dict'], state['landing_points_dict'], state['latlon_dict'], state['latlons'],
+        state['pair_index'], neighbor_cache)
+    return cable_mapping, num_work_units, neighbor_cache.stats()
+
+
+def generate_cable_mapping_for_given_category(category_links, latlon_cluster_and_score_map, category, tree,
+                                              future_cables, closest_submarine_org, submarine_owners_dict, cable_dict,
+                                              landing_points_dict, latlon_dict, latlons, save_file=None, suffix='default',
+                                              pair_index=None, neighbor_cache=None, workers=1):
+    """
+    :param workers: Number of processes to shard the links across, the shard results are merged in order
+    """
+    save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
+    save_directory.mkdir(parents=True, exist_ok=True)
+
+    if pair_index is None:
+        pair_index = LandingPointPairIndex(landing_points_dict, latlon_dict, latlons, future_cables)
+
+    if neighbor_cache is None:
+        neighbor_cache = ClusterNeighborCache(tree)
+
+    category_links = list(category_links)
+
+    if workers > 1 and len(category_links) > workers:
+        shard_size = math.ceil(len(category_links) / workers)
+        shards = [(start, start + shard_size) for start in range(0, len(category_links), shard_size)]
+
+        _cable_mapping_shared_state.update(
+            {'category_links': category_links, 'latlon_cluster_and_score_map': latlon_cluster_and_score_map,
+             'category': category, 'tree': tree, 'future_cables': future_cables,
+             'closest_submarine_org': closest_submarine_org, 'submarine_owners_dict': submarine_owners_dict,
+             'cable_dict': cable_dict, 'landing_points_dict': landing_points_dict, 'latlon_dict': latlon_dict,
+             'latlons': latlons, 'pair_index': pair_index})
+
+        print(f'{category}: processing {len(category_links)} links in {len(shards)} shards')
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(_generate_cable_mapping_for_shard, shards)
+        finally:
+            _cable_mapping_shared_state.clear()
+
+        cable_mapping, num_work_units = {}, 0
+        for shard_cable_mapping, shard_work_units, shard_cache_stats in results:
+            cable_mapping.update(shard_cable_mapping)
+            num_work_units += shard_work_units
+            neighbor_cache.update_stats(shard_cache_stats)
+    else:
+        cable_mapping, num_work_units = generate_cable_mapping_for_links(category_links, latlon_cluster_and_score_map,
+                                                                         category, tree, future_cables,
+                                                                         closest_submarine_org, submarine_owners_dict,
+                                                                         cable_dict, landing_points_dict, latlon_dict,
+                                                                         latlons, pair_index, neighbor_cache)
+
+    if len(category_links) > 0:
+        print(f'{category}: {len(category_links)} links deduplicated to {num_work_units} work units '
+              f'(dedup ratio : {len(category_links) / num_work_units:.2f})')
+
     save_results_to_file(cable_mapping, str(save_directory), save_file)
 
     return cable_mapping
@@ -224,9 +432,16 @@ def generate_cable_mapping_for_given_category(category_links, latlon_cluster_and
 
 def general_cable_mapping_helper(categories_map, latlon_cluster_and_score_map, tree, future_cables,
                                  closest_submarine_org, submarine_owners_dict, cable_dict, landing_points_dict,
-                                 latlon_dict, latlons, max_links_to_process=None, server_id=None, mode=0, ip_version=4, suffix='default'):
+                                 latlon_dict, latlons, max_links_to_process=None, server_id=None, mode=0, ip_version=4, suffix='default',
+                                 pair_index=None, neighbor_cache=None, workers=1):
     cable_mapping_all_categories = {}
 
+    if pair_index is None:
+        pair_index = LandingPointPairIndex(landing_points_dict, latlon_dict, latlons, future_cables)
+
+    if neighbor_cache is None:
+        neighbor_cache = ClusterNeighborCache(tree)
+
     for category in categories_map:
         if category != 'de_te':
             if server_id:
@@ -250,7 +465,8 @@ def general_cable_mapping_helper(categories_map, latlon_cluster_and_score_map, t
                                                                           category, tree, future_cables,
                                                                           closest_submarine_org, submarine_owners_dict,
                                                                           cable_dict, landing_points_dict, latlon_dict,
-                                                                          latlons, save_file, suffix)
+                                                                          latlons, save_file, suffix, pair_index,
+                                                                          neighbor_cache, workers)
 
             else:
                 save_file = 'cable_mapping_sol_validated_{}_v{}'.format(category, ip_version)
@@ -261,28 +477,35 @@ def general_cable_mapping_helper(categories_map, latlon_cluster_and_score_map, t
                                                                           category, tree, future_cables,
                                                                           closest_submarine_org, submarine_owners_dict,
                                                                           cable_dict, landing_points_dict, latlon_dict,
-                                                                          latlons, save_file, suffix)
+                                                                          latlons, save_file, suffix, pair_index,
+                                                                          neighbor_cache, workers)
 
             cable_mapping_all_categories[category] = cable_mapping
 
+    print(f'Cluster and neighbor cache stats: {neighbor_cache.stats()}')
+
     return cable_mapping_all_categories
 
 
 def generate_cable_mapping(max_links_to_process=None, max_links_to_process_sol_validated=None, server_id=None, mode=2,
-                           ip_version=4, sol_threshold=0.01, geolocation_threshold=0.6, ignore=True, suffix='default'):
+                           ip_version=4, sol_threshold=0.01, geolocation_threshold=0.6, ignore=True, suffix='default',
+                           workers=1):
     """
     This function generates the cable mapping for all the categories
     :param mode: The mode to process the links, 0 - Only geolocation, 1 - SoL validated geolocation, 2 - Generate both results
+    :param workers: Number of processes to shard each category across (an alternative to manual server_id splitting)
     """
     links, all_ips = load_all_links_and_ips_data(ip_version=ip_version, suffix=suffix)
     geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated, categories_map, categories_map_sol_validated = load_required_files(
         all_ips, links, mode=mode, ip_version=ip_version, sol_threshold=sol_threshold,
-        geolocation_threshold=geolocation_threshold, ignore=ignore, suffix=suffix)
+        geolocation_threshold=geolocation_threshold, ignore=ignore, suffix=suffix, workers=workers)
 
     cable_dict = get_cable_details()
     future_cables = get_future_cables(cable_dict)
     submarine_owners_dict = get_submarine_owners()
     landing_points_dict, latlon_dict, latlons, tree = get_all_latlon_locations_ball_tree()
+    pair_index = LandingPointPairIndex(landing_points_dict, latlon_dict, latlons, future_cables)
+    neighbor_cache = ClusterNeighborCache(tree)
 
     closest_submarine_org = generate_closest_submarine_org(all_ips, ip_version=ip_version, suffix=suffix)
 
@@ -295,7 +518,8 @@ def generate_cable_mapping(max_links_to_process=None, max_links_to_process_sol_v
                                                      cable_dict,
                                                      landing_points_dict, latlon_dict, latlons,
                                                      max_links_to_process=max_links_to_process, server_id=server_id,
-                                                     mode=0, ip_version=ip_version, suffix=suffix)
+                                                     mode=0, ip_version=ip_version, suffix=suffix, pair_index=pair_index,
+                                                     neighbor_cache=neighbor_cache, workers=workers)
 
     if mode in [1, 2]:
         print(f'Currently processing mode : {mode}')
@@ -306,22 +530,26 @@ def generate_cable_mapping(max_links_to_process=None, max_links_to_process_sol_v
                                                                    landing_points_dict, latlon_dict, latlons,
                                                                    max_links_to_process=max_links_to_process_sol_validated,
                                                                    server_id=server_id,
-                                                                   mode=1, ip_version=ip_version, suffix=suffix)
+                                                                   mode=1, ip_version=ip_version, suffix=suffix, pair_index=pair_index,
+                                                                   neighbor_cache=neighbor_cache, workers=workers)
 
     return cable_mapping, cable_mapping_sol_validated
 
 
 def generate_cable_mapping_test(mode=2, ip_version=4, sol_threshold=0.01, geolocation_threshold=0.6, ignore=True,
-                                max_links_to_process=None, max_links_to_process_sol_validated=None, server_id=None, suffix='default'):
+                                max_links_to_process=None, max_links_to_process_sol_validated=None, server_id=None, suffix='default',
+                                workers=1):
     links, all_ips = generate_test_case_links_and_ips_data(ip_version=ip_version)
     geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated, categories_map, categories_map_sol_validated = load_required_files(
         all_ips, links, mode=mode, ip_version=ip_version, sol_threshold=sol_threshold,
-        geolocation_threshold=geolocation_threshold, ignore=ignore, suffix=suffix)
+        geolocation_threshold=geolocation_threshold, ignore=ignore, suffix=suffix, workers=workers)
 
     cable_dict = get_cable_details()
     future_cables = get_future_cables(cable_dict)
     submarine_owners_dict = get_submarine_owners()
     landing_points_dict, latlon_dict, latlons, tree = get_all_latlon_locations_ball_tree()
+    pair_index = LandingPointPairIndex(landing_points_dict, latlon_dict, latlons, future_cables)
+    neighbor_cache = ClusterNeighborCache(tree)
 
     closest_submarine_org = generate_closest_submarine_org(all_ips, ip_version=ip_version, suffix=suffix)
 
@@ -334,7 +562,8 @@ def generate_cable_mapping_test(mode=2, ip_version=4, sol_threshold=0.01, geoloc
                                                      cable_dict,
                                                      landing_points_dict, latlon_dict, latlons,
                                                      max_links_to_process=max_links_to_process, server_id=server_id,
-                                                     mode=0, ip_version=ip_version)
+                                                     mode=0, ip_version=ip_version, pair_index=pair_index,
+                                                     neighbor_cache=neighbor_cache, workers=workers)
 
     if mode in [1, 2]:
         print(f'Currently processing mode : {mode}')
@@ -345,7 +574,8 @@ def generate_cable_mapping_test(mode=2, ip_version=4, sol_threshold=0.01, geoloc
                                                                    landing_points_dict, latlon_dict, latlons,
                                                                    max_links_to_process=max_links_to_process_sol_validated,
                                                                    server_id=server_id,
-                                                                   mode=1, ip_version=ip_version)
+                                                                   mode=1, ip_version=ip_version, pair_index=pair_index,
+                                                                   neighbor_cache=neighbor_cache, workers=workers)
 
     return cable_mapping, cable_mapping_sol_validated
 
@@ -388,117 +618,234 @@ def get_load_all_cable_mapping_merged_output(mode=2, ip_version=4, suffix='defau
 
 
 def generate_reverse_landing_points_dict():
-    landing_points_dict, latlon_dict, latlons, tree = get_all_latlon_locations_ball_tree()
+    landing_points_dict = load_submarine_catalog().landing_points_dict
     return {v._replace(cable=tuple(v.cable)): k for k, v in landing_points_dict.items()}
 
 
+def generate_connected_landing_point_pairs(cable_to_connected_location_ids):
+    """
+    Converts the connected landing point id groups of each cable into a set of (smaller id, larger id) pairs, ie., a
+    pair of landing points is connected by a cable if both of them are in one of its groups
+    """
+    return {cable: frozenset((min(pair), max(pair)) for item in connected_location_ids for pair in
+                             combinations(set(item), 2)) for cable, connected_location_ids in
+            cable_to_connected_location_ids.items()}
+
+
 # Temporarily placing the loading cable to lp ids function here, will have to move this to the proper module
 def load_cable_to_lp_ids():
-    with open('stats/submarine_data/cable_to_connected_location_ids', 'rb') as fp:
-        cable_to_lp_ids = pickle.load(fp)
+    """
+    Output
+        A dictionary with the cable name as key and the set of connected landing point id pairs as value
+    """
+    catalog = load_submarine_catalog()
+    if catalog.cable_to_connected_location_ids is None:
+        print(f'{catalog.directory / "cable_to_connected_location_ids"} is missing, without it the landing points '
+              f'connectivity check cannot be done. Most likely the submarine files were not generated')
+        sys.exit(1)
 
-    return cable_to_lp_ids
+    return generate_connected_landing_point_pairs(catalog.cable_to_connected_location_ids)
 
 
-def get_landing_point_id_from_landing_points_list(landing_points_list, reverse_landing_points_dict):
-    landing_points_ids = []
-    for landing_point in landing_points_list:
-        landing_points_id = reverse_landing_points_dict.get(landing_point._replace(cable=tuple(landing_point.cable)),
-                                                            '')
-        landing_points_ids.append(landing_points_id)
-    return tuple(landing_points_ids)
+def check_if_landing_points_are_connected(lp_id, cable_connected_pairs):
+    return (min(lp_id), max(lp_id)) in cable_connected_pairs
 
 
-def assign_overall_score(score_tuple, weight_tuple, category):
-    if 'te' in category:
-        scale_factor = 0.5
-    else:
-        scale_factor = 1
+class CategoryCandidates:
+    """
+    All the cable mapping candidates of a category flattened into arrays, so that they can be scored and selected in
+    bulk for all the links of the category.
+    The checks that do not depend on the weights (the 2x distance check and the landing points connectivity check) are
+    done once, so the same instance can be used to evaluate several weights and thresholds.
+    Attributes
+        links -> Links of the category (in the cable mapping order)
+        group_cables, group_links -> Cable name and link index of every (link, cable) group
+        candidate_groups -> Group index of every candidate
+        candidates -> All the CANDIDATE_DTYPE records of the category
+        accepted -> True for the candidates that pass both the checks
+        last_candidate_res -> For every link, the result of the checks on its last candidate (a link without any
+                              selected cable is re-classified as definite terrestrial when it is True)
+    """
+
+    def __init__(self, category_cable_mapping, cable_to_lp_ids, category):
+        self.category = category
+        self.links = list(category_cable_mapping.keys())
+
+        self.group_cables, group_links, group_sizes, candidates = [], [], [], []
+        for link_index, scores_and_cables in enumerate(category_cable_mapping.values()):
+            for cable, cable_candidates in scores_and_cables.items():
+                self.group_cables.append(cable)
+                group_links.append(link_index)
+                group_sizes.append(len(cable_candidates))
+                candidates.append(cable_candidates)
+
+        self.group_links = np.array(group_links, dtype=np.int64)
+        self.candidate_groups = np.repeat(np.arange(len(self.group_cables)), group_sizes)
+        self.candidates = np.concatenate(candidates) if candidates else np.zeros(0, dtype=CANDIDATE_DTYPE)
+
+        self.scores_sum = self.candidates['scores'][:, 0] + self.candidates['scores'][:, 1]
+        self.distances_sum = self.candidates['distances'][:, 0] + self.candidates['distances'][:, 1]
+        self.owners_sum = self.candidates['owners'].astype(np.int64).sum(axis=1)
+
+        # If the landing points are way to far (ie., 2x times the actual distance between the IPs)
+        within_distance = ~(2 * self.get_ip_distances() < self.distances_sum)
+        connected = self.get_connected_landing_points(cable_to_lp_ids)
+        self.accepted = within_distance & connected
+
+        candidate_links = self.group_links[self.candidate_groups]
+        last_candidates = np.nonzero(np.append(candidate_links[1:] != candidate_links[:-1], True))[0] if len(
+            candidate_links) > 0 else np.zeros(0, dtype=np.int64)
+        self.last_candidate_res = np.zeros(len(self.links), dtype=bool)
+        self.last_candidate_res[candidate_links[last_candidates]] = (~within_distance | connected)[last_candidates]
+
+    def get_ip_distances(self):
+        # haversine is evaluated once per unique pair of IP locations
+        latlons, inverse = np.unique(self.candidates['latlon'].reshape(-1, 4), axis=0, return_inverse=True)
+        distances = np.array([haversine(latlon[:2], latlon[2:], unit=Unit.RADIANS) for latlon in latlons.tolist()],
+                             dtype=np.float64)
+        return distances[inverse.reshape(-1)]
+
+    def get_connected_landing_points(self, cable_to_lp_ids):
+        # Both landing points should be connected by the cable (cables without connectivity info are accepted),
+        # evaluated once per unique (cable, landing point ids)
+        cable_codes = {cable: code for code, cable in enumerate(dict.fromkeys(self.group_cables))}
+        cables = list(cable_codes.keys())
+        group_codes = np.array([cable_codes[cable] for cable in self.group_cables], dtype=np.int64)
+        keys = np.column_stack((group_codes[self.candidate_groups], self.candidates['landing_point_ids']))
+        keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+        connected = np.ones(len(keys), dtype=bool)
+        for index, (code, lp_id_1, lp_id_2) in enumerate(keys.tolist()):
+            try:
+                connected[index] = check_if_landing_points_are_connected((lp_id_1, lp_id_2),
+                                                                         cable_to_lp_ids[cables[code]])
+            except:
+                pass
+
+        return connected[inverse.reshape(-1)]
+
+    def compute_overall_scores(self, weight_tuple):
+        # The geolocation score, the reverse distance score (a distance score of 2 means both the points are 1000 km
+        # away) and the AS owner score, weighted and scaled down for terrestrial categories.
+        # A 2D array of weight tuples gives a row of scores per weight tuple
+        if 'te' in self.category:
+            scale_factor = 0.5
+        else:
+            scale_factor = 1
 
-    constant_factor = 0.5
+        constant_factor = 0.5
 
-    # score tuple
-    # 	0 -> IP geolocation
-    #	1 -> Landing points details
-    #	2 -> geolocation score (geolocation clustering score)
-    #	3 -> distance from IP geolocation to identified landing point
-    #	4 -> as owner scores
+        weights = np.asarray(weight_tuple, dtype=np.float64)[..., None]
 
-    geolocation_score = sum(score_tuple[2]) * weight_tuple[0]
+        geolocation_score = self.scores_sum * weights[..., 0, :]
+        distance_score = self.distances_sum / (1000 / 6371)
+        reverse_distance_score = (2 - distance_score) * weights[..., 1, :]
+        as_owner_score = self.owners_sum * weights[..., 2, :]
 
-    # Distance score should be ideally 0, so that we get reverse distance score of 2
-    # Worse case we get distance score of 2, which implies both the points are 1000 km away
-    distance_score = sum(score_tuple[3]) / (1000 / 6371)
-    reverse_distance_score = (2 - distance_score) * weight_tuple[1]
+        return (geolocation_score + reverse_distance_score + as_owner_score) * constant_factor * scale_factor
 
-    as_owner_score = sum(score_tuple[4]) * weight_tuple[2]
+    def select_cables(self, weight_tuple=(0.5, 0.4, 0.1), threshold=0.05):
+        """
+        Output
+            A list with (cables, de_te_added) for every link, where cables is {cable: [(landing_point_ids, score)]}
+            sorted by the max score of each cable and de_te_added is 1 if the link is re-classified as definite
+            terrestrial
+        """
+        overall_scores = self.compute_overall_scores(weight_tuple)
 
-    # Check to help with re-classification of link to definite terrestrial
-    # If the landing points are way to far (ie., 2x times the actual distance between the IPs)
-    if 2 * haversine(score_tuple[0][0], score_tuple[0][1], unit=Unit.RADIANS) < sum(score_tuple[3]):
-        return None
-    else:
-        return (
-            score_tuple[1],
-            (geolocation_score + reverse_distance_score + as_owner_score) * constant_factor * scale_factor)
-
-
-def select_cables_for_given_link(link, scores_and_cables, weight_tuple, de_te_additions, cable_to_lp_ids, category,
-                                 reverse_landing_points_dict, threshold=0.05):
-    """检查映射出的登陆站是否相连"""
-    ret_dict = {}
-
-    # de_te_additions to take note of all links that are getting re-classified as definite terrestrial
-
-    # This means we haven't been able to map to any cable
-    if len(scores_and_cables) == 0:
-        return {}, 0
-
-    # Let's examine all the predicted cables
-    for cable, score_tuples in scores_and_cables.items():
-        scores = []
-        for score_tuple in score_tuples:
-            score_for_tuple = assign_overall_score(score_tuple, weight_tuple, category)
-            res = True
-            if score_for_tuple:
-                lp_id = get_landing_point_id_from_landing_points_list(score_for_tuple[0], reverse_landing_points_dict)
-                try:
-                    cable_connected_points = cable_to_lp_ids[cable]
-                    # Check to see if both the landing points are connected
-                    res = any(len(set(lp_id) & set(item)) == 2 for item in cable_connected_points)
-                except:
-                    pass
-                if res:
-                    score_for_tuple = (lp_id, score_for_tuple[-1])
-                    scores.append(score_for_tuple)
-
-        if len(scores) > 0:
-            max_score = max(scores, key=lambda x: x[1])
-            # Checking if other selections are within the threshold
-            ret_cable_scores = [item for item in sorted(scores, key=lambda x: x[1], reverse=True) if
-                                (max_score[1] - item[1]) <= max_score[1] * threshold]
-            ret_dict[cable] = ret_cable_scores
-
-    if len(ret_dict) > 0:
-        return {k: v for k, v in sorted(ret_dict.items(), key=lambda item: item[1][0][1], reverse=True)}, 0
-    else:
-        if res == True:
-            de_te_additions.append(link)
-            return {}, 1
-        return {}, 0
+        accepted = np.nonzero(self.accepted)[0]
+        groups = self.candidate_groups[accepted]
+        scores = overall_scores[accepted]
+
+        # Checking if other selections are within the threshold of the max score of the cable
+        group_max_scores = np.full(len(self.group_cables), -np.inf)
+        np.maximum.at(group_max_scores, groups, scores)
+        selected = (group_max_scores[groups] - scores) <= group_max_scores[groups] * threshold
+
+        accepted, groups, scores = accepted[selected], groups[selected], scores[selected]
+        # lexsort is stable, so ties keep the candidate order as in sorted(..., reverse=True)
+        order = np.lexsort((-scores, groups))
+
+        link_cables = [{} for _ in self.links]
+        for group, lp_ids, score in zip(groups[order].tolist(),
+                                        self.candidates['landing_point_ids'][accepted[order]].tolist(),
+                                        scores[order].tolist()):
+            link_cables[self.group_links[group]].setdefault(self.group_cables[group], []).append(
+                (tuple(lp_ids), score))
 
+        has_candidates = np.zeros(len(self.links), dtype=bool)
+        has_candidates[self.group_links] = True
 
-def generate_final_mapping_helper(cable_mapping, de_te_additions, cable_to_lp_ids, reverse_landing_points_dict,
-                                  threshold=0.05):
+        selections = []
+        for link_index, cables in enumerate(link_cables):
+            if len(cables) > 0:
+                selections.append(
+                    ({k: v for k, v in sorted(cables.items(), key=lambda item: item[1][0][1], reverse=True)}, 0))
+            elif has_candidates[link_index] and self.last_candidate_res[link_index]:
+                selections.append(({}, 1))
+            else:
+                selections.append(({}, 0))
+
+        return selections
+
+    def evaluate_weight_tuples(self, weight_tuples, threshold=0.05):
+        """
+        Does the selection of select_cables and generate_final_mapping_helper for all the weight tuples at once, but
+        only keeps what the sweep summaries need (row i is for weight_tuples[i], column j for self.links[j])
+        Output
+            (has_cables, top_scores, selected_cables_counts, de_te_added), where top_scores is the overall max score
+            of the link and selected_cables_counts the number of cables within the threshold of it
+        """
+        number_of_groups = len(self.group_cables)
+        overall_scores = self.compute_overall_scores(weight_tuples)
+        rows = np.arange(len(overall_scores))[:, None]
+
+        accepted = np.nonzero(self.accepted)[0]
+        groups = self.candidate_groups[accepted]
+        scores = overall_scores[:, accepted]
+
+        # Checking if other selections are within the threshold of the max score of the cable (per weight tuple)
+        group_max_scores = np.full((len(scores), number_of_groups), -np.inf)
+        np.maximum.at(group_max_scores, (rows, groups[None, :]), scores)
+        selected = (group_max_scores[:, groups] - scores) <= group_max_scores[:, groups] * threshold
+
+        # Max score of the selected landing points of every cable, the cable is not kept if none were selected
+        group_top_scores = np.full((len(scores), number_of_groups), -np.inf)
+        np.maximum.at(group_top_scores, (rows, groups[None, :]), np.where(selected, scores, -np.inf))
+
+        top_scores = np.full((len(scores), len(self.links)), -np.inf)
+        np.maximum.at(top_scores, (rows, self.group_links[None, :]), group_top_scores)
+        has_cables = top_scores > -np.inf
+        top_scores = np.where(has_cables, top_scores, 0)
+
+        # Pruning the cables based on the overall max score of the link
+        kept_groups = group_top_scores > -np.inf
+        group_top_scores = np.where(kept_groups, group_top_scores, 0)
+        link_top_scores = top_scores[:, self.group_links]
+        kept_groups &= (link_top_scores - group_top_scores) <= link_top_scores * threshold
+        selected_cables_counts = np.zeros((len(scores), len(self.links)), dtype=np.int64)
+        np.add.at(selected_cables_counts, (rows, self.group_links[None, :]), kept_groups)
+
+        has_candidates = np.zeros(len(self.links), dtype=bool)
+        has_candidates[self.group_links] = True
+        de_te_added = ~has_cables & (has_candidates & self.last_candidate_res)
+
+        return has_cables, top_scores, selected_cables_counts, de_te_added
+
+
+def generate_final_mapping_helper(cable_mapping, de_te_additions, cable_to_lp_ids, threshold=0.05,
+                                  weight_tuple=(0.5, 0.4, 0.1)):
     link_to_cable_and_score_mapping = {}
 
     for category, category_cable_mapping in cable_mapping.items():
         print(f'Currenlty processing {category}')
-        for count, (link, scores_and_cables) in enumerate(category_cable_mapping.items()):
-            # Getting the scores dict
-            cables, de_te_added = select_cables_for_given_link(link, scores_and_cables, (0.5, 0.4, 0.1),
-                                                               de_te_additions, cable_to_lp_ids, category,
-                                                               reverse_landing_points_dict, threshold=threshold)
+        # Getting the scores dict for all the links of the category at once
+        category_candidates = CategoryCandidates(category_cable_mapping, cable_to_lp_ids, category)
+        selections = category_candidates.select_cables(weight_tuple, threshold=threshold)
+
+        for count, (link, (cables, de_te_added)) in enumerate(zip(category_candidates.links, selections)):
+            if de_te_added == 1:
+                de_te_additions.append(link)
 
             if len(cables) > 0:
                 # Earlier we selected all cables where each landing point was within 0.05 of that particular cable's max value
@@ -546,6 +893,84 @@ def generate_final_mapping_helper(cable_mapping, de_te_additions, cable_to_lp_id
     return link_to_cable_and_score_mapping
 
 
+def sweep_final_mapping(weight_tuples, thresholds, mode=1, ip_version=4, suffix='default'):
+    """
+    Evaluates a grid of weights and thresholds for the final mapping. The merged cable mapping is loaded once, the
+    weight independent checks on the candidates are done once per category, and all the weight tuples are scored
+    together on the candidate arrays, with one vectorized selection per threshold (no per link loop per setting).
+    :param mode: 0 - Only geolocation, 1 - SoL validated geolocation, 2 - Both
+    Output
+        A dictionary with the mode (0/1) as key and a dictionary of (weight_tuple, threshold) to the summary of the
+        link_to_cable_and_score_mapping generate_final_mapping_helper would give for that setting as value
+    """
+    save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
+
+    cable_mapping, cable_mapping_sol_validated = get_load_all_cable_mapping_merged_output(mode=mode,
+                                                                                          ip_version=ip_version, suffix=suffix)
+
+    cable_to_lp_ids = load_cable_to_lp_ids()
+
+    weight_tuples = [tuple(weight_tuple) for weight_tuple in weight_tuples]
+
+    sweep_results = {}
+
+    for current_mode, current_cable_mapping in [(0, cable_mapping), (1, cable_mapping_sol_validated)]:
+        if mode not in [current_mode, 2]:
+            continue
+
+        # A link can be in several categories, in which case (as in the mapping dictionary) the last one wins
+        link_ids = {}
+        category_candidates_and_ids = []
+        for category, category_cable_mapping in current_cable_mapping.items():
+            print(f'Currenlty processing {category}')
+            category_candidates = CategoryCandidates(category_cable_mapping, cable_to_lp_ids, category)
+            ids = np.array([link_ids.setdefault(link, len(link_ids)) for link in category_candidates.links],
+                           dtype=np.int64)
+            category_candidates_and_ids.append((category_candidates, ids))
+
+        mode_results = {}
+        for threshold in thresholds:
+            in_mapping = np.zeros((len(weight_tuples), len(link_ids)), dtype=bool)
+            has_cables = np.zeros((len(weight_tuples), len(link_ids)), dtype=bool)
+            top_scores = np.zeros((len(weight_tuples), len(link_ids)))
+            selected_cables_counts = np.zeros((len(weight_tuples), len(link_ids)), dtype=np.int64)
+            de_te_additions = np.zeros(len(weight_tuples), dtype=np.int64)
+
+            for category_candidates, ids in category_candidates_and_ids:
+                category_results = category_candidates.evaluate_weight_tuples(weight_tuples, threshold)
+                category_has_cables, category_top_scores, category_selected_cables_counts, de_te_added = \
+                    category_results
+                de_te_additions += de_te_added.sum(axis=1)
+
+                # The links re-classified as definite terrestrial are not added to the mapping
+                kept = ~de_te_added
+                in_mapping[:, ids] |= kept
+                has_cables[:, ids] = np.where(kept, category_has_cables, has_cables[:, ids])
+                top_scores[:, ids] = np.where(kept, category_top_scores, top_scores[:, ids])
+                selected_cables_counts[:, ids] = np.where(kept, category_selected_cables_counts,
+                                                          selected_cables_counts[:, ids])
+
+            for row, weight_tuple in enumerate(weight_tuples):
+                links = int(in_mapping[row].sum())
+                mapped_links = int(has_cables[row].sum())
+                summary = {'links': links, 'mapped_links': mapped_links,
+                           'coverage': mapped_links / links if links > 0 else 0,
+                           'mean_score': float(top_scores[row][has_cables[row]].sum()) / mapped_links if
+                           mapped_links > 0 else 0,
+                           'mean_selected_cables': int(selected_cables_counts[row].sum()) / mapped_links if
+                           mapped_links > 0 else 0,
+                           'de_te_additions': int(de_te_additions[row])}
+                mode_results[(weight_tuple, threshold)] = summary
+
+                print(f'Mode {current_mode}, weights {weight_tuple}, threshold {threshold} : {summary}')
+
+        sweep_results[current_mode] = mode_results
+
+    save_results_to_file(sweep_results, str(save_directory), 'final_mapping_sweep_v{}'.format(ip_version))
+
+    return sweep_results
+
+
 def generate_final_mapping(mode=2, ip_version=4, threshold=0.05, suffix='default'):
     save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
 
@@ -556,15 +981,12 @@ def generate_final_mapping(mode=2, ip_version=4, threshold=0.05, suffix='default
     # Loading the cable to connected landing points dict
     cable_to_lp_ids = load_cable_to_lp_ids()
 
-    reverse_landing_points_dict = generate_reverse_landing_points_dict()
-
     de_te_additions, de_te_additions_sol_validated = [], []
 
     link_to_cable_and_score_mapping, link_to_cable_and_score_mapping_sol_validated = {}, {}
 
     if mode in [0, 2]:
         link_to_cable_and_score_mapping = generate_final_mapping_helper(cable_mapping, de_te_additions, cable_to_lp_ids,
-                                                                        reverse_landing_points_dict,
                                                                         threshold=threshold)
         save_results_to_file(link_to_cable_and_score_mapping, str(save_directory),
                              'link_to_cable_and_score_mapping_v{}'.format(ip_version))
@@ -577,7 +999,6 @@ def generate_final_mapping(mode=2, ip_version=4, threshold=0.05, suffix='default
         link_to_cable_and_score_mapping_sol_validated = generate_final_mapping_helper(cable_mapping_sol_validated,
                                                                                       de_te_additions_sol_validated,
                                                                                       cable_to_lp_ids,
-                                                                                      reverse_landing_points_dict,
                                                                                       threshold=threshold)
         save_results_to_file(link_to_cable_and_score_mapping_sol_validated, str(save_directory),
                              'link_to_cable_and_score_mapping_sol_validated_v{}'.format(ip_version))
@@ -597,15 +1018,12 @@ def generate_final_mapping_test(cable_mapping, cable_mapping_sol_validated, mode
     # Loading the cable to connected landing points dict
     cable_to_lp_ids = load_cable_to_lp_ids()
 
-    reverse_landing_points_dict = generate_reverse_landing_points_dict()
-
     de_te_additions, de_te_additions_sol_validated = [], []
 
     link_to_cable_and_score_mapping, link_to_cable_and_score_mapping_sol_validated = {}, {}
 
     if mode in [0, 2]:
         link_to_cable_and_score_mapping = generate_final_mapping_helper(cable_mapping, de_te_additions, cable_to_lp_ids,
-                                                                        reverse_landing_points_dict,
                                                                         threshold=threshold)
         save_results_to_file(link_to_cable_and_score_mapping, str(save_directory),
                              'link_to_cable_and_score_mapping_v{}'.format(ip_version))
@@ -618,7 +1036,6 @@ def generate_final_mapping_test(cable_mapping, cable_mapping_sol_validated, mode
         link_to_cable_and_score_mapping_sol_validated = generate_final_mapping_helper(cable_mapping_sol_validated,
                                                                                       de_te_additions_sol_validated,
                                                                                       cable_to_lp_ids,
-                                                                                      reverse_landing_points_dict,
                                                                                       threshold=threshold)
         save_results_to_file(link_to_cable_and_score_mapping_sol_validated, str(save_directory),
                              'link_to_cable_and_score_mapping_sol_validated_v{}'.format(ip_version))
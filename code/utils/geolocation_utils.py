@@ -1,20 +1,22 @@
 import pickle, json, itertools
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from pathlib import Path
 
 import os, sys
+import hashlib, multiprocessing, shutil
 
-from code.utils.merge_data import common_merge_operation, save_results_to_file
+from code.utils.merge_data import common_merge_operation, save_results_to_file, save_results_to_file_atomically, \
+    write_file_atomically
 from code.utils.traceroute_utils import load_all_links_and_ips_data
+from code.submarine.telegeography_submarine import load_submarine_catalog
+from code.traceroute.geolocation_latency_based_validation_common_utils import load_geolocation_store
+from code.utils.reverse_geocode_utils import get_country_to_continent_map, get_country_alpha_to_digit, \
+    get_reverse_geocoder
 
 from sklearn.cluster import DBSCAN
 import numpy as np
 from sklearn.neighbors import BallTree
 
-import pycountry
-import pycountry_convert as pc
-
-import reverse_geocode
 from collections import Counter
 
 import geopandas as gpd
@@ -113,50 +115,39 @@ def load_all_probe_ip_to_locations():
         sys.exit(1)
 
 
-def get_latitude_longitude_info_for_all_ips_only_geolocation_sources(all_ips, ripe_location_dict, caida_location_dict,
-                                                                     maxmind_location_dict, iplocation_dict):
+def get_latitude_longitude_info_for_all_ips_only_geolocation_sources(all_ips, geolocation_store, chunk_size=1000000):
     ip_to_latlon_dict = {}
 
-    ripe_missed, maxmind_missed, iplocation_missed = 0, 0, [0] * 8
+    # The locations of an IP are ordered as RIPE, CAIDA, Maxmind and then the IPlocation sources
+    source_order = [9, 10, 8, 0, 1, 2, 3, 4, 5, 6, 7]
 
-    for ip in all_ips:
-        ip_result = []
+    all_ips = list(all_ips)
+    ip_ids = geolocation_store.get_ip_ids(all_ips)
 
-        ripe_val = ripe_location_dict.get(ip, None)
-        if ripe_val:
-            try:
-                ripe_latlon = (float(ripe_val[-3]), float(ripe_val[-2]))
-                ip_result.append(ripe_latlon)
-            except:
-                ripe_missed += 1
-                pass
+    # Results that were there, but whose coordinates could not be parsed
+    missed = np.zeros(len(source_order), dtype=np.int64)
 
-        caida_val = caida_location_dict.get(ip, None)
-        if caida_val:
-            caida_latlon = (float(caida_val[-3]), float(caida_val[-2]))
-            ip_result.append(caida_latlon)
+    for start in range(0, len(all_ips), chunk_size):
+        chunk_ips = all_ips[start: start + chunk_size]
+        chunk_ip_ids = ip_ids[start: start + chunk_size]
+        known = chunk_ip_ids >= 0
+        rows = chunk_ip_ids[known]
 
-        maxmind_val = maxmind_location_dict.get(ip, None)
-        if maxmind_val:
-            try:
-                maxmind_latlon = (float(maxmind_val.latitude), float(maxmind_val.longitude))
-                ip_result.append(maxmind_latlon)
-            except:
-                maxmind_missed += 1
-                pass
+        valid = np.asarray(geolocation_store.valid[rows])[:, source_order]
+        missed += (np.asarray(geolocation_store.present[rows])[:, source_order] & ~valid).sum(axis=0)
 
-        iplocation_val = iplocation_dict.get(ip, None)
-        if iplocation_val:
-            for index, item in enumerate(iplocation_val):
-                try:
-                    iplocation_latlon = (float(item.latitude.decode()), float(item.longitude.decode()))
-                    ip_result.append(iplocation_latlon)
-                except:
-                    iplocation_missed[index] += 1
-                    pass
+        latitudes = np.asarray(geolocation_store.latitudes[rows])[:, source_order].tolist()
+        longitudes = np.asarray(geolocation_store.longitudes[rows])[:, source_order].tolist()
 
-        if len(ip_result) > 0:
-            ip_to_latlon_dict[ip] = ip_result
+        for ip, ip_valid, ip_latitudes, ip_longitudes in zip(itertools.compress(chunk_ips, known.tolist()),
+                                                             valid.tolist(), latitudes, longitudes):
+            ip_result = [(latitude, longitude) for is_valid, latitude, longitude in
+                         zip(ip_valid, ip_latitudes, ip_longitudes) if is_valid]
+
+            if len(ip_result) > 0:
+                ip_to_latlon_dict[ip] = ip_result
+
+    ripe_missed, maxmind_missed, iplocation_missed = int(missed[0]), int(missed[2]), missed[3:].tolist()
 
     print(
         f'Due to errors, we missed \n\t{ripe_missed} IPs from RIPE\n\t{maxmind_missed} IPs from Maxmind\n\t{iplocation_missed} IPs from IPlocation')
@@ -221,19 +212,17 @@ def get_latitude_longitude_info_for_all_ips(all_ips, ip_version=4, mode=2, thres
     ip_to_latlon_dict_geolocation, ip_to_latlon_dict_sol, ip_to_latlon_dict_negative_sol = {}, {}, {}
 
     if mode in [0, 2]:
-        ripe_location_dict, caida_location_dict, maxmind_location_dict, iplocation_dict = load_all_geolocation_sources(
-            ip_version, suffix)
-        ip_to_latlon_dict_geolocation = get_latitude_longitude_info_for_all_ips_only_geolocation_sources(all_ips,
-                                                                                                         ripe_location_dict,
-                                                                                                         caida_location_dict,
-                                                                                                         maxmind_location_dict,
-                                                                                                         iplocation_dict)
+        try:
+            geolocation_store = load_geolocation_store(ip_version, suffix)
+        except Exception as e:
+            print(f'Most likely the required files were not generated. We got the error: {str(e)}')
+            sys.exit(1)
+
+        ip_to_latlon_dict_geolocation = get_latitude_longitude_info_for_all_ips_only_geolocation_sources(
+            all_ips, geolocation_store)
 
         # Deleting processed sources to save memory
-        del (ripe_location_dict)
-        del (caida_location_dict)
-        del (maxmind_location_dict)
-        del (iplocation_dict)
+        del (geolocation_store)
 
         # Irrespective of the source, lets make the probe locations to be as seen from original RIPE probe data
         ip_to_latlon_dict_geolocation.update(ripe_ip_to_location_dict)
@@ -281,7 +270,253 @@ def cluster_locations(locations_list):
     return get_cluster_as_list(cluster, locations_list)
 
 
-def generate_latlon_cluster_and_score_map(all_ips, ip_version=4, mode=2, threshold=0.01, suffix='default'):
+def cluster_locations_batch(list_of_locations_list, eps=100 / 6371., batch_size=20000):
+    """
+    Batched equivalent of cluster_locations for many IPs at once. The locations of each IP are padded into a 3-D array
+    and all the pairwise haversine distances are computed together. With min_samples=1 the DBSCAN clusters are the
+    connected components of the points within eps of each other, labelled in the order of their first point.
+    Output
+        A list of (con_cluster, len_cluster) for each of the given locations list (same as cluster_locations)
+    """
+    # Same reduced haversine distance (and reduced eps) as used by the sklearn BallTree queries
+    reduced_eps = np.sin(0.5 * eps) * np.sin(0.5 * eps)
+
+    results = []
+    for start in range(0, len(list_of_locations_list), batch_size):
+        batch = list_of_locations_list[start: start + batch_size]
+        sizes = np.array([len(locations_list) for locations_list in batch])
+        max_size = sizes.max()
+
+        points = np.zeros((len(batch), max_size, 2))
+        for index, locations_list in enumerate(batch):
+            points[index, :len(locations_list)] = locations_list
+        points = np.radians(points)
+        valid = np.arange(max_size)[None, :] < sizes[:, None]
+
+        lat, lon = points[:, :, 0], points[:, :, 1]
+        sin_0 = np.sin(0.5 * (lat[:, :, None] - lat[:, None, :]))
+        sin_1 = np.sin(0.5 * (lon[:, :, None] - lon[:, None, :]))
+        reduced_distances = sin_0 * sin_0 + np.cos(lat)[:, :, None] * np.cos(lat)[:, None, :] * sin_1 * sin_1
+        adjacency = (reduced_distances <= reduced_eps) & valid[:, :, None] & valid[:, None, :]
+
+        # Propagating the smallest point index through each connected component
+        labels = np.broadcast_to(np.arange(max_size), (len(batch), max_size)).copy()
+        while True:
+            new_labels = np.where(adjacency, labels[:, None, :], max_size).min(axis=2)
+            new_labels = np.minimum(new_labels, labels)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+        # Components are numbered in the order of their first point
+        ranks = np.cumsum(labels == np.arange(max_size)[None, :], axis=1) - 1
+        clusters = np.take_along_axis(ranks, labels, axis=1)
+
+        for index, locations_list in enumerate(batch):
+            results.append(get_cluster_as_list(clusters[index, :sizes[index]].tolist(), locations_list))
+
+    return results
+
+
+class GeolocationClusterCache:
+    """
+    Per IP cache of the clusters and the country/continent results that persists across runs (ie., across suffixes).
+    Every entry stores a hash of the inputs it was computed from (the IP's coordinates and whether they passed the SoL
+    test), so it is only re-used while the inputs of the IP are unchanged.
+    Each namespace is saved in its own file, loaded only when first used and re-written only when it got new entries.
+    A namespace keeps at most max_entries IPs, the least recently used ones are dropped when saving.
+    """
+
+    def __init__(self, ip_version=4, directory=root_dir / 'stats/geolocation_cluster_cache', max_entries=2000000):
+        self.directory = Path(directory)
+        self.ip_version = ip_version
+        self.max_entries = max_entries
+        self.entries = {}
+        self.updated_namespaces = set()
+        self.hits, self.misses = Counter(), Counter()
+
+    def get_save_file(self, namespace):
+        return 'geolocation_cluster_cache_v{}_{}'.format(self.ip_version, namespace)
+
+    def get_entries(self, namespace):
+        if namespace not in self.entries:
+            self.entries[namespace] = OrderedDict()
+            if Path(self.directory / self.get_save_file(namespace)).is_file():
+                with open(self.directory / self.get_save_file(namespace), 'rb') as fp:
+                    self.entries[namespace] = pickle.load(fp)
+        return self.entries[namespace]
+
+    @staticmethod
+    def get_digest(*inputs):
+        return hashlib.sha1(pickle.dumps(inputs)).hexdigest()
+
+    def get(self, namespace, ip, digest):
+        entries = self.get_entries(namespace)
+        entry = entries.get(ip)
+        if entry and entry[0] == digest:
+            self.hits[namespace] += 1
+            entries.move_to_end(ip)
+            return entry[1]
+        self.misses[namespace] += 1
+        return None
+
+    def put(self, namespace, ip, digest, value):
+        entries = self.get_entries(namespace)
+        entries[ip] = (digest, value)
+        entries.move_to_end(ip)
+        self.updated_namespaces.add(namespace)
+
+    def report(self, namespace):
+        total = self.hits[namespace] + self.misses[namespace]
+        if total > 0:
+            print(f'Geolocation cluster cache ({namespace}): {self.hits[namespace]} hits and '
+                  f'{self.misses[namespace]} misses (hit ratio : {self.hits[namespace] / total:.2f})')
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for namespace in sorted(self.updated_namespaces):
+            entries = self.entries[namespace]
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            save_results_to_file(entries, str(self.directory), self.get_save_file(namespace))
+        self.updated_namespaces.clear()
+
+
+# Read only inputs for the clustering worker processes, inherited (copy on write) when the pool is forked
+_latlon_cluster_shared_state = {}
+
+
+def _cluster_and_checkpoint_chunk(chunk_index):
+    state = _latlon_cluster_shared_state
+    start = chunk_index * state['chunk_size']
+    chunk_clusters = cluster_locations_batch(state['locations_to_cluster'][start: start + state['chunk_size']])
+    save_results_to_file_atomically(chunk_clusters, str(state['checkpoint_directory']), 'chunk_{}'.format(chunk_index))
+    return chunk_index
+
+
+def load_chunk_checkpoint(checkpoint_directory, chunk_index, expected_length):
+    """
+    Loads a chunk checkpoint, returns None if it is missing, unreadable or not of the expected length
+    """
+    try:
+        with open(checkpoint_directory / 'chunk_{}'.format(chunk_index), 'rb') as fp:
+            chunk_clusters = pickle.load(fp)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError) as e:
+        print(f'Could not load the checkpoint of chunk {chunk_index} ({e!r})')
+        return None
+
+    if len(chunk_clusters) != expected_length:
+        print(f'Checkpoint of chunk {chunk_index} has {len(chunk_clusters)} entries instead of {expected_length}')
+        return None
+
+    return chunk_clusters
+
+
+def generate_latlon_cluster_input_fingerprint(ips_to_cluster, locations_to_cluster, penalties, chunk_size=100000):
+    fingerprint = hashlib.sha256()
+    for start in range(0, len(ips_to_cluster), chunk_size):
+        fingerprint.update(pickle.dumps((ips_to_cluster[start: start + chunk_size],
+                                         locations_to_cluster[start: start + chunk_size],
+                                         penalties[start: start + chunk_size])))
+    return fingerprint.hexdigest()
+
+
+def build_latlon_cluster_and_score_map(ips_to_cluster, locations_to_cluster, penalties, save_directory, save_file,
+                                       workers=1, chunk_size=100000, cluster_cache=None, cache_namespace='clusters'):
+    """
+    Clusters the locations of the given IPs in chunks (in parallel when workers > 1) and saves the map to save_file.
+    Every finished chunk is checkpointed (written atomically), so a crashed run resumes from the remaining chunks (as
+    long as it has the same IPs to cluster), and an unreadable checkpoint is clustered again. A fingerprint of the
+    inputs is saved next to the map (after it), and the saved map is re-used as long as the inputs are unchanged.
+    With a cluster_cache, only the IPs whose inputs changed since an earlier run (of any suffix) are clustered.
+    Output
+        {ip: (con_cluster, len_cluster, penalty)}
+    """
+    fingerprint = generate_latlon_cluster_input_fingerprint(ips_to_cluster, locations_to_cluster, penalties, chunk_size)
+    fingerprint_file = save_directory / '{}_fingerprint'.format(save_file)
+
+    if Path(save_directory / save_file).is_file() and fingerprint_file.is_file():
+        if fingerprint_file.read_text() == fingerprint:
+            print(f'Inputs unchanged, directly loading the saved file contents')
+            with open(save_directory / save_file, 'rb') as fp:
+                return pickle.load(fp)
+
+    clusters = [None] * len(ips_to_cluster)
+    digests = []
+    if cluster_cache is not None:
+        digests = [cluster_cache.get_digest(locations_list, penalty) for locations_list, penalty in
+                   zip(locations_to_cluster, penalties)]
+        clusters = [cluster_cache.get(cache_namespace, ip, digest) for ip, digest in zip(ips_to_cluster, digests)]
+        cluster_cache.report(cache_namespace)
+    indices_to_cluster = [index for index, value in enumerate(clusters) if value is None]
+
+    # The chunks are made of the cache misses, which depend on the cache at the time, so the checkpoints are only
+    # re-used for the very same misses
+    misses_fingerprint = generate_latlon_cluster_input_fingerprint(
+        [ips_to_cluster[index] for index in indices_to_cluster],
+        [locations_to_cluster[index] for index in indices_to_cluster],
+        [penalties[index] for index in indices_to_cluster], chunk_size)
+    checkpoint_directory = save_directory / '{}_checkpoints_{}'.format(save_file, misses_fingerprint[:16])
+    checkpoint_directory.mkdir(parents=True, exist_ok=True)
+
+    number_of_chunks = (len(indices_to_cluster) + chunk_size - 1) // chunk_size
+    remaining_chunks = [chunk_index for chunk_index in range(number_of_chunks) if
+                        not (checkpoint_directory / 'chunk_{}'.format(chunk_index)).is_file()]
+
+    print(f'Clustering {len(indices_to_cluster)} IPs in {number_of_chunks} chunks '
+          f'({number_of_chunks - len(remaining_chunks)} already checkpointed)')
+
+    _latlon_cluster_shared_state.update(
+        {'locations_to_cluster': [locations_to_cluster[index] for index in indices_to_cluster],
+         'chunk_size': chunk_size, 'checkpoint_directory': checkpoint_directory})
+    try:
+        if workers > 1 and len(remaining_chunks) > 1:
+            with multiprocessing.get_context('fork').Pool(min(workers, len(remaining_chunks))) as pool:
+                for chunk_index in pool.imap_unordered(_cluster_and_checkpoint_chunk, remaining_chunks):
+                    print(f'Finished chunk {chunk_index}')
+        else:
+            for chunk_index in remaining_chunks:
+                _cluster_and_checkpoint_chunk(chunk_index)
+
+        for chunk_index in range(number_of_chunks):
+            start = chunk_index * chunk_size
+            chunk_indices = indices_to_cluster[start: start + chunk_size]
+            chunk_clusters = load_chunk_checkpoint(checkpoint_directory, chunk_index, len(chunk_indices))
+            # A checkpoint left broken by an earlier crash is clustered again instead of failing every later run
+            if chunk_clusters is None:
+                print(f'Re-clustering chunk {chunk_index}')
+                _cluster_and_checkpoint_chunk(chunk_index)
+                chunk_clusters = load_chunk_checkpoint(checkpoint_directory, chunk_index, len(chunk_indices))
+            for index, value in zip(chunk_indices, chunk_clusters):
+                clusters[index] = value
+                if cluster_cache is not None:
+                    cluster_cache.put(cache_namespace, ips_to_cluster[index], digests[index], value)
+    finally:
+        _latlon_cluster_shared_state.clear()
+
+    latlon_cluster_and_score_map = {}
+    for ip, (con_cluster, len_cluster), penalty in zip(ips_to_cluster, clusters, penalties):
+        latlon_cluster_and_score_map[ip] = (con_cluster, len_cluster, penalty)
+
+    # The map goes first, a crash between the two writes leaves a stale fingerprint and the map is rebuilt
+    if len(latlon_cluster_and_score_map) > 0:
+        save_results_to_file_atomically(latlon_cluster_and_score_map, str(save_directory), save_file)
+        write_file_atomically(fingerprint_file, fingerprint.encode())
+
+    shutil.rmtree(checkpoint_directory)
+
+    return latlon_cluster_and_score_map
+
+
+def generate_latlon_cluster_and_score_map(all_ips, ip_version=4, mode=2, threshold=0.01, suffix='default', workers=1,
+                                          cluster_cache=None):
+    """
+    :param cluster_cache: GeolocationClusterCache to consult (and update), a new one is loaded and saved if not given
+    """
+    save_cluster_cache = cluster_cache is None
+    if cluster_cache is None:
+        cluster_cache = GeolocationClusterCache(ip_version)
+
     geolocation_latlon_cluster_and_score_map = {}
     geolocation_latlon_cluster_and_score_map_sol_validated = {}
 
@@ -293,7 +528,9 @@ def generate_latlon_cluster_and_score_map(all_ips, ip_version=4, mode=2, thresho
 
         save_file = 'geolocation_latlon_cluster_and_score_map_v{}'.format(ip_version)
 
-        if Path(save_directory / save_file).is_file():
+        # Files saved before the input fingerprints were added are loaded as is
+        if Path(save_directory / save_file).is_file() and not Path(
+                save_directory / '{}_fingerprint'.format(save_file)).is_file():
 
             print(f'Directly loading the saved file contents')
             with open(save_directory / save_file, 'rb') as fp:
@@ -306,16 +543,16 @@ def generate_latlon_cluster_and_score_map(all_ips, ip_version=4, mode=2, thresho
 
             if len(ip_to_latlon_dict_geolocation) > 0:
 
-                for count, ip in enumerate(all_ips):
-                    locations_list = ip_to_latlon_dict_geolocation.get(ip, None)
-                    if locations_list:
-                        con_cluster, len_cluster = cluster_locations(locations_list)
-                        geolocation_latlon_cluster_and_score_map[ip] = (con_cluster, len_cluster, 0)
+                ips_to_cluster = [ip for ip in all_ips if ip_to_latlon_dict_geolocation.get(ip, None)]
+
+                geolocation_latlon_cluster_and_score_map = build_latlon_cluster_and_score_map(
+                    ips_to_cluster, [ip_to_latlon_dict_geolocation[ip] for ip in ips_to_cluster],
+                    [0] * len(ips_to_cluster), save_directory, save_file, workers=workers,
+                    cluster_cache=cluster_cache, cache_namespace='clusters')
 
                 if len(geolocation_latlon_cluster_and_score_map) > 0:
                     print(
                         f'We have clusters and scores (geolocation) for {len(geolocation_latlon_cluster_and_score_map)} IPs')
-                    save_results_to_file(geolocation_latlon_cluster_and_score_map, str(save_directory), save_file)
 
                 # Deleting finished ones to save memory
                 del (ip_to_latlon_dict_geolocation)
@@ -325,15 +562,6 @@ def generate_latlon_cluster_and_score_map(all_ips, ip_version=4, mode=2, thresho
 
         save_file = 'geolocation_latlon_cluster_and_score_map_sol_validated_v{}'.format(ip_version)
 
-        # TODO - Need to check if the file is already present and load it
-        # if Path(save_directory / save_file).is_file():
-        #
-        #     print(f'Directly loading the saved file contents')
-        #     with open(save_directory / save_file, 'rb') as fp:
-        #         geolocation_latlon_cluster_and_score_map_sol_validated = pickle.load(fp)
-
-        # else:
-
         _, ip_to_latlon_dict_sol, ip_to_latlon_dict_negative_sol = get_latitude_longitude_info_for_all_ips(all_ips,
                                                                                                            ip_version,
                                                                                                            1,
@@ -341,85 +569,128 @@ def generate_latlon_cluster_and_score_map(all_ips, ip_version=4, mode=2, thresho
 
         if len(ip_to_latlon_dict_sol) > 0:
 
+            ips_to_cluster, locations_to_cluster, penalties = [], [], []
             for count, ip in enumerate(all_ips):
                 locations_list = ip_to_latlon_dict_sol.get(ip, None)
                 if locations_list:
-                    con_cluster, len_cluster = cluster_locations(locations_list)
-                    geolocation_latlon_cluster_and_score_map_sol_validated[ip] = (con_cluster, len_cluster, 0)
+                    ips_to_cluster.append(ip)
+                    locations_to_cluster.append(locations_list)
+                    penalties.append(0)
                 else:
                     # Maybe none of the sources had good geolocation, let's get from the bad ones and add a penalty later
                     locations_list = ip_to_latlon_dict_negative_sol.get(ip, None)
                     if locations_list:
-                        con_cluster, len_cluster = cluster_locations(locations_list)
-                        geolocation_latlon_cluster_and_score_map_sol_validated[ip] = (con_cluster, len_cluster, 1)
+                        ips_to_cluster.append(ip)
+                        locations_to_cluster.append(locations_list)
+                        penalties.append(1)
+
+            # The saved file is re-used when the SoL validated inputs are unchanged
+            geolocation_latlon_cluster_and_score_map_sol_validated = build_latlon_cluster_and_score_map(
+                ips_to_cluster, locations_to_cluster, penalties, save_directory, save_file, workers=workers,
+                cluster_cache=cluster_cache, cache_namespace='clusters_sol_validated')
 
             if len(geolocation_latlon_cluster_and_score_map_sol_validated) > 0:
                 print(
                     f'We have clusters and scores (SoL) for {len(geolocation_latlon_cluster_and_score_map_sol_validated)} IPs')
-                save_results_to_file(geolocation_latlon_cluster_and_score_map_sol_validated, str(save_directory),
-                                     save_file)
 
             # Deleting finished variables to save memory
             del (ip_to_latlon_dict_sol)
             del (ip_to_latlon_dict_negative_sol)
 
+    if save_cluster_cache:
+        cluster_cache.save()
+
     return geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated
 
 
+class LinkColumns:
+    """
+    The links as an (N, 2) array of IP ids, so that per IP values can be looked up for all the links at once
+    Attributes
+        links -> The links, in their original order
+        ips -> The IPs, ip_to_id[ips[i]] == i
+        link_ids -> (N, 2) array with the ids of both ends of each link
+    """
+
+    def __init__(self, links):
+        self.links = list(links)
+        self.ip_to_id = {}
+        self.link_ids = np.array([(self.ip_to_id.setdefault(ip_address_1, len(self.ip_to_id)),
+                                   self.ip_to_id.setdefault(ip_address_2, len(self.ip_to_id)))
+                                  for ip_address_1, ip_address_2 in self.links], dtype=np.int64).reshape(-1, 2)
+        self.ips = list(self.ip_to_id.keys())
+
+    def get_ip_column(self, dictionary, function=None, dtype=bool, default=False):
+        """
+        function(value) (or just True) for each IP that has a value in the dictionary, default for the others
+        """
+        column = np.full(len(self.ips), default, dtype=dtype)
+        for ip_id, ip in enumerate(self.ips):
+            value = dictionary.get(ip, None)
+            if value:
+                column[ip_id] = function(value) if function else True
+
+        return column
+
+    def get_link_columns(self, ip_column):
+        return ip_column[self.link_ids[:, 0]], ip_column[self.link_ids[:, 1]]
+
+    def get_links(self, indices):
+        return [self.links[index] for index in indices.tolist()]
+
+
+def get_geolocation_category_columns(link_columns, geolocation_latlon_cluster_and_score_map, geolocation_threshold=0.6,
+                                     sol_validated=False, ignore=True):
+    """
+    Output
+        known -> Links with a location for both ends
+        good_ends -> Number of ends (0 -> bb, 1 -> og, 2 -> bg) whose best cluster score is at least the threshold
+    For the SoL validated map, ignore leaves out the links where one end has not passed any SoL testing (and as before,
+    no links are categorized without it)
+    """
+    has_location = link_columns.get_ip_column(geolocation_latlon_cluster_and_score_map)
+    is_good = link_columns.get_ip_column(geolocation_latlon_cluster_and_score_map,
+                                         lambda value: max(value[1]) >= geolocation_threshold)
+
+    if sol_validated:
+        if ignore:
+            has_location &= link_columns.get_ip_column(geolocation_latlon_cluster_and_score_map,
+                                                       lambda value: value[2] == 0)
+        else:
+            has_location[:] = False
+
+    has_location_1, has_location_2 = link_columns.get_link_columns(has_location)
+    is_good_1, is_good_2 = link_columns.get_link_columns(is_good)
+
+    return has_location_1 & has_location_2, is_good_1.astype(np.int8) + is_good_2.astype(np.int8)
+
+
 def generate_initial_category_mapping_for_geolocation(links, geolocation_latlon_cluster_and_score_map,
                                                       geolocation_latlon_cluster_and_score_map_sol_validated, mode=2,
                                                       geolocation_threshold=0.6, ignore=True):
     # We will use ignore to decide whether to include links where one end has not passed any SoL testing
 
     ip_geolocation_category = {}
-    skipped_links = 0
     ip_geolocation_category_sol_validated = {}
-    skipped_links_sol_validated = 0
 
-    for ip_address_1, ip_address_2 in links:
+    link_columns = LinkColumns(links)
+    geolocation_categories = np.array(['bb', 'og', 'bg'])
 
-        link = (ip_address_1, ip_address_2)
+    for current_mode, latlon_cluster_and_score_map, geolocation_category in [
+        (0, geolocation_latlon_cluster_and_score_map, ip_geolocation_category),
+        (1, geolocation_latlon_cluster_and_score_map_sol_validated, ip_geolocation_category_sol_validated)]:
 
-        if mode in [0, 2]:
-            ip_location_1 = geolocation_latlon_cluster_and_score_map.get(ip_address_1, None)
-            ip_location_2 = geolocation_latlon_cluster_and_score_map.get(ip_address_2, None)
+        if mode not in [current_mode, 2]:
+            continue
 
-            if ip_location_1 and ip_location_2:
-                score_location_1 = max(ip_location_1[1])
-                score_location_2 = max(ip_location_2[1])
+        known, good_ends = get_geolocation_category_columns(link_columns, latlon_cluster_and_score_map,
+                                                            geolocation_threshold, current_mode == 1, ignore)
+        link_indices = np.flatnonzero(known)
+        geolocation_category.update(zip(link_columns.get_links(link_indices),
+                                        geolocation_categories[good_ends[link_indices]].tolist()))
 
-                if score_location_1 >= geolocation_threshold and score_location_2 >= geolocation_threshold:
-                    ip_geolocation_category[link] = 'bg'
-                elif (score_location_1 >= geolocation_threshold and score_location_2 < geolocation_threshold) or \
-                        (score_location_1 < geolocation_threshold and score_location_2 >= geolocation_threshold):
-                    ip_geolocation_category[link] = 'og'
-                else:
-                    ip_geolocation_category[link] = 'bb'
-            else:
-                skipped_links += 1
-
-        if mode in [1, 2]:
-            ip_location_1 = geolocation_latlon_cluster_and_score_map_sol_validated.get(ip_address_1, None)
-            ip_location_2 = geolocation_latlon_cluster_and_score_map_sol_validated.get(ip_address_2, None)
-
-            if ip_location_1 and ip_location_2:
-                score_location_1 = max(ip_location_1[1])
-                score_location_2 = max(ip_location_2[1])
-
-                if ignore:
-                    if ip_location_1[2] == 0 and ip_location_2[2] == 0:
-                        if score_location_1 >= geolocation_threshold and score_location_2 >= geolocation_threshold:
-                            ip_geolocation_category_sol_validated[link] = 'bg'
-                        elif (score_location_1 >= geolocation_threshold and score_location_2 < geolocation_threshold) or \
-                                (
-                                        score_location_1 < geolocation_threshold and score_location_2 >= geolocation_threshold):
-                            ip_geolocation_category_sol_validated[link] = 'og'
-                        else:
-                            ip_geolocation_category_sol_validated[link] = 'bb'
-                    else:
-                        skipped_links_sol_validated += 1
-            else:
-                skipped_links_sol_validated += 1
+    skipped_links = len(link_columns.links) - len(ip_geolocation_category) if mode in [0, 2] else 0
+    skipped_links_sol_validated = len(link_columns.links) - len(ip_geolocation_category_sol_validated) if mode in [1, 2] else 0
 
     print(f'Only Geolocation: Skipped {skipped_links} links and got results for {len(ip_geolocation_category)} links')
 
@@ -437,47 +708,10 @@ def generate_initial_category_mapping_for_geolocation(links, geolocation_latlon_
     return ip_geolocation_category, ip_geolocation_category_sol_validated
 
 
-def get_country_to_continent_map():
-    # Some initial list of countries for which match was not found
-    country_to_continent_map = {'732': 'AF', '612': 'OC', '534': 'NA', '626': 'AS', '581': 'NA', '336': 'EU',
-                                '412': 'EU', '158': 'AS', '553': 'SA', '485': 'OC', '654': 'AF', '010': 'AN',
-                                '260': 'AN'}
-
-    for country in pycountry.countries:
-        try:
-            country_to_continent_map[country.numeric] = pc.country_alpha2_to_continent_code(country.alpha_2)
-        except:
-            pass
-
-    return country_to_continent_map
-
-
-def get_country_alpha_to_digit():
-    country_file = root_dir / 'stats' / 'iso3166-countrycodes.txt'
-
-    with open(country_file) as f:
-        file_content = f.readlines()
-
-    country_2alpha_to_digit = {'AX': '248', 'XK': '412', 'PM': '666', 'SH': '654'}
-
-    res = ''
-    for country in file_content[12:]:
-        a = [' '.join(item.strip().split(', ')[::-1]) for item in country.split('\t') if item.strip() != '']
-        if len(a) != 4:
-            a = [' '.join(item.strip().split(', ')[::-1]) for item in a[0].split('  ') if item.strip() != '']
-            if len(a) != 4:
-                res = a[-1]
-        else:
-            a[0] = (res + ' ' + a[0]).strip()
-            country_2alpha_to_digit[a[1]] = a[-1]
-            res = ''
-
-    return country_2alpha_to_digit
-
-
-def get_country_continent_helper(dictionary, country_to_continent_map, country_2alpha_to_digit):
+def get_country_continent_helper(dictionary, cluster_cache=None, cache_namespace='countries'):
     """
     This function will get the country list and continent list for each IP, every ip have several geo results
+    The coordinates of all the IPs are reverse geocoded together through the shared reverse geocoder
     Output format: {ip: ([countries], [percentage])}, {ip: ([continents], [percentage])}
     """
     count = 0
@@ -485,36 +719,66 @@ def get_country_continent_helper(dictionary, country_to_continent_map, country_2
 
     country_result, continent_result = {}, {}
 
+    ips_to_geocode = []
+
     for ip, value in dictionary.items():
 
         all_coordinates = [i for item in value[0] for i in item]
-        reverse_geocode_result = reverse_geocode.search(all_coordinates)
 
-        countries = [country_2alpha_to_digit[item['country_code']] for item in reverse_geocode_result]
+        if cluster_cache is not None:
+            digest = cluster_cache.get_digest(all_coordinates)
+            cached_result = cluster_cache.get(cache_namespace, ip, digest)
+            if cached_result:
+                country_result[ip], continent_result[ip] = cached_result
+                continue
+        else:
+            digest = None
+
+        ips_to_geocode.append((ip, all_coordinates, digest))
+
+    reverse_geocoder = get_reverse_geocoder()
+    # A single query for all the (unique) coordinates that were not seen before
+    reverse_geocoder.add_coordinates([coordinate for _, all_coordinates, _ in ips_to_geocode for coordinate in
+                                      all_coordinates])
+
+    for ip, all_coordinates, digest in ips_to_geocode:
+
+        countries, continents = reverse_geocoder.get_country_digits_and_continents(all_coordinates)
+
         count_of_countries = len(countries)
         counter = Counter(countries)
         country_result[ip] = [tuple(counter.keys()), tuple([item / count_of_countries for item in counter.values()])]  # [countries, percentage]
 
-        continents = [country_to_continent_map[item] for item in countries]
         count_of_continents = len(continents)
         counter = Counter(continents)
 
         continent_result[ip] = [tuple(counter.keys()), tuple([item / count_of_continents for item in counter.values()])]
 
+        if cluster_cache is not None:
+            cluster_cache.put(cache_namespace, ip, digest, (country_result[ip], continent_result[ip]))
+
         if count % 10000 == 0 and verbose:
             print(f'Completed for {count} queries')
 
         count += 1
 
+    if cluster_cache is not None:
+        cluster_cache.report(cache_namespace)
+
     return country_result, continent_result
 
 
-def get_country_and_continent_clusters_for_all_ips(all_ips, ip_version=4, mode=2, sol_threshold=0.01, suffix='default'):
-    country_to_continent_map = get_country_to_continent_map()
-    country_2alpha_to_digit = get_country_alpha_to_digit()
+def get_country_and_continent_clusters_for_all_ips(all_ips, ip_version=4, mode=2, sol_threshold=0.01, suffix='default',
+                                                   cluster_cache=None):
+    """
+    :param cluster_cache: GeolocationClusterCache to consult (and update), a new one is loaded and saved if not given
+    """
+    save_cluster_cache = cluster_cache is None
+    if cluster_cache is None:
+        cluster_cache = GeolocationClusterCache(ip_version)
 
     geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated = generate_latlon_cluster_and_score_map(
-        all_ips, ip_version, mode, sol_threshold, suffix)
+        all_ips, ip_version, mode, sol_threshold, suffix, cluster_cache=cluster_cache)
 
     save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
 
@@ -540,7 +804,7 @@ def get_country_and_continent_clusters_for_all_ips(all_ips, ip_version=4, mode=2
         if len(geolocation_country_cluster) == 0 or len(geolocation_continent_cluster) == 0:
             # format: {ip: ([countries], [percentage])}, {ip: ([continents], [percentage])}
             geolocation_country_cluster, geolocation_continent_cluster = get_country_continent_helper(
-                geolocation_latlon_cluster_and_score_map, country_to_continent_map, country_2alpha_to_digit)
+                geolocation_latlon_cluster_and_score_map, cluster_cache, 'countries')
 
             save_results_to_file(geolocation_country_cluster, str(save_directory), save_file_country)
             save_results_to_file(geolocation_continent_cluster, str(save_directory), save_file_continent)
@@ -563,12 +827,14 @@ def get_country_and_continent_clusters_for_all_ips(all_ips, ip_version=4, mode=2
 
         if len(geolocation_country_cluster_sol_validated) == 0 or len(geolocation_continent_cluster_sol_validated) == 0:
             geolocation_country_cluster_sol_validated, geolocation_continent_cluster_sol_validated = get_country_continent_helper(
-                geolocation_latlon_cluster_and_score_map_sol_validated, country_to_continent_map,
-                country_2alpha_to_digit)
+                geolocation_latlon_cluster_and_score_map_sol_validated, cluster_cache, 'countries_sol_validated')
 
             save_results_to_file(geolocation_country_cluster_sol_validated, str(save_directory), save_file_country)
             save_results_to_file(geolocation_continent_cluster_sol_validated, str(save_directory), save_file_continent)
 
+    if save_cluster_cache:
+        cluster_cache.save()
+
     return geolocation_country_cluster, geolocation_continent_cluster, geolocation_country_cluster_sol_validated, geolocation_continent_cluster_sol_validated
 
 
@@ -576,18 +842,50 @@ def load_shp_file(file):
     return gpd.read_file(file)
 
 
-def get_neighbors_for_countries(gdf):
-    gdf["NEIGHBORS"] = None
+_country_adjacency_shared_state = {}
+
+
+def _get_intersecting_countries_for_chunk(chunk):
+    geometry = _country_adjacency_shared_state['geometry']
+    # The STRtree only runs the exact predicate for the geometries whose bounding boxes overlap
+    input_indices, tree_indices = geometry.sindex.query(geometry.iloc[chunk[0]: chunk[1]], predicate='intersects')
+    return input_indices + chunk[0], tree_indices
+
+
+def get_neighbors_for_countries(gdf, workers=1, chunk_size=25):
+    """
+    Adds the NEIGHBORS column (the '; ' joined codes of the countries that are not disjoint from each country)
+    The candidates come from the spatial index of the gdf and the exact checks run in parallel when workers > 1
+    """
+    geometry = gdf.geometry.reset_index(drop=True)
+    # Built before forking, so that all workers share the same tree
+    geometry.sindex
+
+    chunks = [(start, min(start + chunk_size, len(geometry))) for start in range(0, len(geometry), chunk_size)]
+
+    _country_adjacency_shared_state['geometry'] = geometry
+    try:
+        if workers > 1 and len(chunks) > 1:
+            with multiprocessing.get_context('fork').Pool(min(workers, len(chunks))) as pool:
+                results = pool.map(_get_intersecting_countries_for_chunk, chunks)
+        else:
+            results = [_get_intersecting_countries_for_chunk(chunk) for chunk in chunks]
+    finally:
+        _country_adjacency_shared_state.clear()
 
-    for index, country in gdf.iterrows():
-        # get 'not disjoint' countries
-        neighbors = gdf[~gdf.geometry.disjoint(country.geometry)].CNTRY_CODE.tolist()
+    neighbor_positions = [[] for _ in range(len(geometry))]
+    for input_indices, tree_indices in results:
+        for input_index, tree_index in zip(input_indices.tolist(), tree_indices.tolist()):
+            neighbor_positions[input_index].append(tree_index)
 
-        # remove own name of the country from the list
-        neighbors = [name for name in neighbors if country.CNTRY_CODE != name]
+    country_codes = gdf.CNTRY_CODE.tolist()
+    neighbors = []
+    for position, country_code in enumerate(country_codes):
+        # Same order as the gdf rows and remove own name of the country from the list
+        neighbors.append('; '.join([country_codes[item] for item in sorted(neighbor_positions[position]) if
+                                    country_codes[item] != country_code]))
 
-        # add names of neighbors as NEIGHBORS value
-        gdf.at[index, "NEIGHBORS"] = '; '.join(neighbors)
+    gdf['NEIGHBORS'] = neighbors
 
     return gdf
 
@@ -596,28 +894,56 @@ def save_shp_file(gdf, file):
     return gdf.to_file(file)
 
 
-def generate_gdf_dict(suffix='default'):
+def get_shp_file_digest(shp_file):
+    """
+    sha256 of all the files making up the shapefile (the .shp, .dbf, .shx etc. sharing its stem)
+    """
+    digest = hashlib.sha256()
+    for file in sorted(Path(shp_file).parent.glob(Path(shp_file).stem + '.*')):
+        digest.update(file.name.encode())
+        with open(file, 'rb') as fp:
+            for block in iter(lambda: fp.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def generate_gdf_dict(suffix='default', workers=1):
+    """
+    Returns the country codes and their neighbors as {'CNTRY_CODE': {index: code}, 'NEIGHBORS': {index: neighbors}}
+    The adjacency only depends on the shapefile, so it is saved once per shapefile digest and shared by all suffixes
+    """
     shp_file_location = root_dir / 'stats/IPUMSI_world_release2024/IPUMSI_world_release2024.shp'
-    save_file_location = root_dir / f'stats/mapping_outputs_{suffix}/country_neighbors_as_3digit_codes'
+    save_directory = root_dir / 'stats/country_neighbors'
+    legacy_save_file_location = root_dir / f'stats/mapping_outputs_{suffix}/country_neighbors_as_3digit_codes'
 
-    if Path(save_file_location).exists():
-        print('Directly loading from the saved file')
-        result_gdf = load_shp_file(str(save_file_location))
-        gdf_dict = result_gdf.to_dict()
+    if Path(shp_file_location).exists():
+        save_file = 'country_neighbors_{}'.format(get_shp_file_digest(shp_file_location)[:16])
 
-    else:
-        if Path(shp_file_location).exists():
+        if Path(save_directory / save_file).exists():
+            print('Directly loading from the saved file')
+            with open(save_directory / save_file, 'rb') as fp:
+                gdf_dict = pickle.load(fp)
+
+        else:
             gdf = load_shp_file(str(shp_file_location))
-            updated_gdf = get_neighbors_for_countries(gdf)
+            updated_gdf = get_neighbors_for_countries(gdf, workers=workers)
+            gdf_dict = {'CNTRY_CODE': dict(enumerate(updated_gdf.CNTRY_CODE.tolist())),
+                        'NEIGHBORS': dict(enumerate(updated_gdf.NEIGHBORS.tolist()))}
 
             # Let's save for future use
-            save_shp_file(updated_gdf, str(save_file_location))
-            gdf_dict = updated_gdf.to_dict()
+            save_directory.mkdir(parents=True, exist_ok=True)
+            save_results_to_file(gdf_dict, str(save_directory), save_file)
 
-        else:
-            print(
-                f'Download IPUMSI data at "https://international.ipums.org/international/resources/gis/IPUMSI_world_release2020.zip" and save the unzipped folder in the stats directory')
-            sys.exit(1)
+    elif Path(legacy_save_file_location).exists():
+        print('Directly loading from the saved shapefile')
+        result_gdf = load_shp_file(str(legacy_save_file_location))
+        gdf_dict = {'CNTRY_CODE': result_gdf['CNTRY_CODE'].to_dict(), 'NEIGHBORS': result_gdf['NEIGHBORS'].to_dict()}
+
+    else:
+        print(
+            f'Download IPUMSI data at "https://international.ipums.org/international/resources/gis/IPUMSI_world_release2020.zip" and save the unzipped folder in the stats directory')
+        sys.exit(1)
 
     return gdf_dict
 
@@ -682,6 +1008,180 @@ def get_iterative_neighbors(gdf_dict, country_list, index_to_country_code_map, l
     return all_neighbors
 
 
+class CountryNeighborClosure:
+    """
+    The neighbor relation of get_iterative_neighbors (countries within level hops, including the country itself)
+    precomputed once for all the countries as a boolean reachability matrix.
+    As in get_iterative_neighbors, countries that are not found in the gdf (or are at index 0) are not expanded, and a
+    country missing from the gdf only has itself as neighbor.
+    Attributes
+        country_position -> Position of each country code in the matrix
+        reach -> reach[i, j] is True when the country at position j is within level hops of the one at position i
+    """
+
+    def __init__(self, gdf_dict, level=2):
+        index_to_country_code_map = index_to_country_code_map_gdf(gdf_dict)
+
+        neighbors_map = {}
+        for country, index in index_to_country_code_map.items():
+            if index and gdf_dict['NEIGHBORS'][index]:
+                neighbors_map[country] = gdf_dict['NEIGHBORS'][index].split('; ')
+
+        self.country_position = {}
+        for country in itertools.chain(index_to_country_code_map.keys(), flatten(neighbors_map.values())):
+            self.country_position.setdefault(country, len(self.country_position))
+
+        adjacency = np.zeros((len(self.country_position), len(self.country_position)), dtype=np.float32)
+        for country, neighbors in neighbors_map.items():
+            adjacency[self.country_position[country], [self.country_position[item] for item in neighbors]] = 1
+
+        self.reach = np.eye(len(self.country_position), dtype=bool)
+        for _ in range(level):
+            self.reach = self.reach | ((self.reach.astype(np.float32) @ adjacency) > 0)
+
+    def add_countries(self, countries):
+        # Countries that are not in the gdf are only neighbors of themselves
+        new_countries = [country for country in dict.fromkeys(countries) if country not in self.country_position]
+        if len(new_countries) == 0:
+            return
+
+        for country in new_countries:
+            self.country_position[country] = len(self.country_position)
+
+        reach = np.eye(len(self.country_position), dtype=bool)
+        reach[:len(self.reach), :len(self.reach)] = self.reach
+        self.reach = reach
+
+    def check_if_neighbors(self, countries_1, countries_2):
+        """
+        Returns True if any country in countries_2 is a neighbor of any country in countries_1
+        """
+        self.add_countries(list(countries_1) + list(countries_2))
+        return bool(self.reach[np.ix_([self.country_position[country] for country in countries_1],
+                                      [self.country_position[country] for country in countries_2])].any())
+
+    def check_if_neighbors_for_all(self, list_of_countries_1, list_of_countries_2, chunk_size=100000):
+        """
+        Vectorized check_if_neighbors for many pairs of country lists at once
+        Output
+            Boolean array with the result for each pair
+        """
+        self.add_countries(flatten(list(list_of_countries_1) + list(list_of_countries_2)))
+
+        # Only the unique country lists are expanded to their neighbors
+        country_list_ids = {}
+        ids_1 = np.array([country_list_ids.setdefault(tuple(countries), len(country_list_ids)) for countries in
+                          list_of_countries_1], dtype=np.int64)
+        ids_2 = np.array([country_list_ids.setdefault(tuple(countries), len(country_list_ids)) for countries in
+                          list_of_countries_2], dtype=np.int64)
+
+        members = np.zeros((len(country_list_ids), len(self.country_position)), dtype=bool)
+        for countries, country_list_id in country_list_ids.items():
+            members[country_list_id, [self.country_position[country] for country in countries]] = True
+
+        reachable = (members.astype(np.float32) @ self.reach.astype(np.float32)) > 0
+
+        result = np.zeros(len(ids_1), dtype=bool)
+        for start in range(0, len(ids_1), chunk_size):
+            result[start: start + chunk_size] = (reachable[ids_1[start: start + chunk_size]] &
+                                                 members[ids_2[start: start + chunk_size]]).any(axis=1)
+
+        return result
+
+
+submarine_cable_possibilities = {('AS', 'NA'), ('AS', 'SA'), ('AS', 'OC'),
+                                 ('NA', 'AS'), ('NA', 'SA'), ('NA', 'OC'), ('NA', 'EU'), ('NA', 'AF'),
+                                 ('SA', 'AS'), ('SA', 'NA'), ('SA', 'OC'), ('SA', 'EU'), ('SA', 'AF'),
+                                 ('OC', 'AS'), ('OC', 'NA'), ('OC', 'SA'), ('OC', 'EU'), ('OC', 'AF'),
+                                 ('EU', 'NA'), ('EU', 'SA'), ('EU', 'OC'),
+                                 ('AF', 'NA'), ('AF', 'SA'), ('AF', 'OC')}
+
+
+class ContinentPairTable:
+    """
+    Continents encoded as small integers, with pair_oceanic[i, j] True when a link between the continents i and j can
+    be oceanic (the pair is in submarine_cable_possibilities, so never for the same continent)
+    Any other continent (AN, unknown codes) is added with an all False row and column
+    """
+
+    def __init__(self):
+        self.continent_to_code = {}
+        for pair in sorted(submarine_cable_possibilities):
+            for continent in pair:
+                self.continent_to_code.setdefault(continent, len(self.continent_to_code))
+
+        self.pair_oceanic = np.zeros((len(self.continent_to_code), len(self.continent_to_code)), dtype=bool)
+        for continent_1, continent_2 in submarine_cable_possibilities:
+            self.pair_oceanic[self.continent_to_code[continent_1], self.continent_to_code[continent_2]] = True
+
+    def add_continents(self, continents):
+        new_continents = [continent for continent in dict.fromkeys(continents) if
+                          continent not in self.continent_to_code]
+        if len(new_continents) == 0:
+            return
+
+        for continent in new_continents:
+            self.continent_to_code[continent] = len(self.continent_to_code)
+
+        pair_oceanic = np.zeros((len(self.continent_to_code), len(self.continent_to_code)), dtype=bool)
+        pair_oceanic[:len(self.pair_oceanic), :len(self.pair_oceanic)] = self.pair_oceanic
+        self.pair_oceanic = pair_oceanic
+
+    def get_ip_masks(self, link_columns, geolocation_continent_cluster):
+        """
+        Output
+            continent_masks -> Bitmask of the continents of each IP
+            oceanic_masks -> Bitmask of the continents that all the continents of each IP can reach over an oceanic link
+        """
+        continent_lists = {}
+        for ip in link_columns.ips:
+            value = geolocation_continent_cluster.get(ip, None)
+            if value:
+                continent_lists.setdefault(tuple(value[0]), None)
+
+        self.add_continents(flatten(continent_lists.keys()))
+
+        # pair_masks[i] has the bit j set when pair_oceanic[i, j]
+        pair_masks = (self.pair_oceanic.astype(np.int64) << np.arange(len(self.continent_to_code), dtype=np.int64)).sum(
+            axis=1).tolist()
+
+        for continents in continent_lists:
+            continent_mask, oceanic_mask = 0, -1
+            for continent in continents:
+                continent_mask |= 1 << self.continent_to_code[continent]
+                oceanic_mask &= pair_masks[self.continent_to_code[continent]]
+            continent_lists[continents] = (continent_mask, oceanic_mask)
+
+        continent_masks = link_columns.get_ip_column(
+            geolocation_continent_cluster, lambda value: continent_lists[tuple(value[0])][0], np.int64, 0)
+        oceanic_masks = link_columns.get_ip_column(
+            geolocation_continent_cluster, lambda value: continent_lists[tuple(value[0])][1], np.int64, -1)
+
+        return continent_masks, oceanic_masks
+
+
+def get_continent_category_columns(link_columns, geolocation_continent_cluster, continent_pair_table=None):
+    """
+    Output
+        known -> Links with continents for both ends
+        oceanic -> Links where every pair of continents of both ends can be oceanic (else it is terrestrial)
+    """
+    if continent_pair_table is None:
+        continent_pair_table = ContinentPairTable()
+
+    has_continents_1, has_continents_2 = link_columns.get_link_columns(
+        link_columns.get_ip_column(geolocation_continent_cluster))
+    known = has_continents_1 & has_continents_2
+
+    continent_masks, oceanic_masks = continent_pair_table.get_ip_masks(link_columns, geolocation_continent_cluster)
+
+    # All the continents of ip_address_2 have to be reachable over an oceanic link from all the ones of ip_address_1
+    oceanic = known & ((continent_masks[link_columns.link_ids[:, 1]] &
+                        ~oceanic_masks[link_columns.link_ids[:, 0]]) == 0)
+
+    return known, oceanic
+
+
 def generate_category_mapping_based_on_continent_data(links, geolocation_continent_cluster,
                                                       geolocation_continent_cluster_sol_validated, mode=2):
     """
@@ -694,57 +1194,26 @@ def generate_category_mapping_based_on_continent_data(links, geolocation_contine
     ip_is_oceanic_cable_continent_based_sol_validated = {}
     skipped_links_sol_validated = 0
 
-    submarine_cable_possibilities = {('AS', 'NA'), ('AS', 'SA'), ('AS', 'OC'),
-                                     ('NA', 'AS'), ('NA', 'SA'), ('NA', 'OC'), ('NA', 'EU'), ('NA', 'AF'),
-                                     ('SA', 'AS'), ('SA', 'NA'), ('SA', 'OC'), ('SA', 'EU'), ('SA', 'AF'),
-                                     ('OC', 'AS'), ('OC', 'NA'), ('OC', 'SA'), ('OC', 'EU'), ('OC', 'AF'),
-                                     ('EU', 'NA'), ('EU', 'SA'), ('EU', 'OC'),
-                                     ('AF', 'NA'), ('AF', 'SA'), ('AF', 'OC')}
-
-    for ip_address_1, ip_address_2 in links:
-
-        link = (ip_address_1, ip_address_2)
-
-        if mode in [0, 2]:
-            ip_con_1 = geolocation_continent_cluster.get(ip_address_1, None)
-            ip_con_2 = geolocation_continent_cluster.get(ip_address_2, None)
-
-            if ip_con_1 and ip_con_2:
-                oc_val = 'oc'
-                combinations = list(product(ip_con_1[0], ip_con_2[0]))  # 生成元素的所有可能的配对组合, e.g. [('AS', 'NA'), ('NA', 'AS'), ('AS', 'AS')]
-                unique_combinations = list(set([tuple(set(item)) for item in combinations]))  # 去重, e.g. [('AS', 'NA'), ('AS')]
-                for combination in unique_combinations:
-                    if len(combination) == 1:
-                        oc_val = 'te'
-                        break
-                    else:
-                        if combination not in submarine_cable_possibilities:
-                            oc_val = 'te'
-                            break
-                ip_is_oceanic_cable_continent_based[link] = oc_val
-            else:
-                skipped_links += 1
-
-        if mode in [1, 2]:
-            ip_con_1 = geolocation_continent_cluster_sol_validated.get(ip_address_1, None)
-            ip_con_2 = geolocation_continent_cluster_sol_validated.get(ip_address_2, None)
-
-            if ip_con_1 and ip_con_2:
-                oc_val = 'oc'
-                combinations = list(product(ip_con_1[0], ip_con_2[0]))
-                unique_combinations = list(set([tuple(set(item)) for item in combinations]))
-                for combination in unique_combinations:
-                    # If the continents are same, then it is terrestrial, else it is oceanic
-                    if len(combination) == 1:
-                        oc_val = 'te'
-                        break
-                    else:
-                        if combination not in submarine_cable_possibilities:
-                            oc_val = 'te'
-                            break
-                ip_is_oceanic_cable_continent_based_sol_validated[link] = oc_val
-            else:
-                skipped_links_sol_validated += 1
+    continent_pair_table = ContinentPairTable()
+    link_columns = LinkColumns(links)
+
+    for current_mode, continent_cluster, oceanic_cable_continent_based in [
+        (0, geolocation_continent_cluster, ip_is_oceanic_cable_continent_based),
+        (1, geolocation_continent_cluster_sol_validated, ip_is_oceanic_cable_continent_based_sol_validated)]:
+
+        if mode not in [current_mode, 2]:
+            continue
+
+        known, oceanic = get_continent_category_columns(link_columns, continent_cluster, continent_pair_table)
+
+        if current_mode == 0:
+            skipped_links += int((~known).sum())
+        else:
+            skipped_links_sol_validated += int((~known).sum())
+
+        link_indices = np.flatnonzero(known)
+        oceanic_cable_continent_based.update(zip(link_columns.get_links(link_indices),
+                                                 np.where(oceanic[link_indices], 'oc', 'te').tolist()))
 
     print(
         f'Only geolocation: Skipped {skipped_links} links and got results for {len(ip_is_oceanic_cable_continent_based)} links')
@@ -759,8 +1228,30 @@ def generate_category_mapping_based_on_continent_data(links, geolocation_contine
     return ip_is_oceanic_cable_continent_based, ip_is_oceanic_cable_continent_based_sol_validated
 
 
+def get_neighbor_category_columns(link_columns, geolocation_country_cluster, neighbor_closure):
+    """
+    Output
+        known -> Links with countries for both ends
+        oceanic -> Links where no country of the second end is a neighbor of a country of the first end
+    """
+    has_countries_1, has_countries_2 = link_columns.get_link_columns(
+        link_columns.get_ip_column(geolocation_country_cluster))
+    known = has_countries_1 & has_countries_2
+
+    link_ids = link_columns.link_ids[known]
+    countries_1 = [geolocation_country_cluster[link_columns.ips[ip_id]][0] for ip_id in link_ids[:, 0].tolist()]
+    countries_2 = [geolocation_country_cluster[link_columns.ips[ip_id]][0] for ip_id in link_ids[:, 1].tolist()]
+
+    # If a country of ip_address_2 falls in the neighbors of a country of ip_address_1, it is terrestrial
+    oceanic = np.zeros(len(known), dtype=bool)
+    oceanic[known] = ~neighbor_closure.check_if_neighbors_for_all(countries_1, countries_2)
+
+    return known, oceanic
+
+
 def generate_category_mapping_based_on_neighbors_data(links, geolocation_country_cluster,
-                                                      geolocation_country_cluster_sol_validated, mode=2, suffix='default'):
+                                                      geolocation_country_cluster_sol_validated, mode=2, suffix='default',
+                                                      workers=1):
     """
     This function generates the category mapping based on the neighbor data. It will check if the countries are neighbors, then it is terrestrial, else it is oceanic, if the neighbors are not known, then it is considered as terrestrial, as we are not sure about the oceanic part, but we are sure about the terrestrial part
     """
@@ -769,51 +1260,28 @@ def generate_category_mapping_based_on_neighbors_data(links, geolocation_country
     ip_is_oceanic_cable_neighbor_based_sol_validated = {}
     skipped_links_sol_validated = 0
 
-    verbose = True
-    count = 0
+    gdf_dict = generate_gdf_dict(suffix, workers=workers)
+    # The 2 level neighbors (as in get_iterative_neighbors) of every country are computed once
+    neighbor_closure = CountryNeighborClosure(gdf_dict, level=2)
+    link_columns = LinkColumns(links)
 
-    gdf_dict = generate_gdf_dict(suffix)
-    index_to_country_code_map = index_to_country_code_map_gdf(gdf_dict)
+    for current_mode, country_cluster, oceanic_cable_neighbor_based in [
+        (0, geolocation_country_cluster, ip_is_oceanic_cable_neighbor_based),
+        (1, geolocation_country_cluster_sol_validated, ip_is_oceanic_cable_neighbor_based_sol_validated)]:
 
-    for ip_address_1, ip_address_2 in links:
+        if mode not in [current_mode, 2]:
+            continue
 
-        link = (ip_address_1, ip_address_2)
+        known, oceanic = get_neighbor_category_columns(link_columns, country_cluster, neighbor_closure)
 
-        if mode in [0, 2]:
-            ip_country_1 = geolocation_country_cluster.get(ip_address_1, None)
-            ip_country_2 = geolocation_country_cluster.get(ip_address_2, None)
+        if current_mode == 0:
+            skipped_links += int((~known).sum())
+        else:
+            skipped_links_sol_validated += int((~known).sum())
 
-            oc_val = 'oc'
-            if ip_country_1 and ip_country_2:
-                # Let's always find the neighbors for ip_address_1 and check if the country for ip_address_2 falls in the neighbors
-                neighbors = get_iterative_neighbors(gdf_dict, ip_country_1[0], index_to_country_code_map)
-                combinations = list(product(ip_country_1[0], ip_country_2[0]))
-                for combination in combinations:
-                    if combination[1] in neighbors[combination[0]]:
-                        oc_val = 'te'
-                        break
-                ip_is_oceanic_cable_neighbor_based[link] = oc_val
-            else:
-                skipped_links += 1
-
-        if mode in [1, 2]:
-            ip_country_1 = geolocation_country_cluster_sol_validated.get(ip_address_1, None)
-            ip_country_2 = geolocation_country_cluster_sol_validated.get(ip_address_2, None)
-
-            oc_val = 'oc'
-            if ip_country_1 and ip_country_2:
-                # Let's always find the neighbors for ip_address_1 and check if the country for ip_address_2 falls in the neighbors
-                neighbors = get_iterative_neighbors(gdf_dict, ip_country_1[0], index_to_country_code_map)
-                combinations = list(product(ip_country_1[0], ip_country_2[0]))
-                for combination in combinations:
-                    if combination[1] in neighbors[combination[0]]:
-                        oc_val = 'te'
-                        break
-                ip_is_oceanic_cable_neighbor_based_sol_validated[link] = oc_val
-            else:
-                skipped_links_sol_validated += 1
-
-        count += 1
+        link_indices = np.flatnonzero(known)
+        oceanic_cable_neighbor_based.update(zip(link_columns.get_links(link_indices),
+                                                np.where(oceanic[link_indices], 'oc', 'te').tolist()))
 
     print(
         f'Only geolocation: Skipped {skipped_links} links and got results for {len(ip_is_oceanic_cable_neighbor_based)} links')
@@ -828,191 +1296,170 @@ def generate_category_mapping_based_on_neighbors_data(links, geolocation_country
     return ip_is_oceanic_cable_neighbor_based, ip_is_oceanic_cable_neighbor_based_sol_validated
 
 
-def get_countries_with_submarine_landing_points():
-    # Rather than taking the country here, let's generate the countries based on reverse
-    # geocode like we did with the IP location sources to maintain standard results
+_landing_point_country_bitmaps = {}
 
-    submarine_countries = set()
-    country_2alpha_to_digit = get_country_alpha_to_digit()
 
-    with open(root_dir / 'stats/submarine_data/landing_points_dict', 'rb') as fp:
-        landing_points = pickle.load(fp)
+def get_landing_point_country_bitmap():
+    """
+    Boolean array indexed by the 3-digit country codes (as integers), True for the countries with submarine landing points
+    It is computed once per landing points data and saved under stats/landing_point_country_bitmaps
+    """
+    catalog = load_submarine_catalog()
 
-    for landing_point in landing_points.values():
-        coordinate = (landing_point.latitude, landing_point.longitude)
-        result = reverse_geocode.search([coordinate])
-        country_3digit = country_2alpha_to_digit[result[0]['country_code']]
-        submarine_countries.add(country_3digit)
+    if catalog.directory not in _landing_point_country_bitmaps:
+        # Rather than taking the country here, let's generate the countries based on reverse
+        # geocode like we did with the IP location sources to maintain standard results
+        coordinates = [(landing_point.latitude, landing_point.longitude) for landing_point in
+                       catalog.landing_points_dict.values()]
+        fingerprint = hashlib.sha256(pickle.dumps(coordinates)).hexdigest()
 
-    return list(submarine_countries)
+        save_directory = root_dir / 'stats/landing_point_country_bitmaps'
+        save_file = 'landing_point_country_bitmap_{}'.format(fingerprint[:16])
+
+        if Path(save_directory / save_file).exists():
+            with open(save_directory / save_file, 'rb') as fp:
+                bitmap = pickle.load(fp)
+        else:
+            country_digits, _ = get_reverse_geocoder().get_country_digits_and_continents(coordinates)
+            bitmap = np.zeros(1000, dtype=bool)
+            bitmap[np.array([int(country_digit) for country_digit in country_digits], dtype=np.int64)] = True
+            save_directory.mkdir(parents=True, exist_ok=True)
+            save_results_to_file(bitmap, str(save_directory), save_file)
+
+        _landing_point_country_bitmaps[catalog.directory] = bitmap
+
+    return _landing_point_country_bitmaps[catalog.directory]
+
+
+def get_countries_with_submarine_landing_points():
+    return ['{:03d}'.format(country_index) for country_index in np.flatnonzero(get_landing_point_country_bitmap())]
 
 
 def check_country_with_landing_points(country_list, submarine_countries):
     return all([country not in submarine_countries for country in country_list])
 
 
-def generate_categories(all_ips, links, geolocation_latlon_cluster_and_score_map,
-                        geolocation_latlon_cluster_and_score_map_sol_validated, ip_version=4, mode=2,
-                        sol_threshold=0.01, geolocation_threshold=0.6, ignore=True, suffix='default'):
-    categories_map = {
-        'bg_oc': [], 'og_oc': [], 'bb_oc': [],
-        'bg_te': [], 'og_te': [], 'bb_te': [],
-        'de_te': []
-    }
-
-    categories_map_sol_validated = {
-        'bg_oc': [], 'og_oc': [], 'bb_oc': [],
-        'bg_te': [], 'og_te': [], 'bb_te': [],
-        'de_te': []
-    }
+def get_landing_point_columns(link_columns, geolocation_country_cluster, landing_point_country_bitmap=None):
+    """
+    Links where any country (in the country cluster) of either end has submarine landing points
+    """
+    if landing_point_country_bitmap is None:
+        landing_point_country_bitmap = get_landing_point_country_bitmap()
 
-    save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
-    save_directory.mkdir(parents=True, exist_ok=True)
+    ip_ids, country_indices = [], []
+    for ip_id, ip in enumerate(link_columns.ips):
+        value = geolocation_country_cluster.get(ip, None)
+        if value:
+            ip_ids.extend([ip_id] * len(value[0]))
+            country_indices.extend([int(country) for country in value[0]])
 
-    if mode in [0, 2]:
-        save_file = 'categories_map_v{}'.format(ip_version)
-        if Path(save_directory / save_file).exists():
-            print(f'Directly loading the contents')
-            with open(save_directory / save_file, 'rb') as fp:
-                categories_map = pickle.load(fp)
+    has_landing_points = np.zeros(len(link_columns.ips), dtype=bool)
+    np.logical_or.at(has_landing_points, np.array(ip_ids, dtype=np.int64),
+                     landing_point_country_bitmap[np.array(country_indices, dtype=np.int64)])
 
-            if mode == 0:
-                mode = -1
-            else:
-                mode = 1
+    has_landing_points_1, has_landing_points_2 = link_columns.get_link_columns(has_landing_points)
 
-    if mode in [1, 2]:
-        save_file = 'categories_map_sol_validated_v{}'.format(ip_version)
-        if Path(save_directory / save_file).exists():
-            print(f'Directly loading the contents')
-            with open(save_directory / save_file, 'rb') as fp:
-                categories_map_sol_validated = pickle.load(fp)
+    return has_landing_points_1 | has_landing_points_2
 
-            if mode == 1:
-                mode = -1
-            else:
-                mode = 0
 
-    if mode != -1:
+category_names = ('bg_oc', 'og_oc', 'bb_oc', 'bg_te', 'og_te', 'bb_te', 'de_te')
 
-        ip_geolocation_category, ip_geolocation_category_sol_validated = generate_initial_category_mapping_for_geolocation(
-            links, geolocation_latlon_cluster_and_score_map, geolocation_latlon_cluster_and_score_map_sol_validated,
-            mode=mode, geolocation_threshold=geolocation_threshold, ignore=ignore)
 
-        geolocation_country_cluster, geolocation_continent_cluster, geolocation_country_cluster_sol_validated, geolocation_continent_cluster_sol_validated = get_country_and_continent_clusters_for_all_ips(
-            all_ips, ip_version, mode, sol_threshold, suffix=suffix)
+def generate_category_indices(known, good_ends, oceanic, no_landing_points):
+    """
+    Indices of the links that fall in each of the categories of categories_map
+    A link is oceanic if either the continent or the neighbor mapping says so. Otherwise, it is a deterministic
+    terrestrial link (de_te) when none of the countries of both ends have landing points
+    """
+    category_indices = {}
 
-        submarine_countries = get_countries_with_submarine_landing_points()
+    for oceanic_value, suffix in [(True, 'oc'), (False, 'te')]:
+        for good_ends_value, prefix in [(2, 'bg'), (1, 'og'), (0, 'bb')]:
+            mask = known & (oceanic == oceanic_value) & (good_ends == good_ends_value)
+            if not oceanic_value:
+                mask &= ~no_landing_points
+            category_indices['{}_{}'.format(prefix, suffix)] = np.flatnonzero(mask)
 
-        ip_is_oceanic_cable_continent_based, ip_is_oceanic_cable_continent_based_sol_validated = generate_category_mapping_based_on_continent_data(
-            links, geolocation_continent_cluster, geolocation_continent_cluster_sol_validated, mode)
+    category_indices['de_te'] = np.flatnonzero(known & ~oceanic & no_landing_points)
 
-        ip_is_oceanic_cable_neighbor_based, ip_is_oceanic_cable_neighbor_based_sol_validated = generate_category_mapping_based_on_neighbors_data(
-            links, geolocation_country_cluster, geolocation_country_cluster_sol_validated, mode, suffix=suffix)
+    return category_indices
 
-        if mode in [0, 2]:
 
-            save_file = 'categories_map_v{}'.format(ip_version)
+def generate_categories_helper(link_columns, geolocation_latlon_cluster_and_score_map, geolocation_country_cluster,
+                               geolocation_continent_cluster, neighbor_closure, landing_point_country_bitmap,
+                               geolocation_threshold=0.6, sol_validated=False, ignore=True, continent_pair_table=None):
+    """
+    Generates the categories_map for one mode, with the links evaluated as columns rather than one by one
+    """
+    known, good_ends = get_geolocation_category_columns(link_columns, geolocation_latlon_cluster_and_score_map,
+                                                        geolocation_threshold, sol_validated, ignore)
+    continent_known, continent_oceanic = get_continent_category_columns(link_columns, geolocation_continent_cluster,
+                                                                        continent_pair_table)
+    neighbor_known, neighbor_oceanic = get_neighbor_category_columns(link_columns, geolocation_country_cluster,
+                                                                     neighbor_closure)
+    has_landing_points = get_landing_point_columns(link_columns, geolocation_country_cluster,
+                                                   landing_point_country_bitmap)
 
-            if Path(save_directory / save_file).is_file():
+    category_indices = generate_category_indices(known & continent_known & neighbor_known, good_ends,
+                                                 continent_oceanic | neighbor_oceanic, ~has_landing_points)
 
-                print(f'Directly loading the saved file contents')
-                with open(save_directory / save_file, 'rb') as fp:
-                    categories_map = pickle.load(fp)
+    return {category: link_columns.get_links(category_indices[category]) for category in category_names}
 
-                if mode == 0:
-                    mode = -1
-                else:
-                    mode = 1
 
-        if mode in [1, 2]:
+def generate_categories(all_ips, links, geolocation_latlon_cluster_and_score_map,
+                        geolocation_latlon_cluster_and_score_map_sol_validated, ip_version=4, mode=2,
+                        sol_threshold=0.01, geolocation_threshold=0.6, ignore=True, suffix='default',
+                        workers=1, cluster_cache=None):
+    categories_maps = {0: {category: [] for category in category_names},
+                       1: {category: [] for category in category_names}}
+    save_files = {0: 'categories_map_v{}'.format(ip_version), 1: 'categories_map_sol_validated_v{}'.format(ip_version)}
 
-            save_file = 'categories_map_sol_validated_v{}'.format(ip_version)
+    save_directory = root_dir / f'stats/mapping_outputs_{suffix}'
+    save_directory.mkdir(parents=True, exist_ok=True)
 
-            if Path(save_directory / save_file).is_file():
+    modes_to_generate = []
+    for current_mode in [0, 1]:
+        if mode not in [current_mode, 2]:
+            continue
 
-                print(f'Directly loading the saved file contents')
-                with open(save_directory / save_file, 'rb') as fp:
-                    categories_map_sol_validated = pickle.load(fp)
+        if Path(save_directory / save_files[current_mode]).exists():
+            print(f'Directly loading the contents')
+            with open(save_directory / save_files[current_mode], 'rb') as fp:
+                categories_maps[current_mode] = pickle.load(fp)
+        else:
+            modes_to_generate.append(current_mode)
 
-                if mode == 1:
-                    mode = -1
-                else:
-                    mode = 0
+    if len(modes_to_generate) > 0:
 
-        print(f'Currently in mode {mode}')
+        generation_mode = 2 if len(modes_to_generate) == 2 else modes_to_generate[0]
+        print(f'Currently in mode {generation_mode}')
 
-        for ip_addresses in links:
+        geolocation_country_cluster, geolocation_continent_cluster, geolocation_country_cluster_sol_validated, geolocation_continent_cluster_sol_validated = get_country_and_continent_clusters_for_all_ips(
+            all_ips, ip_version, generation_mode, sol_threshold, suffix=suffix, cluster_cache=cluster_cache)
 
-            if mode in [0, 2]:
+        landing_point_country_bitmap = get_landing_point_country_bitmap()
 
-                latlon_category = ip_geolocation_category.get(ip_addresses, None)
-                continent_category = ip_is_oceanic_cable_continent_based.get(ip_addresses, None)
-                country_category = ip_is_oceanic_cable_neighbor_based.get(ip_addresses, None)
+        # The 2 level neighbors (as in get_iterative_neighbors) of every country are computed once
+        neighbor_closure = CountryNeighborClosure(generate_gdf_dict(suffix, workers=workers), level=2)
 
-                if latlon_category and continent_category and country_category:
-                    # If by continent, we determine it oceanic, let's not process it further
-                    if continent_category == 'oc':
-                        categories_map['{}_oc'.format(latlon_category)].append(ip_addresses)
-                    else:
-                        # Again if it's oceanic, let's mark it straight away
-                        if country_category == 'oc':
-                            categories_map['{}_oc'.format(latlon_category)].append(ip_addresses)
-
-                        else:
-                            # Here we need to check if it could be a terrestrial link
-                            country_1 = geolocation_country_cluster.get(ip_addresses[0])
-                            country_2 = geolocation_country_cluster.get(ip_addresses[1])
-
-                            if country_1 and country_2:
-                                country_1 = country_1[0]
-                                country_2 = country_2[0]
-
-                            # If both countries are not in the submarine countries, then it's a terrestrial link
-                            if check_country_with_landing_points(country_1, submarine_countries) and \
-                                    check_country_with_landing_points(country_2, submarine_countries):
-                                categories_map['de_te'].append(ip_addresses)
-                            else:
-                                # If it's not a terrestrial link, then we can add it to the respective category
-                                categories_map['{}_te'.format(latlon_category)].append(ip_addresses)
-
-            if mode in [1, 2]:
-                latlon_category = ip_geolocation_category_sol_validated.get(ip_addresses, None)
-                continent_category = ip_is_oceanic_cable_continent_based_sol_validated.get(ip_addresses, None)
-                country_category = ip_is_oceanic_cable_neighbor_based_sol_validated.get(ip_addresses, None)
-
-                if latlon_category and continent_category and country_category:
-                    # If by continent, we determine it oceanic, let's not process it further
-                    if continent_category == 'oc':
-                        categories_map_sol_validated['{}_oc'.format(latlon_category)].append(ip_addresses)
-                    else:
-                        # Again if it's oceanic, let's mark it straight away
-                        if country_category == 'oc':
-                            categories_map_sol_validated['{}_oc'.format(latlon_category)].append(ip_addresses)
-
-                        else:
-                            # Here we need to check if it could be a terrestrial link
-                            country_1 = geolocation_country_cluster_sol_validated.get(ip_addresses[0], None)
-                            country_2 = geolocation_country_cluster_sol_validated.get(ip_addresses[1], None)
-
-                            if country_1 and country_2:
-                                country_1 = country_1[0]
-                                country_2 = country_2[0]
-
-                            # If both countries are not in the submarine countries, then it's a deterministic terrestrial link
-                            if check_country_with_landing_points(country_1, submarine_countries) and \
-                                    check_country_with_landing_points(country_2, submarine_countries):
-                                categories_map_sol_validated['de_te'].append(ip_addresses)
-                            else:
-                                categories_map_sol_validated['{}_te'.format(latlon_category)].append(ip_addresses)
-
-        # Let's save the results
-        if mode in [0, 2]:
-            save_file = 'categories_map_v{}'.format(ip_version)
-            save_results_to_file(categories_map, str(save_directory), save_file)
-        if mode in [1, 2]:
-            save_file = 'categories_map_sol_validated_v{}'.format(ip_version)
-            save_results_to_file(categories_map_sol_validated, str(save_directory), save_file)
+        link_columns = LinkColumns(links)
+        continent_pair_table = ContinentPairTable()
+
+        mode_inputs = {
+            0: (geolocation_latlon_cluster_and_score_map, geolocation_country_cluster, geolocation_continent_cluster),
+            1: (geolocation_latlon_cluster_and_score_map_sol_validated, geolocation_country_cluster_sol_validated,
+                geolocation_continent_cluster_sol_validated)}
+
+        for current_mode in modes_to_generate:
+            categories_maps[current_mode] = generate_categories_helper(
+                link_columns, *mode_inputs[current_mode], neighbor_closure, landing_point_country_bitmap,
+                geolocation_threshold=geolocation_threshold, sol_validated=current_mode == 1, ignore=ignore,
+                continent_pair_table=continent_pair_table)
+
+            # Let's save the results
+            save_results_to_file(categories_maps[current_mode], str(save_directory), save_files[current_mode])
+
+    categories_map, categories_map_sol_validated = categories_maps[0], categories_maps[1]
 
     print(f'Only Geolocation: Counts are ->')
     print(f"Both Good - Ocean : {len(categories_map['bg_oc'])}")
@@ -25,6 +25,29 @@ def save_results_to_file(result, directory, save_file_name):
         pickle.dump(result, fp)
 
 
+def write_file_atomically(file, data):
+    """
+    Writes the bytes to a temporary file in the same directory and then renames it to file, so a crash during the
+    write never leaves a truncated file behind (file either keeps its old contents or gets the new ones)
+    """
+    file = Path(file)
+    temporary_file = file.with_name('{}.tmp{}'.format(file.name, os.getpid()))
+    try:
+        with open(temporary_file, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temporary_file, file)
+    except BaseException:
+        temporary_file.unlink(missing_ok=True)
+        raise
+
+
+def save_results_to_file_atomically(result, directory, save_file_name):
+    print('Saving the file: {}/{}'.format(directory, save_file_name))
+    write_file_atomically(Path(directory) / save_file_name, pickle.dumps(result))
+
+
 def merge_sol_testing_results(directory, list_of_files=[], keywords=[]):
     final_result = {}
 
@@ -0,0 +1,126 @@
+import sys
+from pathlib import Path
+
+root_dir = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+import pycountry
+import pycountry_convert as pc
+import reverse_geocode
+
+
+def get_country_to_continent_map():
+    # Some initial list of countries for which match was not found
+    country_to_continent_map = {'732': 'AF', '612': 'OC', '534': 'NA', '626': 'AS', '581': 'NA', '336': 'EU',
+                                '412': 'EU', '158': 'AS', '553': 'SA', '485': 'OC', '654': 'AF', '010': 'AN',
+                                '260': 'AN'}
+
+    for country in pycountry.countries:
+        try:
+            country_to_continent_map[country.numeric] = pc.country_alpha2_to_continent_code(country.alpha_2)
+        except:
+            pass
+
+    return country_to_continent_map
+
+
+def get_country_alpha_to_digit():
+    country_file = root_dir / 'stats' / 'iso3166-countrycodes.txt'
+
+    with open(country_file) as f:
+        file_content = f.readlines()
+
+    country_2alpha_to_digit = {'AX': '248', 'XK': '412', 'PM': '666', 'SH': '654'}
+
+    res = ''
+    for country in file_content[12:]:
+        a = [' '.join(item.strip().split(', ')[::-1]) for item in country.split('\t') if item.strip() != '']
+        if len(a) != 4:
+            a = [' '.join(item.strip().split(', ')[::-1]) for item in a[0].split('  ') if item.strip() != '']
+            if len(a) != 4:
+                res = a[-1]
+        else:
+            a[0] = (res + ' ' + a[0]).strip()
+            country_2alpha_to_digit[a[1]] = a[-1]
+            res = ''
+
+    return country_2alpha_to_digit
+
+
+class ReverseGeocoder:
+    """
+    Shared reverse geocoding layer. Coordinates are de-duplicated and memoized, all the new ones of a request are
+    resolved with a single reverse_geocode (KD-tree) query, and the 3-digit country and continent codes come from
+    lookup arrays over the country codes instead of per-call dictionary lookups.
+    """
+
+    def __init__(self):
+        self.country_to_continent_map = get_country_to_continent_map()
+        self.country_2alpha_to_digit = get_country_alpha_to_digit()
+
+        # Index of each coordinate seen so far into the country codes below
+        self.coordinate_to_country_index = {}
+        self.country_index = {}
+        self.country_codes = []
+        self.country_digits = np.zeros(0, dtype=object)
+        self.continents = np.zeros(0, dtype=object)
+
+    def add_coordinates(self, coordinates):
+        new_coordinates = list(dict.fromkeys(coordinate for coordinate in map(tuple, coordinates) if
+                                             coordinate not in self.coordinate_to_country_index))
+        if len(new_coordinates) == 0:
+            return
+
+        number_of_countries = len(self.country_codes)
+        for coordinate, result in zip(new_coordinates, reverse_geocode.search(new_coordinates)):
+            country_code = result['country_code']
+            if country_code not in self.country_index:
+                self.country_index[country_code] = len(self.country_codes)
+                self.country_codes.append(country_code)
+            self.coordinate_to_country_index[coordinate] = self.country_index[country_code]
+
+        if len(self.country_codes) > number_of_countries:
+            # Codes without a 3-digit (or continent) mapping are kept as None and raise KeyError when used
+            self.country_digits = np.array([self.country_2alpha_to_digit.get(country_code) for country_code in
+                                            self.country_codes], dtype=object)
+            self.continents = np.array([self.country_to_continent_map.get(country_digit) for country_digit in
+                                        self.country_digits], dtype=object)
+
+    def get_country_indices(self, coordinates):
+        self.add_coordinates(coordinates)
+        return np.array([self.coordinate_to_country_index[tuple(coordinate)] for coordinate in coordinates],
+                        dtype=np.int64)
+
+    def get_country_codes(self, coordinates):
+        """
+        Output
+            2-letter country code for each of the given (latitude, longitude)
+        """
+        return [self.country_codes[index] for index in self.get_country_indices(coordinates)]
+
+    def get_country_digits_and_continents(self, coordinates):
+        """
+        Output
+            3-digit country codes and continent codes for each of the given (latitude, longitude)
+        """
+        country_indices = self.get_country_indices(coordinates)
+        country_digits = self.country_digits[country_indices].tolist()
+        continents = self.continents[country_indices].tolist()
+
+        if None in country_digits:
+            raise KeyError(self.country_codes[country_indices[country_digits.index(None)]])
+        if None in continents:
+            raise KeyError(country_digits[continents.index(None)])
+
+        return country_digits, continents
+
+
+_reverse_geocoder = None
+
+
+def get_reverse_geocoder():
+    global _reverse_geocoder
+    if _reverse_geocoder is None:
+        _reverse_geocoder = ReverseGeocoder()
+    return _reverse_geocoder
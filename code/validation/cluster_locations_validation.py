@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+root_dir = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(root_dir))
+
+from code.utils.geolocation_utils import cluster_locations, cluster_locations_batch
+
+
+def validate_cluster_locations_batch(number_of_ips=100000, seed=0):
+    """
+    Checks cluster_locations_batch against the DBSCAN based cluster_locations on randomized locations (between 1 and 11
+    locations per IP, spread around a few centres so that many of the pairs are close to the 100 km eps)
+    """
+    rng = np.random.default_rng(seed)
+    list_of_locations_list = []
+    for _ in range(number_of_ips):
+        number_of_centres = rng.integers(1, 4)
+        centres = np.column_stack((rng.uniform(-89, 89, number_of_centres), rng.uniform(-180, 180, number_of_centres)))
+        size = rng.integers(1, 12)
+        spread = rng.choice([0.5, 1, 2])
+        locations = centres[rng.integers(0, len(centres), size)] + rng.normal(0, spread, (size, 2))
+        locations[:, 0] = np.clip(locations[:, 0], -90, 90)
+        locations[:, 1] = (locations[:, 1] + 180) % 360 - 180
+        list_of_locations_list.append(locations.tolist())
+
+    batch_results = cluster_locations_batch(list_of_locations_list)
+    mismatches = [index for index, locations_list in enumerate(list_of_locations_list) if
+                  cluster_locations(locations_list) != batch_results[index]]
+
+    print(f'Batched clustering differs from DBSCAN for {len(mismatches)} of {number_of_ips} IPs')
+
+    return mismatches
+
+
+if __name__ == '__main__':
+    number_of_ips = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    validate_cluster_locations_batch(number_of_ips)
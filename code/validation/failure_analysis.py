@@ -4,6 +4,7 @@ sys.path.insert(1, os.path.abspath('.'))
 import pickle, json
 from datetime import datetime, timezone, timedelta
 from traceroute.ripe_traceroute_utils import ripe_process_traceroutes
+from submarine.telegeography_submarine import load_submarine_catalog
 
 from collections import namedtuple, Counter
 LandingPoints = namedtuple('LandingPoints', ['latitude', 'longitude', 'country', 'location', 'cable'])
@@ -15,8 +16,7 @@ def construct_landing_point_location_to_id_dict():
 	actual locations, let's get the required reverse mapping
 	"""
 
-	with open('stats/submarine_data/landing_points_dict', 'rb') as fp:
-		landing_points_dict = pickle.load(fp)
+	landing_points_dict = load_submarine_catalog('stats/submarine_data').landing_points_dict
 
 	reverse_landing_points_dict = {v.location : k for k,v in landing_points_dict.items()}
 
@@ -16,6 +16,7 @@ from itertools import permutations, combinations, product
 from ripe.atlas.cousteau import (Traceroute, AtlasSource, AtlasCreateRequest)
 
 from utils.as_utils import get_ip_to_asn_for_all_ips
+from submarine.telegeography_submarine import load_submarine_catalog
 
 from haversine import haversine
 
@@ -25,8 +26,7 @@ Cable = namedtuple('Cable', ['name', 'landing_points', 'length', 'owners', 'note
 
 LandingPoints = namedtuple('LandingPoints', ['latitude', 'longitude', 'country', 'location', 'cable'])
 
-from ipaddress import ip_network, ip_address
-private_ranges = [ip_network("192.168.0.0/16"), ip_network("10.0.0.0/8"), ip_network("172.16.0.0/12")]
+from traceroute.ip_utils import check_if_ip_is_private
 
 prepend_path = './'
 
@@ -37,19 +37,13 @@ import Levenshtein
 
 def load_landing_points_info():
 
-	with open(prepend_path + 'stats/submarine_data/landing_points_dict', 'rb') as fp:
-		landing_points = pickle.load(fp)
-
-	return landing_points
+	return load_submarine_catalog(prepend_path + 'stats/submarine_data').landing_points_dict
 
 
 
 def load_cables_info():
 
-	with open(prepend_path + 'stats/submarine_data/cable_info_dict', 'rb') as fp:
-		cable_info = pickle.load(fp)
-
-	return cable_info
+	return load_submarine_catalog(prepend_path + 'stats/submarine_data').cable_info_dict
 
 
 
@@ -295,19 +289,6 @@ def generate_asns_pairs_across_landing_points (landing_points, suffix='default')
 
 
 
-def check_if_ip_is_private (ip, v4=True):
-
-	"""
-	A simple check if a given IP is in the private IP range or not
-	Returns True if in private IP range, else returns False
-	"""
-
-	if ip_address(ip) in private_ranges[0] or ip_address(ip) in private_ranges[1] or ip_address(ip) in private_ranges[2]:
-		return True
-	else:
-		return False
-
-
 def extract_traceroute_info (measurement_ids_list):
 
 	high_latency_hops = {}